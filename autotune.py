@@ -0,0 +1,137 @@
+import struct
+import threading
+import time
+from collections import namedtuple
+
+# Receiver -> sender link report, sent to the sender's CONTROL_PORT from the
+# receiver's audio socket (the address the sender streams to) every
+# FEEDBACK_INTERVAL seconds per stream.
+#
+#   magic      4s  b'FDBK'
+#   loss       f   fraction of packets lost since the last report
+#   jitter     f   interarrival jitter, seconds
+#   underruns  I   jitter buffer underruns since the last report
+#   frames     H   frames per packet the receiver is getting
+#   port       H   source port of the stream reported on, as the receiver sees it;
+#                  tells apart several streams from one host
+FEEDBACK_MAGIC = b'FDBK'
+FEEDBACK = struct.Struct('<4sffIHH')
+FEEDBACK_INTERVAL = 1.0
+
+Feedback = namedtuple('Feedback', ['loss', 'jitter', 'underruns', 'frames', 'port'], defaults=(0,))
+
+MIN_CHUNK = 128         # Frames per packet the tuner may go down to
+MAX_CHUNK = 2048        # ...and up to
+TUNE_INTERVAL = 2.0     # Seconds between decisions
+REPORT_TIMEOUT = 5.0    # Reports older than this are ignored
+LOSS_HIGH = 0.01        # Loss fraction that makes a link congested
+LOSS_LOW = 0.001        # ...and at most this much for it to count as clean
+JITTER_HIGH = 0.5       # Jitter, in packet durations, that makes a link congested
+JITTER_LOW = 0.25       # ...and at most this for it to count as clean
+CLEAN_ROUNDS = 3        # Consecutive clean decisions before shrinking packets
+MAX_BACKOFF = 6         # A shrink that failed waits up to 2**MAX_BACKOFF times longer to retry
+BUFFER_PACKETS = 64     # Socket buffers hold this many packets of the current size
+MIN_BUFFER_SIZE = 65536
+MAX_BUFFER_SIZE = 4 * 1024 * 1024
+
+
+def pack_feedback(loss, jitter, underruns, frames, port=0):
+    return FEEDBACK.pack(FEEDBACK_MAGIC, loss, jitter, min(underruns, 0xFFFFFFFF), min(frames, 0xFFFF), port)
+
+
+def is_feedback(message):
+    return len(message) == FEEDBACK.size and message[:4] == FEEDBACK_MAGIC
+
+
+def parse_feedback(message):
+    _, loss, jitter, underruns, frames, port = FEEDBACK.unpack(message)
+    return Feedback(loss, jitter, underruns, frames, port)
+
+
+def socket_buffer_size(packet_bytes, packets=BUFFER_PACKETS):
+    """Socket buffer size that holds `packets` packets of this size"""
+    return max(MIN_BUFFER_SIZE, min(MAX_BUFFER_SIZE, packet_bytes * packets))
+
+
+class AutoTuner:
+    """Picks the sender's packet size from what its receivers report.
+
+    The sender follows its worst receiver. A congested link (loss, jitter
+    large against the packet duration, or underruns) doubles the packet
+    size: fewer, larger packets mean less per-packet overhead and fewer
+    chances to lose one. A link that stays clean for CLEAN_ROUNDS
+    decisions halves it again, so a quiet network settles at the smallest
+    packets, and the lowest latency, it carries without trouble. A shrink
+    that is undone right away is retried after exponentially longer
+    waits, so the size does not flap around the limit.
+    """
+
+    def __init__(self, rate, chunk, min_chunk=MIN_CHUNK, max_chunk=MAX_CHUNK, frame_size=None):
+        self.rate = rate
+        self.frame_size = frame_size or (lambda frames: frames)
+        self.min_chunk = self.frame_size(min_chunk)
+        self.max_chunk = self.frame_size(max_chunk)
+        self.chunk = min(max(chunk, self.min_chunk), self.max_chunk)
+        self.changes = 0
+        self._lock = threading.Lock()  # report() runs on the control thread, worst() on the sender's
+        self._reports = {}  # addr -> (Feedback, time received)
+        self._clean = 0
+        self._last = time.monotonic()
+        self._shrunk = False  # Last change made packets smaller
+        self._backoff = 0
+        self._hold_until = 0.0
+
+    def report(self, addr, feedback, now=None):
+        """Take one receiver's report"""
+        with self._lock:
+            self._reports[addr] = (feedback, time.monotonic() if now is None else now)
+
+    def worst(self, now):
+        """Combined link state over the receivers that reported recently, or None"""
+        with self._lock:
+            for addr in [a for a, (_, seen) in self._reports.items() if now - seen > REPORT_TIMEOUT]:
+                del self._reports[addr]
+            reports = list(self._reports.values())
+        # Reports about the previous packet size describe a link state already acted on
+        fresh = [fb for fb, seen in reports if fb.frames == self.chunk]
+        if not fresh:
+            return None
+        return Feedback(max(fb.loss for fb in fresh), max(fb.jitter for fb in fresh),
+                        max(fb.underruns for fb in fresh), self.chunk)
+
+    def update(self, now=None):
+        """Decide once every TUNE_INTERVAL; returns the new chunk if it changed, else None"""
+        now = time.monotonic() if now is None else now
+        if now - self._last < TUNE_INTERVAL:
+            return None
+        self._last = now
+        link = self.worst(now)
+        if link is None:
+            return None  # Nobody reporting: leave things as they are
+
+        packet_time = self.chunk / self.rate
+        if link.loss > LOSS_HIGH or link.underruns or link.jitter > JITTER_HIGH * packet_time:
+            self._clean = 0
+            if self._shrunk:  # The smaller size did not hold up
+                self._backoff = min(self._backoff + 1, MAX_BACKOFF)
+                self._hold_until = now + TUNE_INTERVAL * CLEAN_ROUNDS * 2 ** self._backoff
+            return self._set(self.frame_size(min(self.chunk * 2, self.max_chunk)), False)
+        if link.loss <= LOSS_LOW and link.jitter <= JITTER_LOW * packet_time:
+            self._clean += 1
+            if self._clean >= CLEAN_ROUNDS:
+                self._clean = 0
+                if self._shrunk:
+                    self._backoff = 0  # The last shrink has held up
+                if now >= self._hold_until:
+                    return self._set(self.frame_size(max(self.chunk // 2, self.min_chunk)), True)
+        else:
+            self._clean = 0
+        return None
+
+    def _set(self, chunk, shrink):
+        if chunk == self.chunk:
+            return None
+        self.chunk = chunk
+        self._shrunk = shrink
+        self.changes += 1
+        return chunk
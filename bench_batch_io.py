@@ -0,0 +1,105 @@
+import socket
+import time
+import numpy as np
+from codec import create_codec
+from packetizer import Packetizer
+from udp_io import PacketSlab, BatchSender, BatchReceiver
+
+# Benchmark configuration
+RATE = 48000
+CHANNELS = 2
+CHUNK = 128      # Small packets: the per-syscall cost dominates
+PACKETS = 40000
+BURST = 32       # Packets per flush / drain, matching udp_io.BATCH_SIZE
+RECEIVERS = (1, 4)
+
+
+def sockets(count):
+    receivers = []
+    for _ in range(count):
+        rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        rx.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+        rx.bind(('127.0.0.1', 0))
+        receivers.append(rx)
+    tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    return tx, receivers
+
+
+def drain_plain(rx, slab, count):
+    for _ in range(count):
+        slab.recvfrom(rx)
+    return count
+
+
+def drain_batch(receiver, count):
+    got = 0
+    while got < count:
+        batch = receiver.recv(1.0)
+        if not batch:
+            break
+        got += len(batch)
+    return got
+
+
+def run(batched, fanout, packetizer, block):
+    """Send and receive PACKETS packets to each of `fanout` receivers.
+
+    Returns (send pps, receive pps, send syscalls, receive syscalls); packet
+    rates count datagrams, so a fan-out of 4 sends 4 per packet.
+    """
+    tx, receivers = sockets(fanout)
+    addrs = [rx.getsockname() for rx in receivers]
+    slabs = [PacketSlab() for _ in receivers]
+    sender = BatchSender(tx) if batched else None
+    readers = [BatchReceiver(rx, slab) for rx, slab in zip(receivers, slabs)] if batched else None
+    send_time = recv_time = 0.0
+    send_calls = recv_calls = 0
+    for start in range(0, PACKETS, BURST):
+        t0 = time.perf_counter()
+        for _ in range(BURST):
+            for buffers in packetizer.packetize(block, time.perf_counter()):
+                if sender:
+                    sender.queue(buffers, addrs)
+                else:
+                    for addr in addrs:
+                        tx.sendmsg(buffers, (), 0, addr)
+                        send_calls += 1
+        if sender:
+            sender.flush()
+        send_time += time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        for k, rx in enumerate(receivers):
+            if readers:
+                drain_batch(readers[k], BURST)
+            else:
+                recv_calls += drain_plain(rx, slabs[k], BURST)
+        recv_time += time.perf_counter() - t0
+    if sender:
+        send_calls = sender.syscalls
+        recv_calls = sum(r.syscalls for r in readers)
+    tx.close()
+    for rx in receivers:
+        rx.close()
+    datagrams = PACKETS * fanout
+    return datagrams / send_time, datagrams / recv_time, send_calls, recv_calls
+
+
+def main():
+    block = (np.random.default_rng(0).uniform(-0.5, 0.5, (CHUNK, CHANNELS))).astype(np.float32)
+    packetizer = Packetizer(RATE, CHANNELS, create_codec('pcm', RATE, CHANNELS))
+    tx, _ = sockets(0)
+    modes = BatchSender(tx).mode, BatchReceiver(tx, PacketSlab()).mode
+    tx.close()
+    print(f"Batched I/O benchmark: {CHUNK} frames x {CHANNELS} channels, {PACKETS} packets over loopback")
+    print(f"Batch modes: send {modes[0]}, receive {modes[1]}\n")
+    print(f"{'Path':<8} {'Rx':>3} {'Send pps':>10} {'Recv pps':>10} {'Send calls':>11} {'Recv calls':>11}")
+    print("-" * 58)
+    for fanout in RECEIVERS:
+        for name, batched in (('plain', False), ('batched', True)):
+            send_pps, recv_pps, send_calls, recv_calls = run(batched, fanout, packetizer, block)
+            print(f"{name:<8} {fanout:>3} {send_pps:>10.0f} {recv_pps:>10.0f} {send_calls:>11} {recv_calls:>11}")
+
+
+if __name__ == "__main__":
+    main()
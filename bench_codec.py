@@ -0,0 +1,68 @@
+import time
+import numpy as np
+from codec import create_codec, available_codecs
+
+# Benchmark configuration
+RATE = 48000
+CHANNELS = 2
+CHUNK = 512
+SECONDS = 10  # Seconds of audio pushed through each codec
+
+
+def test_signal(seconds, rate=RATE, channels=CHANNELS):
+    """Music-like int16 test signal: a few partials, slow tremolo and some noise"""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * rate)) / rate
+    tone = sum(np.sin(2 * np.pi * f * t) / (i + 1) for i, f in enumerate((220, 330, 440, 660, 880)))
+    tone *= 0.5 + 0.5 * np.sin(2 * np.pi * 0.5 * t)
+    signal = np.stack([np.roll(tone, 37 * c) for c in range(channels)], axis=1)
+    signal = 0.3 * signal / np.abs(signal).max() + rng.normal(0, 0.002, signal.shape)
+    return (signal * 32767).astype(np.int16)
+
+
+def bench_codec(name, signal):
+    """Encode and decode the signal packet by packet; returns a result dict"""
+    encoder = create_codec(name, RATE, CHANNELS)
+    decoder = create_codec(name, RATE, CHANNELS)
+    frames = encoder.frame_size(CHUNK)
+    packets = [signal[i:i + frames] for i in range(0, len(signal) - frames + 1, frames)]
+
+    start = time.process_time()
+    payloads = [encoder.encode(p) for p in packets]
+    encode_time = time.process_time() - start
+
+    start = time.process_time()
+    for payload in payloads:
+        decoder.decode(payload, frames)
+    decode_time = time.process_time() - start
+
+    audio_seconds = len(packets) * frames / RATE
+    total_bytes = sum(len(p) for p in payloads)
+    return {
+        'codec': name,
+        'frames': frames,
+        'bytes_per_packet': total_bytes / len(packets),
+        'kbps': total_bytes * 8 / audio_seconds / 1000,
+        'encode_us': encode_time / len(packets) * 1e6,
+        'decode_us': decode_time / len(packets) * 1e6,
+        'cpu_percent': (encode_time + decode_time) / audio_seconds * 100,
+    }
+
+
+def main():
+    signal = test_signal(SECONDS)
+    print(f"Codec benchmark: {RATE}Hz, {CHANNELS} channels, {CHUNK}-frame chunks, {SECONDS}s of audio\n")
+    print(f"{'Codec':<10} {'Frames':>6} {'Bytes/pkt':>10} {'kbit/s':>9} {'Ratio':>6} "
+          f"{'Enc us':>8} {'Dec us':>8} {'CPU %':>6}")
+    print("-" * 70)
+    pcm_kbps = None
+    for name in available_codecs():
+        r = bench_codec(name, signal)
+        pcm_kbps = pcm_kbps or r['kbps']
+        print(f"{r['codec']:<10} {r['frames']:>6} {r['bytes_per_packet']:>10.0f} {r['kbps']:>9.0f} "
+              f"{pcm_kbps / r['kbps']:>5.1f}x {r['encode_us']:>8.1f} {r['decode_us']:>8.1f} "
+              f"{r['cpu_percent']:>6.2f}")
+
+
+if __name__ == "__main__":
+    main()
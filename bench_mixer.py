@@ -0,0 +1,64 @@
+import time
+import numpy as np
+from mixer import Mixer
+from protocol import StreamFormat, SAMPLE_INT16
+
+# Benchmark configuration
+RATE = 48000
+CHANNELS = 2
+CHUNK = 512
+BLOCKS = 2000
+STREAM_COUNTS = (1, 2, 4, 8, 16, 32)
+
+
+def naive_mix(payloads, gains):
+    """Reference: per-stream convert and accumulate, with no buffering or limiter"""
+    mix = np.zeros(CHUNK * CHANNELS, dtype=np.float32)
+    for payload, gain in zip(payloads, gains):
+        mix += np.frombuffer(payload, dtype=np.int16).astype(np.float32) * gain
+    return np.clip(mix, -32768, 32767).astype(np.int16).tobytes()
+
+
+def bench_mixer(streams, payloads):
+    """Microseconds per mixed block, inputs refilled outside the timed region"""
+    mixer = Mixer(None, RATE, CHANNELS, CHUNK, max_inputs=streams)
+    fmt = StreamFormat(RATE, CHANNELS, SAMPLE_INT16, 0, CHUNK)
+    inputs = [mixer.add_input(i, gain=0.5) for i in range(streams)]
+    for mixer_input in inputs:
+        mixer_input.open(fmt)
+    elapsed = 0.0
+    for block in range(BLOCKS):
+        for mixer_input, payload in zip(inputs, payloads):
+            mixer_input.write(payload)
+        t0 = time.perf_counter()
+        mixer.mix_block()
+        elapsed += time.perf_counter() - t0
+    return elapsed / BLOCKS * 1e6, mixer.limiting
+
+
+def bench_naive(streams, payloads):
+    gains = [0.5] * streams
+    t0 = time.perf_counter()
+    for _ in range(BLOCKS):
+        naive_mix(payloads, gains)
+    return (time.perf_counter() - t0) / BLOCKS * 1e6
+
+
+def main():
+    rng = np.random.default_rng(0)
+    period_us = CHUNK / RATE * 1e6
+    print(f"Mixer benchmark: {CHUNK} frames x {CHANNELS} channels at {RATE}Hz, "
+          f"{BLOCKS} blocks (one block is {period_us:.0f}us of audio)\n")
+    print(f"{'Streams':>7} {'Mixer us':>9} {'% period':>9} {'Loop us':>9} {'Limited':>8}")
+    print("-" * 46)
+    for streams in STREAM_COUNTS:
+        payloads = [rng.integers(-12000, 12000, CHUNK * CHANNELS, dtype=np.int16).tobytes()
+                    for _ in range(streams)]
+        mixer_us, limited = bench_mixer(streams, payloads)
+        naive_us = bench_naive(streams, payloads)
+        print(f"{streams:>7} {mixer_us:>9.1f} {mixer_us / period_us * 100:>8.2f}% "
+              f"{naive_us:>9.1f} {limited:>8}")
+
+
+if __name__ == "__main__":
+    main()
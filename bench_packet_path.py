@@ -0,0 +1,140 @@
+import socket
+import struct
+import time
+import tracemalloc
+import numpy as np
+from codec import create_codec
+from packetizer import Packetizer
+from protocol import parse_packet, pack_header, StreamFormat, SAMPLE_INT16
+from udp_io import PacketSlab
+
+# Benchmark configuration
+RATE = 48000
+CHANNELS = 2
+CHUNK = 512
+PACKETS = 20000
+BURST = 32  # Packets sent before draining, so the socket buffer never overflows
+FORMAT = StreamFormat(RATE, CHANNELS, SAMPLE_INT16, 0, CHUNK)
+
+
+def old_send(sock, addr, block, seq):
+    """The original callback path: new arrays, header bytes and concatenation"""
+    audio_int16 = (block * 32767).astype(np.int16)
+    packet = struct.pack('Qd', seq, time.perf_counter()) + audio_int16.tobytes()
+    sock.sendto(packet, addr)
+
+
+def copy_send(sock, addr, block, seq):
+    """The original allocation pattern with today's header"""
+    audio_int16 = (block * 32767).astype(np.int16)
+    packet = pack_header(seq, time.perf_counter(), FORMAT) + audio_int16.tobytes()
+    sock.sendto(packet, addr)
+
+
+def make_new_send(packetizer):
+    def new_send(sock, addr, block, seq):
+        """Reused conversion buffers, pack_into header, scatter/gather send"""
+        for buffers in packetizer.packetize(block, time.perf_counter()):
+            sock.sendmsg(buffers, (), 0, addr)
+    return new_send
+
+
+def old_recv(sock, slab):
+    """The original loop: fresh bytes per datagram, header unpack, payload slice copy"""
+    packet, _ = sock.recvfrom(4096)
+    seq_num, sent_timestamp = struct.unpack('Qd', packet[:16])
+    return packet[16:]
+
+
+def copy_recv(sock, slab):
+    """Today's header parsed from a freshly allocated datagram"""
+    packet, _ = sock.recvfrom(16384)
+    return parse_packet(packet).payload
+
+
+def new_recv(sock, slab):
+    """Today's header parsed in place from a pooled slab slot"""
+    packet, _ = slab.recvfrom(sock)
+    return parse_packet(packet).payload
+
+
+def socket_pair():
+    rx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    rx.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    rx.bind(('127.0.0.1', 0))
+    tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    return tx, rx, rx.getsockname()
+
+
+def run(send, recv, block, packet):
+    """Time PACKETS sends and receives over loopback; returns (send pps, recv pps).
+
+    Receives are fed by a plain sendto() of the same prebuilt packet for
+    every path, so the receive figure does not depend on how it was sent.
+    """
+    tx, rx, addr = socket_pair()
+    slab = PacketSlab()
+    send_time = recv_time = 0.0
+    for start in range(0, PACKETS, BURST):
+        t0 = time.perf_counter()
+        for seq in range(start, start + BURST):
+            send(tx, addr, block, seq)
+        send_time += time.perf_counter() - t0
+        for _ in range(BURST):
+            rx.recv(16384)
+
+        for _ in range(BURST):
+            tx.sendto(packet, addr)
+        t0 = time.perf_counter()
+        for _ in range(BURST):
+            recv(rx, slab)
+        recv_time += time.perf_counter() - t0
+    tx.close()
+    rx.close()
+    return PACKETS / send_time, PACKETS / recv_time
+
+
+def allocated_bytes(send, recv, block, packets=200):
+    """Peak bytes allocated while handling one packet, averaged over a run"""
+    tx, rx, addr = socket_pair()
+    slab = PacketSlab()
+    send(tx, addr, block, 0)  # Warm up caches and lazily built buffers
+    recv(rx, slab)
+    tracemalloc.start()
+    send_peak = recv_peak = 0
+    for seq in range(packets):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        send(tx, addr, block, seq)
+        send_peak += tracemalloc.get_traced_memory()[1] - base
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        recv(rx, slab)
+        recv_peak += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    tx.close()
+    rx.close()
+    return send_peak / packets, recv_peak / packets
+
+
+def main():
+    block = (np.random.default_rng(0).uniform(-0.5, 0.5, (CHUNK, CHANNELS))).astype(np.float32)
+    packetizer = Packetizer(RATE, CHANNELS, create_codec('pcm', RATE, CHANNELS))
+    paths = [
+        ('original', old_send, old_recv),
+        ('copying', copy_send, copy_recv),
+        ('zerocopy', make_new_send(packetizer), new_recv),
+    ]
+    print(f"Packet path benchmark: {CHUNK} frames x {CHANNELS} channels, {PACKETS} packets over loopback\n")
+    print(f"{'Path':<9} {'Send pps':>10} {'Recv pps':>10} {'Send B/pkt':>11} {'Recv B/pkt':>11}")
+    print("-" * 55)
+    for name, send, recv in paths:
+        # The original receive loop only understands its own 16-byte header
+        header = struct.pack('Qd', 0, 0.0) if send is old_send else pack_header(0, 0.0, FORMAT)
+        send_pps, recv_pps = run(send, recv, block, header + bytes(CHUNK * CHANNELS * 2))
+        send_alloc, recv_alloc = allocated_bytes(send, recv, block)
+        print(f"{name:<9} {send_pps:>10.0f} {recv_pps:>10.0f} {send_alloc:>11.0f} {recv_alloc:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import argparse
+import contextlib
+import io
+import json
+import platform
+import sys
+import time
+import numpy as np
+from codec import create_codec
+from packetizer import Packetizer
+from protocol import parse_packet
+from receiver_engine import StreamPipeline, NullSink
+from telemetry import Registry
+
+# Benchmark configuration
+RATE = 48000
+CHUNKS = (128, 256, 512, 1024, 2048)
+CHANNEL_COUNTS = (1, 2)
+STREAM_COUNTS = (1, 8, 32)
+PIPELINE_CHUNK = 512   # Packet size for the multi-stream runs
+PACKETS = 2000         # Packets per stream per measurement
+QUICK_PACKETS = 300
+BATCH = 16             # Packets pushed per stream before the receive stage is drained
+REPEATS = 3            # Best of this many runs is reported
+TOLERANCE = 0.10       # --compare fails when a stage gets this much slower
+
+
+def make_block(chunk, channels):
+    return np.random.default_rng(0).uniform(-0.5, 0.5, (chunk, channels)).astype(np.float32)
+
+
+def make_packets(chunk, channels, count):
+    """Wire-format packets as a sender would emit them, timestamped one packet apart"""
+    packetizer = Packetizer(RATE, channels, create_codec('pcm', RATE, channels))
+    block = make_block(chunk, channels)
+    interval = chunk / RATE
+    packets = []
+    for seq in range(count):
+        for buffers in packetizer.packetize(block, seq * interval):
+            packets.append(b''.join(bytes(b) for b in buffers))
+    return packets
+
+
+def make_pipeline(key, registry):
+    return StreamPipeline(key, NullSink(), registry=registry)
+
+
+def best(measure):
+    """Smallest of REPEATS runs of measure(), which returns seconds per packet"""
+    return min(measure() for _ in range(REPEATS))
+
+
+def bench_send(chunk, channels, packets):
+    """Capture block to header + payload buffers: the sender thread's per-packet work"""
+    packetizer = Packetizer(RATE, channels, create_codec('pcm', RATE, channels))
+    block = make_block(chunk, channels)
+
+    def measure():
+        start = time.perf_counter()
+        for seq in range(packets):
+            packetizer.packetize(block, seq)
+        return (time.perf_counter() - start) / packets
+    return best(measure)
+
+
+def bench_receive(chunk, channels, packets, streams=1):
+    """Parse, sequence tracking, jitter estimation and enqueue: the event loop's per-packet work"""
+    wire = make_packets(chunk, channels, packets)
+    interval = chunk / RATE
+
+    def measure():
+        registry = Registry()
+        pipelines = [make_pipeline(('127.0.0.1', 10000 + i), registry) for i in range(streams)]
+        elapsed = 0.0
+        for first in range(0, packets, BATCH):
+            start = time.perf_counter()
+            for seq in range(first, min(first + BATCH, packets)):
+                data = wire[seq]
+                for pipeline in pipelines:
+                    pipeline.handle(parse_packet(data), seq * interval + 0.001)
+            elapsed += time.perf_counter() - start
+            for pipeline in pipelines:  # Drained untimed, as playout would
+                while pipeline.jitter_buffer.pop(timeout=0) is not None:
+                    pass
+        return elapsed / (packets * streams)
+    return best(measure)
+
+
+def bench_playout(chunk, channels, packets):
+    """Dequeue, decode, conceal bookkeeping and drift resampling: the playout thread's work"""
+    wire = make_packets(chunk, channels, packets)
+    interval = chunk / RATE
+
+    def measure():
+        pipeline = make_pipeline(('127.0.0.1', 10000), Registry())
+        pipeline.jitter_buffer.max_depth = packets + 1  # Hold the whole run
+        for seq, data in enumerate(wire):
+            pipeline.handle(parse_packet(data), seq * interval + 0.001)
+        jb = pipeline.jitter_buffer
+        count = packets - jb.target_depth  # Stop before popping would underrun
+        start = time.perf_counter()
+        for _ in range(count):
+            frame = jb.pop(timeout=0)
+            data = pipeline.concealer.good(pipeline.decoder.decode(frame[2].payload, chunk))
+            pipeline.resampler.process(data, pipeline.drift.ratio(len(jb), jb.target_depth))
+        return (time.perf_counter() - start) / count
+    return best(measure)
+
+
+def bench_pipeline(chunk, channels, packets, streams):
+    """Every stage for `streams` interleaved streams on one thread"""
+    wire = make_packets(chunk, channels, packets)
+    block = make_block(chunk, channels)
+    interval = chunk / RATE
+
+    def measure():
+        registry = Registry()
+        packetizers = [Packetizer(RATE, channels, create_codec('pcm', RATE, channels))
+                       for _ in range(streams)]
+        pipelines = [make_pipeline(('127.0.0.1', 10000 + i), registry) for i in range(streams)]
+        start = time.perf_counter()
+        for seq in range(packets):
+            for packetizer, pipeline in zip(packetizers, pipelines):
+                packetizer.packetize(block, seq * interval)
+                pipeline.handle(parse_packet(wire[seq]), seq * interval + 0.001)
+                jb = pipeline.jitter_buffer
+                frame = jb.pop(timeout=0)
+                if frame is not None and frame[2] is not None:
+                    data = pipeline.concealer.good(pipeline.decoder.decode(frame[2].payload, chunk))
+                    pipeline.resampler.process(data, pipeline.drift.ratio(len(jb), jb.target_depth))
+        return (time.perf_counter() - start) / (packets * streams)
+    return best(measure)
+
+
+def result(stage, chunk, channels, streams, seconds_per_packet):
+    """One row; streams_per_core is how many real-time streams this stage alone could keep up with"""
+    interval = chunk / RATE
+    return {
+        'stage': stage,
+        'chunk': chunk,
+        'channels': channels,
+        'streams': streams,
+        'us_per_packet': seconds_per_packet * 1e6,
+        'packets_per_second': 1 / seconds_per_packet,
+        'cpu_percent_per_stream': seconds_per_packet / interval * 100,
+        'streams_per_core': interval / seconds_per_packet,
+    }
+
+
+def run(packets):
+    results = []
+    for chunk in CHUNKS:
+        for channels in CHANNEL_COUNTS:
+            for stage, bench in (('send', bench_send), ('receive', bench_receive),
+                                 ('playout', bench_playout)):
+                results.append(result(stage, chunk, channels, 1, bench(chunk, channels, packets)))
+    for streams in STREAM_COUNTS:
+        results.append(result('pipeline', PIPELINE_CHUNK, 2, streams,
+                              bench_pipeline(PIPELINE_CHUNK, 2, packets, streams)))
+    return results
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'rate': RATE,
+        'repeats': REPEATS,
+    }
+
+
+def result_key(row):
+    return row['stage'], row['chunk'], row['channels'], row['streams']
+
+
+def compare(old, new, tolerance=TOLERANCE):
+    """Print per-row change against an earlier run; returns the rows that regressed"""
+    previous = {result_key(row): row for row in old['results']}
+    regressions = []
+    print(f"{'Stage':<9} {'Chunk':>6} {'Ch':>3} {'Streams':>8} {'Old us':>9} {'New us':>9} {'Change':>8}")
+    print("-" * 58)
+    for row in new['results']:
+        before = previous.get(result_key(row))
+        if before is None:
+            continue
+        change = row['us_per_packet'] / before['us_per_packet'] - 1
+        flag = '  <-- slower' if change > tolerance else ''
+        print(f"{row['stage']:<9} {row['chunk']:>6} {row['channels']:>3} {row['streams']:>8} "
+              f"{before['us_per_packet']:>9.2f} {row['us_per_packet']:>9.2f} {change:>+7.1%}{flag}")
+        if change > tolerance:
+            regressions.append(row)
+    return regressions
+
+
+def print_table(results):
+    print(f"{'Stage':<9} {'Chunk':>6} {'Ch':>3} {'Streams':>8} {'us/pkt':>9} {'pkt/s':>10} "
+          f"{'CPU/stream':>11} {'Streams/core':>13}")
+    print("-" * 74)
+    for row in results:
+        print(f"{row['stage']:<9} {row['chunk']:>6} {row['channels']:>3} {row['streams']:>8} "
+              f"{row['us_per_packet']:>9.2f} {row['packets_per_second']:>10.0f} "
+              f"{row['cpu_percent_per_stream']:>10.2f}% {row['streams_per_core']:>13.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-stage packet pipeline benchmark")
+    parser.add_argument('--json', metavar='FILE', help="write results as JSON ('-' for stdout)")
+    parser.add_argument('--compare', metavar='FILE', help="compare against an earlier --json file")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, metavar='FRACTION',
+                        help="slowdown that counts as a regression with --compare")
+    parser.add_argument('--quick', action='store_true', help="fewer packets per measurement")
+    args = parser.parse_args(argv)
+
+    packets = QUICK_PACKETS if args.quick else PACKETS
+    with contextlib.redirect_stdout(io.StringIO()):  # Pipelines announce each new stream
+        results = run(packets)
+    report = {'environment': environment(), 'packets': packets, 'results': results}
+
+    if args.json == '-':
+        print(json.dumps(report, indent=1))
+    else:
+        print(f"Packet pipeline benchmark: {RATE}Hz, best of {REPEATS}, {packets} packets per run\n")
+        print_table(report['results'])
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(report, f, indent=1)
+                f.write('\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        print()
+        regressions = compare(old, report, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} result(s) more than {args.tolerance:.0%} slower")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+import argparse
+import difflib
+import json
+
+
+def load_config(path):
+    """Options from a JSON file; keys are the long option names ('chunk', 'fec-overhead', ...)"""
+    with open(path) as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError(f"{path}: expected a JSON object of options")
+    return {key.replace('-', '_'): value for key, value in config.items()}
+
+
+def _convert(action, value):
+    """One config value in the type its option takes; TypeError/ValueError if it can't be"""
+    if action.type is not None:
+        if isinstance(value, str):
+            return action.type(value)
+        if action.type in (int, float) and isinstance(value, (int, float)) and not isinstance(value, bool):
+            if action.type is int and value != int(value):
+                raise ValueError(f"expected an integer, got {value}")
+            return action.type(value)
+        raise TypeError(f"expected {action.type.__name__}, got {json.dumps(value)}")
+    if not isinstance(value, str):
+        raise TypeError(f"expected a string, got {json.dumps(value)}")
+    return value
+
+
+def config_value(action, value):
+    """A config value shaped like what the command line would have given for this option"""
+    if value is None:
+        return None
+    if action.nargs == 0 or isinstance(action, argparse.BooleanOptionalAction):
+        if not isinstance(value, bool):
+            raise TypeError(f"expected true or false, got {json.dumps(value)}")
+        return value
+    if isinstance(action, argparse._AppendAction):
+        if isinstance(value, dict):  # {"IP": GAIN} for IP=GAIN options
+            value = [f"{key}={item}" for key, item in value.items()]
+        elif not isinstance(value, list):
+            value = [value]  # A single value, not characters of a string
+        value = [_convert(action, item) for item in value]
+        for item in value:
+            if action.choices is not None and item not in action.choices:
+                raise ValueError(f"{item!r} is not one of {', '.join(map(str, action.choices))}")
+        return value
+    value = _convert(action, value)
+    if action.choices is not None and value not in action.choices:
+        raise ValueError(f"{value!r} is not one of {', '.join(map(str, action.choices))}")
+    return value
+
+
+def parse_args(parser, argv=None):
+    """Parse argv with defaults taken from --config, so the command line wins over the file"""
+    pre = argparse.ArgumentParser(add_help=False)
+    pre.add_argument('--config')
+    known, _ = pre.parse_known_args(argv)
+    if known.config:
+        try:
+            config = load_config(known.config)
+        except (OSError, ValueError) as e:
+            parser.error(f"cannot read config: {e}")
+        # A key is an option's long name ('port') or its destination ('target_port')
+        actions = {action.dest: action for action in parser._actions}
+        for action in parser._actions:
+            for option in action.option_strings:
+                if option.startswith('--'):
+                    actions[option[2:].replace('-', '_')] = action
+        defaults = {}
+        for key, value in config.items():
+            action = actions.get(key)
+            if action is None or action.dest in ('help', 'config'):
+                close = difflib.get_close_matches(key, actions, 1)
+                hint = f" (did you mean '{close[0].replace('_', '-')}'?)" if close else ''
+                parser.error(f"unknown option '{key.replace('_', '-')}' in {known.config}{hint}")
+            try:
+                defaults[action.dest] = config_value(action, value)
+            except (TypeError, ValueError, argparse.ArgumentTypeError) as e:
+                parser.error(f"bad value for '{key.replace('_', '-')}' in {known.config}: {e}")
+        parser.set_defaults(**defaults)
+    return parser.parse_args(argv)
+
+
+def host_port(text):
+    """'host' or 'host:port' to (host, port), port None if not given; usable as an argparse type"""
+    host, _, port = text.rpartition(':') if ':' in text else (text, '', '')
+    try:
+        port = int(port) if port else None
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"bad address: {text}")
+    if not host or (port is not None and not 0 < port < 65536):
+        raise argparse.ArgumentTypeError(f"bad address: {text}")
+    return host, port
+
+
+def add_common_options(parser):
+    """Options both the sender and the receiver take"""
+    parser.add_argument('--config', metavar='FILE',
+                        help="JSON file of option defaults (command line overrides it)")
+    parser.add_argument('--device', metavar='NAME|INDEX',
+                        help="audio device by index or (part of its) name")
+    parser.add_argument('--list-devices', action='store_true', help="list audio devices and exit")
+    parser.add_argument('--chunk', type=int, metavar='FRAMES', help="frames per packet")
+    parser.add_argument('--buffer-size', type=int, metavar='BYTES', help="socket buffer size")
+    parser.add_argument('--multicast-group', metavar='IP')
+    parser.add_argument('--batch-io', action=argparse.BooleanOptionalAction,
+                        help="batched UDP syscalls (Linux)")
+    parser.add_argument('--stats-interval', type=float, metavar='SECONDS',
+                        help="console summary period, 0 = off")
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help="serve /metrics (Prometheus) and JSON on this port")
+    parser.add_argument('--metrics-host', metavar='IP')
@@ -0,0 +1,82 @@
+import struct
+import time
+from collections import deque
+
+# NTP-style exchange on the control channel. The receiver sends PING with
+# its send time t1; the sender answers PONG echoing t1 with its receive
+# time t2 and reply time t3; the receiver notes arrival t4. All times are
+# each host's own perf_counter(), the clock packet timestamps use.
+PING_MAGIC = b'PING'
+PONG_MAGIC = b'PONG'
+PING = struct.Struct('<4sQd')    # magic, id, t1
+PONG = struct.Struct('<4sQddd')  # magic, id, t1, t2, t3
+WINDOW = 16          # Exchanges kept; the lowest-RTT one sets the offset
+PING_INTERVAL = 1.0  # Seconds between pings once synced
+FAST_PINGS = 4       # Pings sent at startup before slowing to PING_INTERVAL
+
+
+def is_ping(message):
+    return len(message) == PING.size and message[:4] == PING_MAGIC
+
+
+def is_pong(message):
+    return len(message) == PONG.size and message[:4] == PONG_MAGIC
+
+
+def pong_reply(ping, t2):
+    """Sender side: answer a PING received at t2 (call right before sending)"""
+    _, ping_id, t1 = PING.unpack(ping)
+    return PONG.pack(PONG_MAGIC, ping_id, t1, t2, time.perf_counter())
+
+
+class ClockSync:
+    """Estimates a remote host's clock offset and the round-trip time.
+
+    offset is remote minus local: a remote timestamp T happened at local
+    time T - offset. Each exchange bounds the offset to within RTT/2, and
+    queueing only ever adds delay, so the exchange with the smallest RTT
+    in the window is the most trustworthy one (NTP's clock filter).
+    """
+
+    def __init__(self, window=WINDOW):
+        self.samples = deque(maxlen=window)  # (rtt, offset)
+        self.offset = 0.0
+        self.rtt = None
+        self.synced = False
+        self.exchanges = 0
+        self._next_id = 0
+        self._outstanding = {}
+
+    def make_ping(self):
+        """PING message to send to the remote control port"""
+        ping_id = self._next_id
+        self._next_id += 1
+        t1 = time.perf_counter()
+        self._outstanding[ping_id] = t1
+        if len(self._outstanding) > 64:  # Lost pings never get answered
+            del self._outstanding[next(iter(self._outstanding))]
+        return PING.pack(PING_MAGIC, ping_id, t1)
+
+    def on_pong(self, message, t4=None):
+        """Take a PONG; returns True if it updated the estimate"""
+        t4 = time.perf_counter() if t4 is None else t4
+        _, ping_id, t1, t2, t3 = PONG.unpack(message)
+        if self._outstanding.pop(ping_id, None) != t1:
+            return False  # Not ours, duplicated, or too old
+        rtt = (t4 - t1) - (t3 - t2)
+        if rtt < 0:
+            return False
+        self.samples.append((rtt, ((t2 - t1) + (t3 - t4)) / 2))
+        self.rtt, self.offset = min(self.samples)
+        self.synced = True
+        self.exchanges += 1
+        return True
+
+    def ping_due(self, last_ping, now):
+        """Whether to ping again, a few times quickly until the first estimates are in"""
+        interval = PING_INTERVAL if self.exchanges >= FAST_PINGS else PING_INTERVAL / FAST_PINGS
+        return now - last_ping >= interval
+
+    def to_local(self, remote_time):
+        """A remote perf_counter() time on the local clock"""
+        return remote_time - self.offset
@@ -0,0 +1,130 @@
+import zlib
+import numpy as np
+
+try:
+    import opuslib
+except Exception:  # ImportError, or the wrapper failing to find libopus
+    opuslib = None
+
+# Codec ids carried in the packet header
+CODEC_PCM = 0
+CODEC_LOSSLESS = 1
+CODEC_OPUS = 2
+
+OPUS_BITRATE = 96000  # bits/s per stream
+OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+OPUS_FRAME_MS = (2.5, 5, 10, 20, 40, 60)
+LOSSLESS_LEVEL = 1    # zlib level; higher barely helps on prediction residuals
+
+
+class PcmCodec:
+    """Raw interleaved int16, no compression.
+
+    encode() and decode() return views of their input rather than copies,
+    so the result is only valid until the caller reuses that buffer.
+    """
+    name = 'pcm'
+    codec_id = CODEC_PCM
+
+    def __init__(self, rate, channels):
+        self.rate = rate
+        self.channels = channels
+
+    def frame_size(self, frames):
+        """Frames per packet to use for a requested block size"""
+        return frames
+
+    def encode(self, samples):
+        """int16 array of shape (frames, channels) to a payload buffer"""
+        return memoryview(np.ascontiguousarray(samples)).cast('B')
+
+    def decode(self, payload, frames):
+        """Payload back to an interleaved int16 buffer"""
+        if len(payload) != frames * self.channels * 2:
+            raise ValueError(f"PCM payload is {len(payload)} bytes, expected {frames * self.channels * 2}")
+        return payload
+
+
+class LosslessCodec(PcmCodec):
+    """FLAC-style lossless coding: fixed 2nd-order prediction + zlib.
+
+    Each channel is predicted as 2*x[n-1] - x[n-2] with zero history at the
+    start of the packet, so packets decode independently. Residuals are
+    stored as int16 when they fit, otherwise int32, flagged by the first byte.
+    """
+    name = 'lossless'
+    codec_id = CODEC_LOSSLESS
+
+    def encode(self, samples):
+        x = np.zeros((len(samples) + 2, self.channels), dtype=np.int32)
+        x[2:] = samples
+        residual = x[2:] - 2 * x[1:-1] + x[:-2]
+        if residual.min() >= -32768 and residual.max() <= 32767:
+            return b'\x00' + zlib.compress(residual.astype(np.int16).tobytes(), LOSSLESS_LEVEL)
+        return b'\x01' + zlib.compress(residual.tobytes(), LOSSLESS_LEVEL)
+
+    def decode(self, payload, frames):
+        if not payload or payload[0] not in (0, 1):
+            raise ValueError("Bad lossless payload")
+        dtype = np.int16 if payload[0] == 0 else np.int32
+        residual = np.frombuffer(zlib.decompress(payload[1:]), dtype=dtype).astype(np.int32)
+        if len(residual) != frames * self.channels:
+            raise ValueError(f"Lossless payload decodes to {len(residual)} samples, "
+                             f"expected {frames * self.channels}")
+        residual = residual.reshape(frames, self.channels)
+        samples = np.cumsum(np.cumsum(residual, axis=0), axis=0)
+        return samples.astype(np.int16).tobytes()
+
+
+class OpusCodec(PcmCodec):
+    """Opus via opuslib (needs libopus); about 16x smaller than PCM at 96 kbit/s"""
+    name = 'opus'
+    codec_id = CODEC_OPUS
+
+    def __init__(self, rate, channels, bitrate=OPUS_BITRATE):
+        if opuslib is None:
+            raise RuntimeError("Opus codec needs the opuslib package and libopus")
+        if rate not in OPUS_RATES:
+            raise ValueError(f"Opus does not support {rate} Hz (use one of {OPUS_RATES})")
+        super().__init__(rate, channels)
+        self.bitrate = bitrate
+        self._encoder = None
+        self._decoder = None
+
+    def frame_size(self, frames):
+        # Largest Opus frame that fits in the requested block, so latency
+        # never grows past what PCM would have used
+        sizes = [int(self.rate * ms / 1000) for ms in OPUS_FRAME_MS]
+        fitting = [n for n in sizes if n <= frames]
+        return fitting[-1] if fitting else sizes[0]
+
+    def encode(self, samples):
+        if self._encoder is None:
+            self._encoder = opuslib.Encoder(self.rate, self.channels, opuslib.APPLICATION_AUDIO)
+            self._encoder.bitrate = self.bitrate
+        return self._encoder.encode(samples.tobytes(), len(samples))
+
+    def decode(self, payload, frames):
+        if self._decoder is None:
+            self._decoder = opuslib.Decoder(self.rate, self.channels)
+        return self._decoder.decode(bytes(payload), frames)
+
+
+CODECS = {cls.name: cls for cls in (PcmCodec, LosslessCodec, OpusCodec)}
+CODEC_IDS = {cls.codec_id: cls for cls in CODECS.values()}
+
+
+def available_codecs():
+    """Names of the codecs usable in this environment"""
+    return [name for name, cls in CODECS.items() if cls is not OpusCodec or opuslib is not None]
+
+
+def create_codec(name_or_id, rate, channels):
+    """Codec instance by name (sender side) or header id (receiver side).
+
+    Instances hold encoder/decoder state, so use one per stream and direction.
+    """
+    cls = CODEC_IDS.get(name_or_id) or CODECS.get(name_or_id)
+    if cls is None:
+        raise ValueError(f"Unknown codec: {name_or_id}")
+    return cls(rate, channels)
@@ -0,0 +1,76 @@
+import numpy as np
+
+FADE_FRAMES = 64      # Crossfade length in samples per channel
+MAX_REPEATS = 3       # Repeated frames before fully faded out
+MAX_SILENCE = 8       # Silent frames after that before giving up
+
+
+class Concealer:
+    """Fills gaps in an int16 interleaved stream without clicks.
+
+    Missing frames are replaced by the last good frame, faded out over
+    MAX_REPEATS frames and then silence, so the output clock keeps running.
+    Both edges are crossfaded: into the concealment from the last output
+    sample, and back out of it into the next good frame.
+    """
+
+    def __init__(self, channels, fade_frames=FADE_FRAMES, max_repeats=MAX_REPEATS,
+                 max_silence=MAX_SILENCE):
+        self.channels = channels
+        self.fade_frames = fade_frames
+        self.max_repeats = max_repeats
+        self.max_silence = max_silence
+        self.concealed = 0
+        self.reset()
+
+    def reset(self):
+        self._last = None       # Last good frame, float32 (frames, channels)
+        self._tail = None       # Last output sample per channel
+        self._misses = 0
+
+    def _fade(self, length):
+        n = min(self.fade_frames, length)
+        ramp = np.linspace(0.0, 1.0, n, endpoint=False, dtype=np.float32)
+        return n, ramp[:, None]
+
+    def _to_bytes(self, frame):
+        self._tail = frame[-1].copy()
+        np.clip(frame, -32768, 32767, out=frame)
+        return frame.astype(np.int16).tobytes()
+
+    def _repeat(self, misses):
+        """Concealment frame for the given consecutive miss count (1-based)"""
+        length = len(self._last)
+        if misses > self.max_repeats:
+            return np.zeros_like(self._last)
+        # Linear gain ramp across the frame, reaching 0 after max_repeats frames
+        start = 1.0 - (misses - 1) / self.max_repeats
+        end = 1.0 - misses / self.max_repeats
+        gain = np.linspace(start, end, length, dtype=np.float32)[:, None]
+        return self._last * gain
+
+    def good(self, data):
+        """Pass a received frame through, crossfading out of any concealment"""
+        frame = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+        frame = frame.reshape(-1, self.channels)
+        if self._misses and self._last is not None:
+            n, ramp = self._fade(len(frame))
+            # What concealment would have played next, faded into the real frame
+            cont = self._repeat(self._misses + 1)[:n]
+            frame[:n] = cont * (1.0 - ramp) + frame[:n] * ramp
+        self._misses = 0
+        self._last = frame.copy()
+        return self._to_bytes(frame)
+
+    def conceal(self):
+        """Synthesize a frame for a missing packet; None once there is nothing to play"""
+        if self._last is None or self._misses >= self.max_repeats + self.max_silence:
+            return None
+        self._misses += 1
+        self.concealed += 1
+        frame = self._repeat(self._misses)
+        if self._misses == 1 and self._tail is not None:
+            # Step from the last output sample into the repeated frame
+            n, ramp = self._fade(len(frame))
+            frame[:n] = self._tail * (1.0 - ramp) + frame[:n] * ramp
+        return self._to_bytes(frame)
@@ -0,0 +1,160 @@
+import time
+import json_cache
+
+try:
+    import sounddevice as sd
+except (ImportError, OSError):  # Not installed, or PortAudio missing
+    sd = None
+
+CACHE_PATH = json_cache.cache_path('devices.json')
+RATES = (8000, 16000, 22050, 32000, 44100, 48000, 88200, 96000)
+BLOCKSIZES = (64, 128, 256, 512, 1024, 2048)  # Tried smallest first
+MEASURE_SECONDS = 0.5  # Capture time per blocksize when measuring
+CACHE_VERSION = 1
+
+
+def device_key(device, hostapi_name):
+    """Stable identity for a device: indices change when devices come and go, names don't"""
+    return f"{hostapi_name}/{device['name']}"
+
+
+class DeviceCache:
+    """Input device capabilities, probed once and remembered on disk.
+
+    Enumerating through PortAudio is slow on some hosts (and probing by
+    recording slower still), so the device list is queried once per
+    process and each device's supported rates, channel counts and the
+    smallest blocksize it captures without overflows are kept in a JSON
+    file keyed by host API and device name. An entry is re-probed when
+    the device's reported defaults change.
+    """
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self._devices = None
+        self._entries = json_cache.load(path, CACHE_VERSION, 'devices')
+        self._dirty = False
+
+    def writable(self):
+        """Whether save() can keep what is probed now for the next run"""
+        return json_cache.writable(self.path)
+
+    def save(self):
+        """Write the cache if anything changed"""
+        if not self._dirty:
+            return
+        json_cache.save(self.path, CACHE_VERSION, 'devices', self._entries)
+        self._dirty = False
+
+    def devices(self):
+        """Every device with its host API name, enumerated once per cache object"""
+        if self._devices is None:
+            hostapis = [api['name'] for api in sd.query_hostapis()]
+            self._devices = []
+            for i, device in enumerate(sd.query_devices()):
+                device = dict(device)
+                device['index'] = i
+                device['hostapi_name'] = hostapis[device['hostapi']]
+                self._devices.append(device)
+        return self._devices
+
+    def input_devices(self):
+        return [d for d in self.devices() if d['max_input_channels'] > 0]
+
+    def refresh(self):
+        """Forget the device list, e.g. after a device was plugged in"""
+        self._devices = None
+
+    def capabilities(self, index, measure=True, reprobe=False):
+        """Cached capabilities of input device `index`, probing what is missing.
+
+        Supported rates and channel counts come from PortAudio's format
+        check and cost nothing; the stable blocksize needs real capture
+        and is only measured when `measure` is set.
+        """
+        device = self.devices()[index]
+        key = device_key(device, device['hostapi_name'])
+        entry = self._entries.get(key)
+        fingerprint = [device['max_input_channels'], device['default_samplerate']]
+        if reprobe or entry is None or entry.get('fingerprint') != fingerprint:
+            entry = {
+                'fingerprint': fingerprint,
+                'default_rate': int(device['default_samplerate']),
+                'rates': self._supported_rates(index, min(device['max_input_channels'], 2)),
+                'channels': self._supported_channels(index, device['max_input_channels'],
+                                                     int(device['default_samplerate'])),
+                'blocksize': None,
+                'latency': None,
+            }
+            self._entries[key] = entry
+            self._dirty = True
+        if measure and entry['blocksize'] is None:
+            rate, channels = self._preferred(entry)
+            entry['blocksize'], entry['latency'] = measure_blocksize(index, rate, channels)
+            entry['measured'] = time.time()
+            self._dirty = True
+        return entry
+
+    def best_config(self, index, channels=None, measure=True):
+        """(rate, channels, blocksize, latency) with the lowest latency the device sustains"""
+        entry = self.capabilities(index, measure)
+        rate, preferred = self._preferred(entry)
+        return rate, channels or preferred, entry['blocksize'], entry['latency']
+
+    @staticmethod
+    def _preferred(entry):
+        # The device's own rate avoids resampling in the host API; stereo at most
+        rate = entry['default_rate']
+        if entry['rates'] and rate not in entry['rates']:
+            rate = max(entry['rates'])
+        channels = min(max(entry['channels'] or [1]), 2)
+        return rate, channels
+
+    @staticmethod
+    def _supported_rates(index, channels):
+        rates = []
+        for rate in RATES:
+            try:
+                sd.check_input_settings(device=index, channels=channels, samplerate=rate)
+                rates.append(rate)
+            except Exception:
+                pass
+        return rates
+
+    @staticmethod
+    def _supported_channels(index, max_channels, rate):
+        channels = []
+        for count in range(1, max_channels + 1):
+            try:
+                sd.check_input_settings(device=index, channels=count, samplerate=rate)
+                channels.append(count)
+            except Exception:
+                pass
+        return channels
+
+
+def measure_blocksize(index, rate, channels):
+    """Smallest blocksize that captures MEASURE_SECONDS without overflows, and its latency.
+
+    Returns (None, None) if the device cannot be opened at all, and the
+    largest blocksize tried if every one overflowed.
+    """
+    fallback = (None, None)
+    for blocksize in BLOCKSIZES:
+        overflows = [0]
+
+        def callback(indata, frames, time_info, status):
+            if status.input_overflow:
+                overflows[0] += 1
+
+        try:
+            with sd.InputStream(device=index, channels=channels, samplerate=rate,
+                                blocksize=blocksize, latency='low', callback=callback) as stream:
+                sd.sleep(int(MEASURE_SECONDS * 1000))
+                latency = stream.latency
+        except Exception:
+            continue  # Blocksize (or device) not accepted
+        if not overflows[0]:
+            return blocksize, latency
+        fallback = (blocksize, latency)
+    return fallback
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import random
+import select
+import socket
+import struct
+import time
+
+try:
+    import netifaces
+except ImportError:  # Only used to find subnet broadcast addresses
+    netifaces = None
+
+# One query reaches every receiver on the LAN: it goes to the limited and
+# subnet broadcast addresses and to a multicast group, and every receiver
+# answers the querier directly with a line of JSON describing itself.
+#
+#   query     DISCOVERY_MESSAGE
+#   response  DISCOVERY_RESPONSE b'\n' {"port": ..., "streams": ..., ...}
+DISCOVERY_PORT = 5006
+DISCOVERY_GROUP = '239.255.42.99'
+DISCOVERY_MESSAGE = b"DISCOVER_AUDIO_RECEIVER"
+DISCOVERY_RESPONSE = b"AUDIO_RECEIVER_ACTIVE"
+DISCOVERY_TIMEOUT = 1.0  # Seconds to collect answers
+QUERY_REPEATS = 2        # Queries sent, spread over the first part of the timeout, against loss
+RESPONSE_SPREAD = 0.05   # Receivers wait up to this long to answer, so replies don't arrive all at once
+
+
+def make_response(info):
+    return DISCOVERY_RESPONSE + b'\n' + json.dumps(info, separators=(',', ':')).encode()
+
+
+def parse_response(data):
+    """Receiver description from a response, or None if it is not one"""
+    head, _, body = data.partition(b'\n')
+    if head != DISCOVERY_RESPONSE:
+        return None
+    try:
+        info = json.loads(body) if body else {}
+    except ValueError:
+        return None
+    return info if isinstance(info, dict) else None
+
+
+def broadcast_addresses():
+    """Limited broadcast plus every IPv4 interface's subnet broadcast address"""
+    addresses = ['255.255.255.255']
+    if netifaces is not None:
+        for iface in netifaces.interfaces():
+            for entry in netifaces.ifaddresses(iface).get(netifaces.AF_INET, []):
+                if entry.get('broadcast') and entry['broadcast'] not in addresses:
+                    addresses.append(entry['broadcast'])
+    return addresses
+
+
+class DiscoveryResponder(asyncio.DatagramProtocol):
+    """Answers discovery queries with describe()'s current result"""
+
+    def __init__(self, describe):
+        self.describe = describe
+        self.transport = None
+        self.queries = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if data != DISCOVERY_MESSAGE:
+            return
+        self.queries += 1
+        loop = asyncio.get_running_loop()
+        loop.call_later(random.uniform(0, RESPONSE_SPREAD), self._answer, addr)
+
+    def _answer(self, addr):
+        if self.transport is None or self.transport.is_closing():
+            return
+        try:
+            self.transport.sendto(make_response(self.describe()), addr)
+        except OSError:
+            pass
+
+    def error_received(self, exc):
+        pass
+
+    def connection_lost(self, exc):
+        self.transport = None
+
+
+def responder_socket(port=DISCOVERY_PORT, group=DISCOVERY_GROUP):
+    """Socket that receives unicast, broadcast and multicast queries on `port`"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, 'SO_REUSEPORT'):  # Several receivers on one host
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(('0.0.0.0', port))
+    if group:
+        try:
+            mreq = struct.pack('4s4s', socket.inet_aton(group), socket.inet_aton('0.0.0.0'))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        except OSError:
+            pass  # No multicast route; broadcast and unicast queries still work
+    sock.setblocking(False)
+    return sock
+
+
+def discover(timeout=DISCOVERY_TIMEOUT, port=DISCOVERY_PORT, group=DISCOVERY_GROUP, broadcast=True,
+             hosts=()):
+    """Query the LAN once and collect every receiver that answers within `timeout`.
+
+    Returns a list of receiver descriptions, each with the responder's
+    'ip' and the query's 'rtt_ms' added, in order of arrival. `hosts`
+    adds unicast destinations for receivers broadcast can't reach.
+    """
+    destinations = list(hosts)
+    if broadcast:
+        destinations += broadcast_addresses()
+    if group:
+        destinations.append(group)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+    sock.setblocking(False)
+    found = {}
+    start = time.monotonic()
+    deadline = start + timeout
+    next_query, queries = start, 0
+    try:
+        while True:
+            now = time.monotonic()
+            if queries < QUERY_REPEATS and now >= next_query:
+                for destination in destinations:
+                    try:
+                        sock.sendto(DISCOVERY_MESSAGE, (destination, port))
+                    except OSError:
+                        pass  # e.g. no route for broadcast or multicast on this host
+                queries += 1
+                next_query = start + timeout * queries / (2 * QUERY_REPEATS)
+            if now >= deadline:
+                break
+            wait = min(deadline, next_query) - now if queries < QUERY_REPEATS else deadline - now
+            readable, _, _ = select.select([sock], [], [], max(wait, 0))
+            if not readable:
+                continue
+            try:
+                data, addr = sock.recvfrom(4096)
+            except OSError:
+                continue
+            info = parse_response(data)
+            if info is None:
+                continue
+            key = info.get('id') or (addr[0], info.get('port'))  # First answer per receiver wins
+            if key not in found:
+                info['ip'] = addr[0]
+                info['rtt_ms'] = (time.monotonic() - start) * 1000
+                found[key] = info
+    finally:
+        sock.close()
+    return list(found.values())
+
+
+def pick_receiver(receivers):
+    """The receiver to stream to: accepting new streams, least loaded, then quickest to answer"""
+    accepting = [r for r in receivers if r.get('accepting', True)]
+    if not accepting:
+        return None
+    return min(accepting, key=lambda r: (r.get('load', 0.0), r.get('rtt_ms', 0.0)))
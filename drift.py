@@ -0,0 +1,112 @@
+import numpy as np
+
+WINDOW = 1024          # Packets used for the clock skew regression
+UPDATE_EVERY = 64      # Packets between regressions
+RESUME_AFTER = 256     # Packets at a new packet size before the skew is re-estimated
+MAX_SKEW = 0.0005      # Trust at most +/-500 ppm from the timeline
+FILL_GAIN = 0.0005     # Ratio correction per packet of excess buffer fill
+FILL_SMOOTHING = 0.01  # EWMA gain for the buffer fill error
+MAX_CORRECTION = 0.005 # Never resample by more than +/-0.5%
+
+
+class DriftEstimator:
+    """Estimates how much faster the sender produces audio than we play it.
+
+    Two inputs are combined. The slope of arrival time against the sender's
+    audio timeline (sequence number times packet duration) gives the skew of
+    the sender's sample clock against ours; the fixed network delay drops out
+    of the slope. The smoothed difference between jitter buffer fill and its
+    target catches what the timeline cannot see, such as the output device's
+    own crystal. ratio() > 1 means audio is arriving too fast and playout
+    should consume it faster.
+
+    A change of packet size starts a new regression window, since arrivals
+    shift against the timeline when the sender's packetization changes;
+    the last skew estimate holds until the new window has RESUME_AFTER
+    packets.
+    """
+
+    def __init__(self, window=WINDOW):
+        self._audio = np.zeros(window)
+        self._recv = np.zeros(window)
+        self.reset()
+
+    def reset(self):
+        self._count = 0
+        self._min_count = UPDATE_EVERY
+        self._duration = None
+        self.skew = 0.0
+        self.fill_error = 0.0
+
+    def observe(self, seq_num, recv_time, packet_duration):
+        """Record one packet's position in the audio timeline and its arrival time"""
+        if packet_duration != self._duration:
+            if self._duration is not None:
+                self._count = 0  # New window; self.skew carries over
+                self._min_count = RESUME_AFTER
+            self._duration = packet_duration
+        i = self._count % len(self._audio)
+        self._audio[i] = seq_num * packet_duration
+        self._recv[i] = recv_time
+        self._count += 1
+        if self._count >= self._min_count and self._count % UPDATE_EVERY == 0:
+            self._update_skew()
+
+    def _update_skew(self):
+        n = min(self._count, len(self._audio))
+        x = self._audio[:n] - self._audio[:n].mean()
+        y = self._recv[:n] - self._recv[:n].mean()
+        denom = np.dot(x, x)
+        if denom <= 0:
+            return
+        slope = np.dot(x, y) / denom
+        # slope < 1: audio arrives faster than real time by our clock
+        self.skew = float(np.clip(1.0 / slope - 1.0, -MAX_SKEW, MAX_SKEW))
+
+    def ratio(self, depth, target_depth):
+        """Input/output sample ratio to apply to the next frame"""
+        self.fill_error += ((depth - target_depth) - self.fill_error) * FILL_SMOOTHING
+        correction = self.skew + FILL_GAIN * self.fill_error
+        return 1.0 + max(-MAX_CORRECTION, min(MAX_CORRECTION, correction))
+
+
+class Resampler:
+    """Fractional linear-interpolation resampler for int16 interleaved frames.
+
+    Keeps the last input sample and the fractional read position between
+    calls, so consecutive frames join without discontinuities even though
+    each output frame may be a sample longer or shorter than its input.
+    """
+
+    def __init__(self, channels):
+        self.channels = channels
+        self.reset()
+
+    def reset(self):
+        self._prev = None
+        self._phase = 0.0
+
+    def process(self, data, ratio):
+        """Resample one frame; ratio is input samples consumed per output sample"""
+        frame = np.frombuffer(data, dtype=np.int16).reshape(-1, self.channels)
+        n = len(frame)
+        if n == 0:
+            return data
+        if self._prev is None:
+            self._prev = frame[0].astype(np.float32)
+
+        count = int(np.ceil((n - self._phase) / ratio))
+        pos = self._phase + ratio * np.arange(count)
+        idx = pos.astype(np.intp)
+        frac = (pos - idx).astype(np.float32)[:, None]
+
+        # Position 0 is the previous frame's last sample, 1..n this frame
+        buf = np.empty((n + 1, self.channels), dtype=np.float32)
+        buf[0] = self._prev
+        buf[1:] = frame
+        out = buf[idx] * (1.0 - frac) + buf[np.minimum(idx + 1, n)] * frac
+
+        self._phase = self._phase + count * ratio - n
+        self._prev = buf[n]
+        np.clip(out, -32768, 32767, out=out)
+        return out.astype(np.int16).tobytes()
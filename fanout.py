@@ -0,0 +1,64 @@
+import threading
+import time
+
+TARGET_TIMEOUT = 10.0  # Seconds without a keepalive before a joined receiver is dropped
+
+
+class TargetSet:
+    """Receivers one capture is sent to.
+
+    Static targets (configured unicast addresses or a multicast group) stay
+    until removed; joined targets must keep sending JOINs or they expire.
+    The send path calls snapshot(), which returns a tuple rebuilt only when
+    membership changes, so it never takes the lock per packet.
+    """
+
+    def __init__(self, static=(), timeout=TARGET_TIMEOUT):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._static = list(dict.fromkeys(static))
+        self._joined = {}  # addr -> last keepalive time
+        self._snapshot = tuple(self._static)
+
+    def _rebuild(self):
+        self._snapshot = tuple(dict.fromkeys(self._static + list(self._joined)))
+
+    def snapshot(self):
+        """Current targets as a tuple of (ip, port)"""
+        return self._snapshot
+
+    def join(self, addr, now=None):
+        """Add or refresh a receiver; returns True if it is new"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            new = addr not in self._joined and addr not in self._static
+            self._joined[addr] = now
+            if new:
+                self._rebuild()
+            return new
+
+    def leave(self, addr):
+        """Remove a receiver; returns True if it was present"""
+        with self._lock:
+            if addr in self._joined:
+                del self._joined[addr]
+            elif addr in self._static:
+                self._static.remove(addr)
+            else:
+                return False
+            self._rebuild()
+            return True
+
+    def expire(self, now=None):
+        """Drop joined receivers that stopped sending keepalives; returns them"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            stale = [a for a, seen in self._joined.items() if now - seen > self.timeout]
+            for addr in stale:
+                del self._joined[addr]
+            if stale:
+                self._rebuild()
+            return stale
+
+    def __len__(self):
+        return len(self._snapshot)
@@ -0,0 +1,144 @@
+import struct
+import numpy as np
+
+# Parity payload header, followed by the XOR of the protected payloads
+# (each zero-padded to the longest one).
+#
+#   count      B   data packets covered
+#   stride     B   sequence distance between them (interleave depth)
+#   length     H   XOR of the payload lengths
+#   frames     H   XOR of the frames-per-packet values
+#   timestamp  Q   XOR of the timestamps' IEEE 754 bit patterns
+FEC_HEADER = struct.Struct('<BBHHQ')
+HISTORY = 512  # Data packets kept for rebuilding
+
+
+def _ts_bits(timestamp):
+    return struct.unpack('<Q', struct.pack('<d', timestamp))[0]
+
+
+def _bits_ts(bits):
+    return struct.unpack('<d', struct.pack('<Q', bits))[0]
+
+
+def _xor_payloads(payloads):
+    size = max(len(p) for p in payloads)
+    acc = np.zeros(size, dtype=np.uint8)
+    for p in payloads:
+        acc[:len(p)] ^= np.frombuffer(p, dtype=np.uint8)
+    return acc
+
+
+def group_size(overhead):
+    """Data packets per parity packet for a bandwidth overhead ratio (0.25 = 25%)"""
+    return max(1, min(255, round(1 / overhead)))
+
+
+class FecEncoder:
+    """Emits one XOR parity packet per group of data packets.
+
+    With interleave > 1, consecutive packets go to different groups, so a
+    burst of up to `interleave` lost packets costs each group only one,
+    which a single parity packet can rebuild.
+    """
+
+    def __init__(self, overhead, interleave=1):
+        self.count = group_size(overhead)
+        self.stride = interleave
+        self._groups = {}
+
+    @property
+    def span(self):
+        """Packets between a group's first data packet and its parity packet"""
+        return self.count * self.stride
+
+    def add(self, seq_num, timestamp, frames, payload):
+        """Record a data packet; returns (first_seq, parity_payload) when a group completes"""
+        lane = seq_num % self.stride
+        group = self._groups.setdefault(lane, [])
+        if group and seq_num != group[-1][0] + self.stride:
+            group.clear()  # Sequence jumped; start the group over
+        group.append((seq_num, timestamp, frames, bytes(payload)))  # Caller may reuse its buffer
+        if len(group) < self.count:
+            return None
+
+        length = frames_x = ts_x = 0
+        for _, ts, fr, p in group:
+            length ^= len(p)
+            frames_x ^= fr
+            ts_x ^= _ts_bits(ts)
+        header = FEC_HEADER.pack(self.count, self.stride, length, frames_x, ts_x)
+        parity = header + _xor_payloads([g[3] for g in group]).tobytes()
+        first_seq = group[0][0]
+        group.clear()
+        return first_seq, parity
+
+
+class FecDecoder:
+    """Rebuilds single lost packets per group from parity packets"""
+
+    def __init__(self, history=HISTORY):
+        self.history = history
+        self.span = 0
+        self.recovered = 0
+        self._data = {}    # seq -> (timestamp, frames, payload)
+        self._parity = {}  # first seq -> (count, stride, length, frames, ts bits, xor)
+
+    def reset(self):
+        self._data.clear()
+        self._parity.clear()
+
+    def add_data(self, seq_num, timestamp, frames, payload):
+        """Remember a data packet; returns packets it let us rebuild"""
+        self._data[seq_num] = (timestamp, frames, bytes(payload))  # Caller may reuse its buffer
+        while len(self._data) > self.history:
+            del self._data[next(iter(self._data))]
+        return self._try_all()
+
+    def add_parity(self, first_seq, payload):
+        """Take a parity packet; returns packets it let us rebuild"""
+        if len(payload) < FEC_HEADER.size:
+            return []
+        count, stride, length, frames, ts_bits = FEC_HEADER.unpack_from(payload)
+        if not count or not stride:
+            return []
+        self.span = count * stride
+        xor = np.frombuffer(payload, dtype=np.uint8, offset=FEC_HEADER.size).copy()
+        self._parity[first_seq] = (count, stride, length, frames, ts_bits, xor)
+        while len(self._parity) > self.history // max(1, count):
+            del self._parity[next(iter(self._parity))]
+        return self._try_all()
+
+    def _try_all(self):
+        recovered = []
+        for first_seq in list(self._parity):
+            packet = self._try(first_seq)
+            if packet is not None:
+                recovered.append(packet)
+        return recovered
+
+    def _try(self, first_seq):
+        count, stride, length, frames, ts_bits, xor = self._parity[first_seq]
+        members = range(first_seq, first_seq + count * stride, stride)
+        missing = [s for s in members if s not in self._data]
+        if len(missing) > 1:
+            return None
+        del self._parity[first_seq]
+        if not missing:
+            return None
+
+        acc = xor.copy()
+        for s in members:
+            if s == missing[0]:
+                continue
+            timestamp, fr, p = self._data[s]
+            length ^= len(p)
+            frames ^= fr
+            ts_bits ^= _ts_bits(timestamp)
+            acc[:len(p)] ^= np.frombuffer(p, dtype=np.uint8)
+        if length > len(acc):
+            return None  # Inconsistent group, e.g. after a sender restart
+        self.recovered += 1
+        payload = acc[:length].tobytes()
+        self._data[missing[0]] = (_bits_ts(ts_bits), frames, payload)
+        return missing[0], _bits_ts(ts_bits), frames, payload
@@ -0,0 +1,339 @@
+import argparse
+import asyncio
+import contextlib
+import heapq
+import json
+import math
+import random
+import socket
+import sys
+import threading
+import time
+import wave
+import numpy as np
+from sending import Sender
+from receiver_engine import ReceiverEngine, NullSink
+from codec import CODECS
+from cli import parse_args
+
+# Offline end-to-end run: tone or file sources feed real Sender objects,
+# each sender's packets pass through an impairment relay on loopback, and
+# one ReceiverEngine plays every stream into null sinks. No sound hardware
+# or network needed; the report is JSON.
+
+DURATION = 10.0
+STREAMS = 1
+RATE = 48000
+CHANNELS = 2
+CHUNK = 512
+BLOCKSIZE = 256        # Frames per fake capture callback
+TONE = 440.0           # Hz of the first stream's tone; each further stream is a fifth up
+REORDER_DELAY = 0.01   # Seconds a reordered packet is held back
+SEED = 1
+
+
+class ToneSource:
+    """Sine tone, one block at a time, phase-continuous"""
+
+    def __init__(self, rate=RATE, channels=CHANNELS, frequency=TONE, level=0.5):
+        self.rate = rate
+        self.channels = channels
+        self._step = 2 * math.pi * frequency / rate
+        self._level = level
+        self._phase = 0
+
+    def read(self, frames):
+        t = (self._phase + np.arange(frames)) * self._step
+        self._phase += frames
+        tone = (np.sin(t) * self._level).astype(np.float32)
+        return np.repeat(tone[:, None], self.channels, axis=1)
+
+
+class FileSource:
+    """16-bit WAV file, looped"""
+
+    def __init__(self, path):
+        self._wav = wave.open(path, 'rb')
+        if self._wav.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit WAV is supported")
+        self.rate = self._wav.getframerate()
+        self.channels = self._wav.getnchannels()
+
+    def read(self, frames):
+        data = self._wav.readframes(frames)
+        while len(data) < frames * self.channels * 2:
+            self._wav.rewind()
+            data += self._wav.readframes(frames - len(data) // (self.channels * 2))
+        samples = np.frombuffer(data, dtype=np.int16).reshape(-1, self.channels)
+        return samples.astype(np.float32) / 32768
+
+
+def feed(sender, source, blocksize, stop):
+    """Stand-in for sd.InputStream: calls the sender's callback at real-time pace"""
+    start = time.perf_counter()
+    blocks = 0
+    while not stop.is_set():
+        sender.callback(source.read(blocksize), blocksize, None, None)
+        blocks += 1
+        delay = start + blocks * blocksize / source.rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ImpairmentRelay:
+    """UDP relay that loses, delays, reorders and duplicates packets.
+
+    Every decision comes from a seeded random generator, so a given seed
+    impairs the same packets the same way on every run. Jitter delays are
+    applied in order (a FIFO link); reordering is separate and holds a
+    packet back by REORDER_DELAY. Loss is Bernoulli, or bursty
+    (Gilbert-Elliott) with burst > 1: the average burst length.
+    """
+
+    def __init__(self, target, loss=0.0, burst=1.0, jitter=0.0, reorder=0.0, duplicate=0.0,
+                 seed=SEED):
+        self.target = target
+        self.loss = loss
+        self.burst = burst
+        self.jitter = jitter
+        self.reorder = reorder
+        self.duplicate = duplicate
+        self.stats = {'received': 0, 'forwarded': 0, 'dropped': 0, 'reordered': 0, 'duplicated': 0}
+        self._rng = random.Random(seed)
+        self._bad = False
+        self._queue = []  # (due, order, data)
+        self._order = 0
+        self._last_due = 0.0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.address = self.sock.getsockname()
+        self.running = False
+        self._thread = None
+
+    def _lose(self):
+        if self.burst <= 1:
+            return self._rng.random() < self.loss
+        # Two-state model with the requested average loss and burst length
+        if self._bad:
+            self._bad = self._rng.random() >= 1 / self.burst
+        else:
+            self._bad = self._rng.random() < self.loss / (self.burst * (1 - self.loss))
+        return self._bad
+
+    def _schedule(self, data, now):
+        due = max(now + self._rng.uniform(0, 2 * self.jitter), self._last_due)
+        self._last_due = due
+        if self._rng.random() < self.reorder:
+            due += REORDER_DELAY
+            self.stats['reordered'] += 1
+        copies = 2 if self._rng.random() < self.duplicate else 1
+        self.stats['duplicated'] += copies - 1
+        for _ in range(copies):
+            heapq.heappush(self._queue, (due, self._order, data))
+            self._order += 1
+
+    def run(self):
+        while self.running:
+            now = time.perf_counter()
+            while self._queue and self._queue[0][0] <= now:
+                _, _, data = heapq.heappop(self._queue)
+                try:
+                    self.sock.sendto(data, self.target)
+                    self.stats['forwarded'] += 1
+                except OSError:
+                    pass
+            timeout = min(0.05, self._queue[0][0] - now) if self._queue else 0.05
+            self.sock.settimeout(max(timeout, 0.0001))
+            try:
+                data, _ = self.sock.recvfrom(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.stats['received'] += 1
+            if self._lose():
+                self.stats['dropped'] += 1
+                continue
+            self._schedule(data, time.perf_counter())
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        self.sock.close()
+
+
+class MeasuredSink(NullSink):
+    """Null sink that also tracks the CPU time of the playout thread feeding it"""
+
+    def __init__(self):
+        super().__init__()
+        self.cpu = 0.0
+        self._cpu_start = None
+
+    def write(self, data):
+        # Each stream's play() keeps one worker thread for its whole life
+        now = time.thread_time()
+        if self._cpu_start is None:
+            self._cpu_start = now
+        self.cpu = now - self._cpu_start
+        super().write(data)
+
+
+def thread_cpu(thread):
+    """CPU seconds a thread has used so far (Linux and most Unixes)"""
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(thread.ident))
+    except (AttributeError, OSError, TypeError):
+        return 0.0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Run sender and receiver over loopback with injected impairments and report")
+    parser.add_argument('--config', metavar='FILE', help="JSON file of option defaults")
+    parser.add_argument('--duration', type=float, metavar='SECONDS')
+    parser.add_argument('--streams', type=int, metavar='N', help="concurrent senders")
+    parser.add_argument('--source', metavar='tone|FILE.wav', help="tone generator or a WAV file to loop")
+    parser.add_argument('--rate', type=int)
+    parser.add_argument('--channels', type=int)
+    parser.add_argument('--chunk', type=int, metavar='FRAMES', help="frames per packet")
+    parser.add_argument('--blocksize', type=int, metavar='FRAMES', help="frames per fake capture callback")
+    parser.add_argument('--codec', choices=sorted(CODECS))
+    parser.add_argument('--fec-overhead', type=float, metavar='RATIO')
+    parser.add_argument('--fec-interleave', type=int, metavar='N')
+    parser.add_argument('--auto-tune', action=argparse.BooleanOptionalAction)
+    parser.add_argument('--batch-io', action=argparse.BooleanOptionalAction)
+    parser.add_argument('--playout-delay', type=float, metavar='SECONDS')
+    parser.add_argument('--loss', type=float, metavar='FRACTION', help="packet loss, e.g. 0.02")
+    parser.add_argument('--burst', type=float, metavar='PACKETS', help="average loss burst length")
+    parser.add_argument('--jitter', type=float, metavar='MS', help="mean added delay variation")
+    parser.add_argument('--reorder', type=float, metavar='FRACTION')
+    parser.add_argument('--duplicate', type=float, metavar='FRACTION')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--report', metavar='FILE', help="write the JSON report here instead of stdout")
+    parser.add_argument('--max-p99-ms', type=float, metavar='MS',
+                        help="exit 1 if any stream's end-to-end p99 exceeds this")
+    parser.add_argument('--max-glitches', type=int, metavar='N',
+                        help="exit 1 if any stream has more concealed packets plus underruns")
+    parser.set_defaults(duration=DURATION, streams=STREAMS, source='tone', rate=RATE, channels=CHANNELS,
+                        chunk=CHUNK, blocksize=BLOCKSIZE, codec='pcm', fec_overhead=0.0,
+                        fec_interleave=1, auto_tune=False, batch_io=False, playout_delay=None,
+                        loss=0.0, burst=1.0, jitter=0.0, reorder=0.0, duplicate=0.0, seed=SEED)
+    return parser
+
+
+async def run(args):
+    """Run the harness for args.duration; returns the report dict"""
+    sinks = {}
+
+    def make_sink(key):
+        sinks[key] = MeasuredSink()
+        return sinks[key]
+
+    engine = ReceiverEngine(0, sink_factory=make_sink, max_streams=max(args.streams, 1),
+                            bind_address='127.0.0.1', playout_delay=args.playout_delay,
+                            batch_io=args.batch_io, stats_interval=0)
+    engine_task = asyncio.ensure_future(engine.run())
+    while engine.sock is None:
+        await asyncio.sleep(0.01)
+
+    stop = threading.Event()
+    lanes = []
+    for i in range(args.streams):
+        source = (ToneSource(args.rate, args.channels, TONE * 1.5 ** i) if args.source == 'tone'
+                  else FileSource(args.source))
+        relay = ImpairmentRelay(('127.0.0.1', engine.port), args.loss, args.burst, args.jitter / 1000,
+                                args.reorder, args.duplicate, seed=args.seed + i).start()
+        sender = Sender(source.rate, source.channels, [relay.address], chunk=args.chunk,
+                        codec=args.codec, fec_overhead=args.fec_overhead,
+                        fec_interleave=args.fec_interleave, auto_tune=args.auto_tune)
+        # One control listener answers clock pings and feedback for the host; the
+        # receiver sees each stream coming from its relay's port
+        sender.start(control=i == 0)
+        if sender.tuner:
+            (lanes[0][1] if lanes else sender).route_feedback(relay.address[1], sender.tuner)
+        feeder = threading.Thread(target=feed, args=(sender, source, args.blocksize, stop), daemon=True)
+        lanes.append((relay, sender, feeder))
+    started = time.perf_counter()
+    process_start = time.process_time()
+    for _, _, feeder in lanes:
+        feeder.start()
+
+    await asyncio.sleep(args.duration)
+    elapsed = time.perf_counter() - started
+    process_cpu = time.process_time() - process_start
+    stop.set()
+
+    streams = []
+    for i, (relay, sender, _) in enumerate(lanes):
+        pipeline = engine.streams.get(relay.address)
+        stream = {'stream': i, 'relay': dict(relay.stats), 'chunk': sender.chunk,
+                  'packets_sent': sender.packets_sent.value,
+                  'sender_cpu_percent': thread_cpu(sender._threads[0]) / elapsed * 100}
+        if pipeline is not None:
+            metrics = pipeline.metrics()
+            metrics['glitches'] = metrics['concealed'] + metrics['underruns']
+            metrics['playout_cpu_percent'] = sinks[relay.address].cpu / elapsed * 100
+            stream.update(metrics)
+        streams.append(stream)
+
+    for relay, sender, _ in lanes:
+        sender.stop()
+        relay.stop()
+    engine.stop()
+    await engine_task
+
+    config = {name: value for name, value in sorted(vars(args).items())
+              if name not in ('config', 'report', 'max_p99_ms', 'max_glitches')}
+    return {
+        'config': config,
+        'elapsed_seconds': elapsed,
+        'process_cpu_percent': process_cpu / elapsed * 100,
+        'streams': streams,
+    }
+
+
+def check(report, max_p99_ms=None, max_glitches=None):
+    """Threshold failures in a report, as messages"""
+    failures = []
+    for stream in report['streams']:
+        if 'end_to_end_p99_ms' not in stream:
+            failures.append(f"stream {stream['stream']}: nothing received")
+            continue
+        if max_p99_ms is not None and stream['end_to_end_p99_ms'] > max_p99_ms:
+            failures.append(f"stream {stream['stream']}: p99 {stream['end_to_end_p99_ms']:.1f}ms "
+                            f"> {max_p99_ms}ms")
+        if max_glitches is not None and stream['glitches'] > max_glitches:
+            failures.append(f"stream {stream['stream']}: {stream['glitches']} glitches > {max_glitches}")
+    return failures
+
+
+def main(argv=None):
+    args = parse_args(build_parser(), argv)
+    if args.streams < 1:
+        print("Need at least one stream")
+        return 1
+    with contextlib.redirect_stdout(sys.stderr):  # Keep stdout for the report
+        report = asyncio.run(run(args))
+    text = json.dumps(report, indent=1, sort_keys=True)
+    if args.report:
+        with open(args.report, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    failures = check(report, args.max_p99_ms, args.max_glitches)
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
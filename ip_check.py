@@ -1,47 +1,119 @@
 #!/usr/bin/env python3
+import argparse
+import asyncio
 import ipaddress
-import netifaces
-import subprocess
+import sys
 import time
-import os
-import socket
-from concurrent.futures import ThreadPoolExecutor
+from neighbors import NeighborTable
+
+try:
+    import netifaces
+except ImportError:  # Only needed to pick the subnet from an interface
+    netifaces = None
 
-addrs = []
 IP = "127.0.0.1"
-CLEAR_WHEN_DONE = True
 PORT = 5005  # Port to check
+PROTOCOL = 'tcp'  # 'tcp' connects; 'udp' relies on ICMP port unreachable from live hosts
+CONCURRENCY = 256  # Probes in flight at once
+RATE = 2000  # Probes started per second at most
+TIMEOUT = 1.0  # Seconds to wait for an answer
+UDP_PROBE = b'\0'
+
+async def probe_tcp(ip, port, timeout=TIMEOUT):
+    """'open', 'closed' (the host refused, so it is up), or None if nothing answered"""
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(str(ip), port), timeout)
+    except ConnectionRefusedError:
+        return 'closed'
+    except (asyncio.TimeoutError, OSError):
+        return None  # Silent, filtered or unreachable
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return 'open'
+
+class _UdpProbe(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.result = asyncio.get_running_loop().create_future()
+
+    def datagram_received(self, data, addr):
+        if not self.result.done():
+            self.result.set_result('open')
 
-def get_mac(ip):
-    """Gets the mac + name from the ARP cache"""
-    p = os.popen('arp -e ' + str(ip))
+    def error_received(self, exc):
+        # ICMP port unreachable comes back as ECONNREFUSED on a connected socket
+        if not self.result.done():
+            self.result.set_result('closed' if isinstance(exc, ConnectionRefusedError) else None)
+
+async def probe_udp(ip, port, timeout=TIMEOUT, payload=UDP_PROBE):
+    """'open' if the port answered, 'closed' if the host rejected it, None if no answer.
+
+    A UDP service that ignores the probe looks the same as a missing host,
+    so this finds hosts with the port closed or services that reply.
+    """
+    loop = asyncio.get_running_loop()
     try:
-        li = [x for x in p.readlines()[1].split(' ') if x]
-    except IndexError:
+        transport, protocol = await loop.create_datagram_endpoint(_UdpProbe, remote_addr=(str(ip), port))
+    except OSError:
         return None
-    return li[2], ('Unknown' if li[0] == str(ip) else li[0])
-
-def check_addr(ip):
-    """Check if address is reachable and port 5005 is open"""
-    if ping(str(ip)):
-        port_open = check_port(str(ip), PORT)
-        addrs.append((ip, port_open))
-
-def ping(ip):
-    """Pings an address"""
-    return subprocess.call(['ping', '-c', '1', '-W', '1', ip], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0
-
-def check_port(ip, port):
-    """Check if a port is open on the given IP"""
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.settimeout(1)  # 1-second timeout for quick scanning
     try:
-        result = sock.connect_ex((ip, port))
-        return result == 0  # Returns True if port is open
-    except socket.error:
-        return False
+        transport.sendto(payload)
+        return await asyncio.wait_for(protocol.result, timeout)
+    except asyncio.TimeoutError:
+        return None
     finally:
-        sock.close()
+        transport.close()
+
+async def scan(hosts, port=PORT, protocol=PROTOCOL, concurrency=CONCURRENCY, rate=RATE, timeout=TIMEOUT):
+    """Probe every host; yields (ip, status) for each one that answers, as it answers.
+
+    At most `concurrency` probes are in flight and at most `rate` start
+    per second, so scanning a large subnet uses a fixed number of sockets
+    and does not flood the network.
+    """
+    probe = probe_udp if protocol == 'udp' else probe_tcp
+    results = asyncio.Queue()
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run_probe(ip):
+        try:
+            status = await probe(ip, port, timeout)
+        except Exception as e:  # Unexpected failures lose only this host
+            print(f"{ip}: probe failed: {e}")
+            status = None
+        finally:
+            slots.release()
+        results.put_nowait((ip, status))
+
+    async def launch():
+        tasks = set()
+        start = time.monotonic()
+        try:
+            for n, ip in enumerate(hosts):
+                delay = start + n / rate - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await slots.acquire()
+                task = asyncio.ensure_future(run_probe(ip))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            results.put_nowait(None)  # scan() must always hear the end
+
+    launcher = asyncio.ensure_future(launch())
+    try:
+        while True:
+            item = await results.get()
+            if item is None:
+                break
+            if item[1] is not None:
+                yield item
+    finally:
+        launcher.cancel()
 
 def choose_iface():
     print("Available Interfaces:\n")
@@ -56,26 +128,61 @@ def get_addresses(iface):
     IP = addresses['addr']
     return ipaddress.ip_network(addresses['addr'] + '/' + addresses['netmask'], strict=False)
 
-def executePool(addrs):
-    print("\nPinging all addresses in subnet %s and checking port %d." % (str(addrs), PORT))
-    print("\n --------  IGNORE TEXT --------\n")
-    time.sleep(2)
-    with ThreadPoolExecutor(max_workers=len(list(addrs))) as exec:
-        exec.map(check_addr, addrs)
-    print(" --------  IGNORE TEXT --------\n")
+def print_host(addr, status, neighbors):
+    if str(addr) == IP:
+        print(f"{str(addr):<15} {'This Device':<17} {'This Device':<15} {'N/A':<10}", flush=True)
+        return
+    mac_addr, hostname = neighbors.lookup(addr)
+    print(f"{str(addr):<15} {mac_addr or 'Unknown':<17} {hostname or 'Unknown':<15} "
+          f"{status.capitalize():<10}", flush=True)
 
-if __name__ == '__main__':
-    executePool(get_addresses(choose_iface()))
-    if CLEAR_WHEN_DONE:
-        subprocess.call('clear')
-    print("%s device(s) found.\n" % len(addrs))
-    print(f"{'IP':<15} {'MAC':<17} {'Hostname':<15} {'Port 5005':<10}")
+async def scan_network(network, port=PORT, protocol=PROTOCOL, concurrency=CONCURRENCY, rate=RATE,
+                       timeout=TIMEOUT, neighbors=None):
+    """Scan a subnet, printing hosts as they answer; returns the (ip, status) list"""
+    neighbors = neighbors or NeighborTable()
+    print(f"\nScanning {network.num_addresses} addresses in {network} for {protocol.upper()} port {port}.\n")
+    print(f"{'IP':<15} {'MAC':<17} {'Hostname':<15} {f'Port {port}':<10}")
     print("-" * 60)
-    for addr, port_open in addrs:  # Unpack the tuple
-        if str(addr) == IP:
-            print(f"{str(addr):<15} {'This Device':<17} {'This Device':<15} {'N/A':<10}")
-            continue
-        mac = get_mac(addr)
-        mac_addr, hostname = mac if mac else ("Unknown", "Unknown")
-        port_status = "Open" if port_open else "Closed"
-        print(f"{str(addr):<15} {mac_addr:<17} {hostname:<15} {port_status:<10}")
+    found = []
+    rows = []
+    start = time.monotonic()
+    async for addr, status in scan(network.hosts(), port, protocol, concurrency, rate, timeout):
+        found.append((addr, status))
+        # Reverse DNS runs on worker threads so a slow name never holds up the scan
+        rows.append(asyncio.ensure_future(asyncio.to_thread(print_host, addr, status, neighbors)))
+    await asyncio.gather(*rows)
+    print(f"\n{len(found)} device(s) found in {time.monotonic() - start:.1f}s.\n")
+    try:
+        neighbors.save()
+    except OSError as e:
+        print(f"Neighbor cache not saved: {e}")
+    return found
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find devices on a subnet and check the audio port")
+    parser.add_argument('--network', metavar='CIDR', help="subnet to scan (default: pick an interface)")
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--protocol', choices=['tcp', 'udp'], default=PROTOCOL)
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY, help="probes in flight")
+    parser.add_argument('--rate', type=float, default=RATE, help="probes started per second")
+    parser.add_argument('--timeout', type=float, default=TIMEOUT, metavar='SECONDS')
+    parser.add_argument('--resolve', action=argparse.BooleanOptionalAction, default=True,
+                        help="look up hostnames with reverse DNS")
+    args = parser.parse_args(argv)
+
+    if args.network:
+        network = ipaddress.ip_network(args.network, strict=False)
+    elif netifaces is None:
+        print("Install netifaces to pick an interface, or pass --network")
+        return 1
+    else:
+        network = get_addresses(choose_iface())
+    try:
+        asyncio.run(scan_network(network, args.port, args.protocol, args.concurrency, args.rate,
+                                 args.timeout, NeighborTable(resolve_names=args.resolve)))
+    except KeyboardInterrupt:
+        print("\nScan interrupted")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,242 @@
+import heapq
+import math
+import threading
+import time
+
+# Defaults (in packets unless noted)
+MIN_DEPTH = 2
+MAX_DEPTH = 32
+JITTER_MULTIPLIER = 3.0  # Target covers this many jitter deviations
+JITTER_GAIN = 1.0 / 16   # RFC 3550 interarrival jitter smoothing
+INTERVAL_GAIN = 1.0 / 32
+TRANSIT_RISE = 1.0 / 1024  # How fast the minimum transit estimate may creep up
+
+
+class JitterBuffer:
+    """Sequence-ordered playout buffer with a jitter-driven target depth.
+
+    The receive thread calls push() with each parsed packet and the playback
+    thread calls pop() once per output frame. Packets are kept in a heap keyed
+    by sequence number so reordered packets come out in order. The target
+    depth follows the RFC 3550 interarrival jitter estimate, measured from the
+    sender timestamps, so it grows on a noisy link and shrinks on a clean one.
+
+    With playout_delay set, packets are instead released at a fixed time
+    after capture: sent_timestamp mapped onto the local clock through the
+    minimum observed transit, plus the delay. Receivers of the same sender
+    configured with the same delay then play each packet at the same moment.
+    """
+
+    def __init__(self, min_depth=MIN_DEPTH, max_depth=MAX_DEPTH,
+                 jitter_multiplier=JITTER_MULTIPLIER, playout_delay=None):
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.jitter_multiplier = jitter_multiplier
+        self.playout_delay = playout_delay
+        self._cond = threading.Condition()
+        self._reset_state()
+        self.stats = {
+            'reordered': 0,
+            'late': 0,
+            'duplicates': 0,
+            'overflow': 0,
+            'lost': 0,
+            'underruns': 0,
+        }
+
+    def _reset_state(self):
+        self._heap = []
+        self._seqs = set()
+        self._next_seq = None
+        self._highest_seq = None
+        self._primed = False
+        self._closed = False
+        self._last_transit = None
+        self._min_transit = None
+        self._last_sent = None
+        self._last_sent_seq = None
+        self.jitter = 0.0            # seconds
+        self.packet_interval = None  # seconds between consecutive packets
+        self.target_depth = self.min_depth
+
+    def reset(self):
+        """Drop everything buffered and start estimating from scratch"""
+        with self._cond:
+            closed = self._closed
+            self._reset_state()
+            self._closed = closed
+            self._cond.notify_all()
+
+    def close(self):
+        """Wake up any waiting consumer and make pop() return None"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._heap)
+
+    def _update_estimates(self, seq_num, sent_timestamp, recv_time):
+        # Transit includes an unknown clock offset, but it cancels out in the
+        # difference between consecutive packets.
+        transit = recv_time - sent_timestamp
+        if self._last_transit is not None:
+            d = abs(transit - self._last_transit)
+            self.jitter += (d - self.jitter) * JITTER_GAIN
+        self._last_transit = transit
+        if self._min_transit is None or transit < self._min_transit:
+            self._min_transit = transit
+        else:
+            self._min_transit += (transit - self._min_transit) * TRANSIT_RISE
+
+        if self._last_sent is not None and seq_num > self._last_sent_seq:
+            interval = (sent_timestamp - self._last_sent) / (seq_num - self._last_sent_seq)
+            if interval > 0:
+                if self.packet_interval is None:
+                    self.packet_interval = interval
+                else:
+                    self.packet_interval += (interval - self.packet_interval) * INTERVAL_GAIN
+        if self._last_sent_seq is None or seq_num > self._last_sent_seq:
+            self._last_sent = sent_timestamp
+            self._last_sent_seq = seq_num
+
+        if self.packet_interval:
+            if self.playout_delay is not None:
+                depth = round(self.playout_delay / self.packet_interval)
+            else:
+                depth = math.ceil(self.jitter_multiplier * self.jitter / self.packet_interval) + self.min_depth
+            self.target_depth = max(self.min_depth, min(self.max_depth, depth))
+
+    def push(self, seq_num, sent_timestamp, payload, recv_time=None, measure=True):
+        """Insert a packet; returns False if it was late or a duplicate.
+
+        Pass measure=False for packets whose arrival time says nothing about
+        the network, such as ones rebuilt from FEC parity.
+        """
+        if recv_time is None:
+            recv_time = time.perf_counter()
+        with self._cond:
+            if measure:
+                self._update_estimates(seq_num, sent_timestamp, recv_time)
+
+            if self._next_seq is not None and seq_num < self._next_seq:
+                self.stats['late'] += 1
+                return False
+            if seq_num in self._seqs:
+                self.stats['duplicates'] += 1
+                return False
+            if self._highest_seq is not None and seq_num < self._highest_seq:
+                self.stats['reordered'] += 1
+            if self._highest_seq is None or seq_num > self._highest_seq:
+                self._highest_seq = seq_num
+
+            heapq.heappush(self._heap, (seq_num, sent_timestamp, payload))
+            self._seqs.add(seq_num)
+
+            # Shed the oldest packets only when far beyond what jitter needs
+            while len(self._heap) > self.max_depth:
+                old_seq, _, _ = heapq.heappop(self._heap)
+                self._seqs.discard(old_seq)
+                self._next_seq = old_seq + 1
+                self.stats['overflow'] += 1
+
+            if not self._primed and len(self._heap) >= self.target_depth:
+                self._primed = True
+            self._cond.notify()
+            return True
+
+    def pop(self, timeout=1.0):
+        """Return the next (seq_num, sent_timestamp, payload) in sequence order.
+
+        A lost packet is returned as (seq_num, None, None) once enough later
+        packets are queued that waiting for it would only add delay. Returns
+        None on timeout, underrun or close.
+        """
+        if self.playout_delay is not None:
+            return self._pop_scheduled(timeout)
+        deadline = time.perf_counter() + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    return None
+
+                if self._primed and self._heap:
+                    seq_num, sent_timestamp, payload = self._heap[0]
+                    if self._next_seq is None or seq_num <= self._next_seq:
+                        heapq.heappop(self._heap)
+                        self._seqs.discard(seq_num)
+                        self._next_seq = seq_num + 1
+                        return seq_num, sent_timestamp, payload
+                    if len(self._heap) >= self.target_depth:
+                        # Gap at the head and enough queued behind it: give up on it
+                        missing = self._next_seq
+                        self._next_seq += 1
+                        self.stats['lost'] += 1
+                        return missing, None, None
+                elif self._primed:
+                    # Ran dry: refill to the target depth before resuming
+                    self._primed = False
+                    self.stats['underruns'] += 1
+                    return None
+
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    if self._primed and self._heap:
+                        # Waited a full timeout for the missing packet
+                        missing = self._next_seq
+                        self._next_seq += 1
+                        self.stats['lost'] += 1
+                        return missing, None, None
+                    return None
+                self._cond.wait(remaining)
+
+    def _due(self, sent_timestamp):
+        """Local time at which a packet captured at sent_timestamp should play"""
+        return sent_timestamp + self._min_transit + self.playout_delay
+
+    def _pop_scheduled(self, timeout):
+        """pop() for synchronized playout: release packets at their due time.
+
+        Waits past the timeout for a queued packet that is not due yet, so
+        the caller never fills a slot that real audio is about to occupy.
+        """
+        deadline = time.perf_counter() + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    return None
+
+                now = time.perf_counter()
+                if not self._heap:
+                    if now >= deadline:
+                        if self._next_seq is not None:
+                            self.stats['underruns'] += 1
+                        return None
+                    self._cond.wait(deadline - now)
+                    continue
+
+                seq_num, sent_timestamp, payload = self._heap[0]
+                interval = self.packet_interval or 0.0
+                if self._next_seq is None or seq_num <= self._next_seq:
+                    due = self._due(sent_timestamp)
+                    if now >= due:
+                        heapq.heappop(self._heap)
+                        self._seqs.discard(seq_num)
+                        self._next_seq = seq_num + 1
+                        if now > due + self.playout_delay:
+                            # Hopelessly behind schedule: skip rather than play out of sync
+                            self.stats['late'] += 1
+                            return seq_num, None, None
+                        return seq_num, sent_timestamp, payload
+                    wake = due
+                else:
+                    # The missing packet's slot comes just before the head's
+                    due = self._due(sent_timestamp) - (seq_num - self._next_seq) * interval
+                    if now >= due:
+                        missing = self._next_seq
+                        self._next_seq += 1
+                        self.stats['lost'] += 1
+                        return missing, None, None
+                    wake = due
+                self._cond.wait(max(0.0, wake - now))
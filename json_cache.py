@@ -0,0 +1,40 @@
+import json
+import os
+
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'musync')
+
+
+def cache_path(name):
+    """Default location of the cache file `name`"""
+    return os.path.join(CACHE_DIR, name)
+
+
+def load(path, version, key):
+    """The `key` section of a versioned JSON cache file; {} when missing, unreadable or stale"""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}  # Missing or unreadable: start over
+    if not isinstance(data, dict) or data.get('version') != version:
+        return {}
+    return data.get(key, {})
+
+
+def save(path, version, key, value):
+    """Write the cache file atomically, so readers never see half a file"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump({'version': version, key: value}, f, indent=1)
+    os.replace(tmp, path)
+
+
+def writable(path):
+    """Whether save() can write path, so what is cached now is there next run"""
+    directory = os.path.dirname(path) or '.'
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError:
+        return False
+    return os.access(directory, os.W_OK)
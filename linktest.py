@@ -0,0 +1,184 @@
+import json
+import math
+import struct
+import time
+import numpy as np
+
+# UDP link test: the client sends numbered, timestamped datagrams at a fixed
+# rate and size (an audio stream's packet profile), then an END; the server
+# answers the END with a JSON report of what arrived.
+#
+#   probe   PROBE header, padded to the packet size
+#   end     END (packets sent, buffer budget in seconds for late counting)
+#   report  REPORT_MAGIC + JSON
+PROBE = struct.Struct('<4sIId')   # magic, session, seq, send time (client's monotonic clock)
+END = struct.Struct('<4sIIf')     # magic, session, packets sent, playout budget seconds
+PROBE_MAGIC = b'LTST'
+END_MAGIC = b'LEND'
+REPORT_MAGIC = b'LRPT'
+PERCENTILES = (50, 95, 99, 99.9)
+SKEW_WINDOW = 1.0        # Seconds per window when estimating clock skew from minimum transit
+SESSION_TIMEOUT = 60.0   # Seconds without packets before the server forgets a session
+
+
+def pack_end(session, sent, budget):
+    return END.pack(END_MAGIC, session, sent, budget)
+
+
+def make_report_message(report):
+    return REPORT_MAGIC + json.dumps(report).encode()
+
+
+def parse_report(data):
+    if not data.startswith(REPORT_MAGIC):
+        return None
+    try:
+        return json.loads(data[len(REPORT_MAGIC):])
+    except ValueError:
+        return None
+
+
+def percentiles(values, scale=1000):
+    """p50..p99.9 and max of values (seconds), in ms"""
+    if len(values) == 0:
+        return None
+    points = np.percentile(values, PERCENTILES) * scale
+    result = {f"p{p:g}": float(v) for p, v in zip(PERCENTILES, points)}
+    result['max'] = float(np.max(values) * scale)
+    return result
+
+
+def remove_skew(sent, transit):
+    """Transit with the clocks' rate difference taken out.
+
+    The two hosts' clocks run at slightly different rates, which shows up
+    as a slope in transit time (50 ppm is 3 ms a minute). The slope is
+    fitted to each window's minimum transit, the least queued packets.
+    """
+    if sent[-1] - sent[0] < 4 * SKEW_WINDOW:
+        return transit
+    windows = ((sent - sent[0]) // SKEW_WINDOW).astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, windows[1:] != windows[:-1]])
+    mins = np.minimum.reduceat(transit, starts)
+    at = np.array([sent[s:e][np.argmin(transit[s:e])]
+                   for s, e in zip(starts, np.r_[starts[1:], len(sent)])])
+    slope = np.polyfit(at - sent[0], mins, 1)[0]
+    return transit - slope * (sent - sent[0])
+
+
+class LinkStats:
+    """What arrived of one client's probe run"""
+
+    def __init__(self, session, packet_size):
+        self.session = session
+        self.packet_size = packet_size
+        self.seqs = []
+        self.seen = set()
+        self.sent = []
+        self.received = []
+        self.highest = -1
+        self.reordered = 0
+        self.max_displacement = 0
+        self.last_seen = time.monotonic()
+        self.report = None  # Kept to answer repeated ENDs
+
+    def add(self, seq, sent, received):
+        self.last_seen = time.monotonic()
+        if seq in self.seen:
+            pass  # Duplicates are counted from seqs in summarize()
+        elif seq < self.highest:
+            self.reordered += 1
+            self.max_displacement = max(self.max_displacement, self.highest - seq)
+        else:
+            self.highest = seq
+        self.seen.add(seq)
+        self.seqs.append(seq)
+        self.sent.append(sent)
+        self.received.append(received)
+
+    def summarize(self, total, budget=0.0):
+        """Loss, reordering, jitter and delay variation over the run"""
+        seqs = np.array(self.seqs, dtype=np.int64)
+        unique, first = np.unique(seqs, return_index=True)
+        duplicates = len(seqs) - len(unique)
+        sent = np.array(self.sent)[first]   # In sequence order, first copy of each
+        received = np.array(self.received)[first]
+        lost = max(total - len(unique), 0)
+        report = {
+            'sent': total,
+            'received': int(len(unique)),
+            'lost': lost,
+            'loss_percent': lost / total * 100 if total else 0.0,
+            'duplicates': int(duplicates),
+            'reordered': self.reordered,
+            'reorder_percent': self.reordered / len(seqs) * 100 if len(seqs) else 0.0,
+            'max_reorder_distance': self.max_displacement,
+        }
+        if len(unique) < 2:
+            return report
+        transit = remove_skew(sent, received - sent)
+        # RFC 3550 interarrival jitter, in arrival order
+        order = np.argsort(received, kind='stable')
+        jitter = 0.0
+        for d in np.abs(np.diff(transit[order])):
+            jitter += (d - jitter) / 16
+        consecutive = np.flatnonzero(np.diff(unique) == 1)
+        ipdv = np.abs(transit[consecutive + 1] - transit[consecutive])  # RFC 5481 IPDV
+        pdv = transit - transit.min()                                   # RFC 5481 PDV
+        duration = received.max() - received.min()
+        report.update({
+            'duration_s': float(sent[-1] - sent[0]),
+            'throughput_mbps': float(len(unique) * self.packet_size * 8 / duration / 1e6) if duration else 0.0,
+            'jitter_ms': float(jitter * 1000),
+            'ipdv_ms': percentiles(ipdv),
+            'pdv_ms': percentiles(pdv),
+        })
+        if budget:
+            late = int(np.count_nonzero(pdv > budget))
+            report['budget_ms'] = budget * 1000
+            report['late'] = late
+            report['late_percent'] = late / total * 100 if total else 0.0
+        return report
+
+
+class LinkTestServer:
+    """Receiving side of the UDP link test: datagram in, optional reply out"""
+
+    def __init__(self):
+        self.sessions = {}
+
+    def handle(self, data, addr, now):
+        magic = data[:4]
+        if magic == PROBE_MAGIC and len(data) >= PROBE.size:
+            _, session, seq, sent = PROBE.unpack_from(data)
+            stats = self.sessions.get((addr, session))
+            if stats is None:
+                stats = self.sessions[(addr, session)] = LinkStats(session, len(data))
+                print(f"UDP link test from {addr[0]}:{addr[1]} ({len(data)} byte datagrams)")
+            stats.add(seq, sent, now)
+        elif magic == END_MAGIC and len(data) >= END.size:
+            _, session, total, budget = END.unpack_from(data)
+            stats = self.sessions.get((addr, session))
+            if stats is None:
+                return make_report_message({'sent': total, 'received': 0, 'lost': total,
+                                            'loss_percent': 100.0 if total else 0.0})
+            if stats.report is None:
+                stats.report = stats.summarize(total, budget)
+                print(f"UDP link test from {addr[0]}: {stats.report['received']}/{total} received, "
+                      f"{stats.report['loss_percent']:.2f}% loss")
+            return make_report_message(stats.report)
+        return None
+
+    def expire(self):
+        now = time.monotonic()
+        for key, stats in list(self.sessions.items()):
+            if now - stats.last_seen > SESSION_TIMEOUT:
+                del self.sessions[key]
+
+
+def recommended_depth(report, interval):
+    """Jitter buffer depth (packets) that would have covered p99.9 delay variation"""
+    pdv = report.get('pdv_ms')
+    if not pdv:
+        return None
+    return max(1, math.ceil(pdv['p99.9'] / 1000 / interval))
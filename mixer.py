@@ -0,0 +1,198 @@
+import threading
+import numpy as np
+from drift import Resampler
+from ring_buffer import RingBuffer
+from protocol import StreamFormat, SAMPLE_INT16
+from codec import CODEC_PCM
+
+MAX_INPUTS = 16
+INPUT_BLOCKS = 2        # Blocks an input may queue ahead of the mix; bounds the added latency
+LIMIT = 32000.0         # Peak the limiter holds the mix under (int16 full scale is 32767)
+LIMITER_RELEASE = 0.05  # Fraction of the way back to unity gain per block once peaks pass
+
+
+class MixerInput:
+    """Sink for one stream's pipeline; feeds that stream into the mix.
+
+    write() converts to the mix format and blocks while this input is more
+    than INPUT_BLOCKS ahead of the mixer, so every pipeline is paced by the
+    one output clock instead of its own device.
+    """
+
+    def __init__(self, mixer, key, gain=1.0):
+        self.mixer = mixer
+        self.key = key
+        self.gain = gain
+        self.underruns = 0
+        self.ring = RingBuffer(mixer.frames * (INPUT_BLOCKS + 1), mixer.channels, mixer.rate)
+        self._room = threading.Event()
+        self._format = None
+        self._resampler = None
+        self._closed = False
+
+    def open(self, fmt):
+        self._format = fmt
+        self._resampler = Resampler(fmt.channels) if fmt.rate != self.mixer.rate else None
+
+    def write(self, data):
+        fmt = self._format
+        if self._resampler is not None:
+            data = self._resampler.process(data, fmt.rate / self.mixer.rate)
+        frames = np.frombuffer(data, dtype=np.int16).reshape(-1, fmt.channels)
+
+        # Map channels onto the mix layout
+        channels = self.mixer.channels
+        if fmt.channels == 1 and channels > 1:
+            frames = np.broadcast_to(frames, (len(frames), channels))
+        elif channels == 1 and fmt.channels > 1:
+            frames = frames.mean(axis=1, keepdims=True)
+        elif fmt.channels > channels:
+            frames = frames[:, :channels]
+        elif fmt.channels < channels:
+            frames = np.pad(frames, ((0, 0), (0, channels - fmt.channels)))
+
+        # A block at a time: a packet can be larger than the whole ring (2048 frames
+        # into a 3 x 512 ring), and the mixer only drains whole blocks
+        step = self.mixer.frames
+        for start in range(0, len(frames), step):
+            piece = frames[start:start + step]
+            limit = self.ring.capacity - len(piece)
+            while self.ring.available() > limit and not self._closed:
+                self._room.wait(0.1)
+                self._room.clear()
+            if self._closed:
+                return
+            self.ring.write(piece)
+
+    def latency(self):
+        """Seconds until audio written now would be heard: queued here, then in the output"""
+        return self.ring.available() / self.mixer.rate + self.mixer.latency()
+
+    def close(self):
+        self._closed = True
+        self._room.set()
+        self.mixer.remove_input(self.key, self)
+
+
+class Mixer:
+    """Mixes any number of streams into one output on a common clock.
+
+    Every block, each input with a full block queued is copied into a row
+    of a preallocated (inputs, samples) matrix and the whole mix is one
+    gain-vector product, so the cost grows by a memcpy per stream rather
+    than by Python-level arithmetic. A peak limiter ramps the gain down
+    across a block when the sum would clip and eases it back afterwards;
+    a final hard clip catches what the ramp lets through.
+    """
+
+    def __init__(self, sink, rate=48000, channels=2, frames=512, max_inputs=MAX_INPUTS):
+        self.sink = sink
+        self.rate = rate
+        self.channels = channels
+        self.frames = frames
+        self.max_inputs = max_inputs
+        self.inputs = {}
+        self.limiting = 0  # Blocks in which the limiter reduced gain
+        self.running = False
+        self._lock = threading.Lock()
+        self._thread = None
+        samples = frames * channels
+        self._stack = np.zeros((max_inputs, frames, channels), dtype=np.float32)
+        self._weights = np.zeros(max_inputs, dtype=np.float32)
+        self._mix = np.empty(samples, dtype=np.float32)
+        self._gain_ramp = np.empty(samples, dtype=np.float32)
+        self._ramp = np.repeat(np.arange(1, frames + 1, dtype=np.float32) / frames, channels)
+        self._out = np.empty(samples, dtype=np.int16)
+        self._out_bytes = memoryview(self._out).cast('B')
+        self._gain = 1.0
+
+    @property
+    def format(self):
+        return StreamFormat(self.rate, self.channels, SAMPLE_INT16, CODEC_PCM, self.frames)
+
+    def add_input(self, key, gain=1.0):
+        """New input for a stream; use it as that stream's sink"""
+        with self._lock:
+            if len(self.inputs) >= self.max_inputs:
+                raise RuntimeError(f"Mixer is full ({self.max_inputs} inputs)")
+            mixer_input = MixerInput(self, key, gain)
+            self.inputs[key] = mixer_input
+        return mixer_input
+
+    def remove_input(self, key, mixer_input=None):
+        """Drop key's input; given mixer_input, only while that one is still key's input"""
+        with self._lock:
+            if mixer_input is None or self.inputs.get(key) is mixer_input:
+                self.inputs.pop(key, None)
+
+    def latency(self):
+        """Seconds the output sink holds, as the sink reports it"""
+        sink_latency = getattr(self.sink, 'latency', None)
+        return sink_latency() if sink_latency else 0.0
+
+    def set_gain(self, key, gain):
+        mixer_input = self.inputs.get(key)
+        if mixer_input is not None:
+            mixer_input.gain = gain
+
+    def mix_block(self):
+        """Mix one block from every input that has one; returns int16 bytes"""
+        with self._lock:
+            inputs = list(self.inputs.values())
+        count = len(inputs)
+        for i, mixer_input in enumerate(inputs):
+            if mixer_input.ring.read_into(self._stack[i]) is None:
+                mixer_input.underruns += 1
+                self._weights[i] = 0.0  # Not enough queued: silent this block
+            else:
+                self._weights[i] = mixer_input.gain
+                mixer_input._room.set()
+
+        mix = self._mix
+        if count:
+            np.dot(self._weights[:count], self._stack[:count].reshape(count, -1), out=mix)
+        else:
+            mix.fill(0.0)
+
+        # Peak limiter: ramp from the last block's gain to what this block needs
+        peak = max(float(mix.max()), -float(mix.min()))
+        needed = min(1.0, LIMIT / peak) if peak > 0 else 1.0
+        if needed < self._gain:
+            target = needed
+            self.limiting += 1
+        else:
+            target = min(needed, self._gain + (1.0 - self._gain) * LIMITER_RELEASE)
+            if target > 0.999:
+                target = 1.0
+        if target != 1.0 or self._gain != 1.0:
+            np.multiply(self._ramp, target - self._gain, out=self._gain_ramp)
+            self._gain_ramp += self._gain
+            mix *= self._gain_ramp
+        if peak * max(target, self._gain) > 32767:
+            np.clip(mix, -32768, 32767, out=mix)  # Only the start of an attack gets here
+        self._gain = target
+
+        np.copyto(self._out, mix, casting='unsafe')
+        return self._out_bytes
+
+    def run(self):
+        """Mixing loop; the sink's blocking write() is the playout clock"""
+        self.sink.open(self.format)
+        try:
+            while self.running:
+                self.sink.write(self.mix_block())
+        except Exception as e:
+            print(f"Mixer error: {e}")
+        finally:
+            self.sink.close()
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
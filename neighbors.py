@@ -0,0 +1,157 @@
+import re
+import socket
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+import json_cache
+
+ARP_TABLE = '/proc/net/arp'
+CACHE_PATH = json_cache.cache_path('neighbors.json')
+TTL = 600.0                # Seconds a cached MAC or hostname is trusted across runs
+REREAD_INTERVAL = 1.0      # Re-read the ARP table on a miss at most this often (hosts answering mid-scan)
+RESOLVE_CONCURRENCY = 32   # Reverse DNS lookups in flight
+RESOLVE_TIMEOUT = 2.0      # Seconds to wait for a batch of reverse lookups
+CACHE_VERSION = 1
+
+_ARP_LINE = re.compile(r'\(?(\d+\.\d+\.\d+\.\d+)\)?\s+(?:at\s+)?([0-9a-fA-F]{1,2}(?:[:-][0-9a-fA-F]{1,2}){5})')
+
+
+def normalize_mac(mac):
+    return ':'.join(part.zfill(2) for part in re.split('[:-]', mac.lower()))
+
+
+def read_arp_table(path=ARP_TABLE):
+    """{ip: mac} for every complete entry in the kernel's neighbor table.
+
+    Linux exposes the table as a file; elsewhere one `arp -an` is run
+    (no shell) and its output parsed.
+    """
+    table = {}
+    try:
+        with open(path) as f:
+            next(f, None)  # Header
+            for line in f:
+                fields = line.split()
+                # IP address, HW type, Flags, HW address, Mask, Device; flags 0x0 = incomplete
+                if len(fields) >= 4 and fields[2] != '0x0' and fields[3] != '00:00:00:00:00:00':
+                    table[fields[0]] = fields[3].lower()
+        return table
+    except OSError:
+        pass
+    try:
+        output = subprocess.run(['arp', '-an'], capture_output=True, text=True, timeout=5).stdout
+    except (OSError, subprocess.SubprocessError):
+        return table
+    for ip, mac in _ARP_LINE.findall(output):
+        table[ip] = normalize_mac(mac)
+    return table
+
+
+def reverse_name(ip):
+    """Hostname from reverse DNS, or '' when there is none"""
+    try:
+        return socket.gethostbyaddr(str(ip))[0]
+    except (OSError, UnicodeError):
+        return ''
+
+
+class NeighborTable:
+    """MAC addresses and hostnames of LAN hosts, remembered on disk.
+
+    MACs come from the kernel ARP table, read once and re-read only when
+    a host is missing from it (at most every REREAD_INTERVAL). Hostnames
+    come from reverse DNS, resolved concurrently by lookup_many(). Both
+    are cached with a TTL, so printing hundreds of hosts again costs a
+    file read rather than a process or a DNS query per host.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=TTL, resolve_names=True):
+        self.path = path
+        self.ttl = ttl
+        self.resolve_names = resolve_names
+        self._entries = json_cache.load(path, CACHE_VERSION, 'hosts')
+        self._arp = {}
+        self._read_at = None
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    def save(self):
+        """Write the cache without expired entries"""
+        if not self._dirty:
+            return
+        now = time.time()
+        with self._lock:
+            hosts = {ip: entry for ip, entry in self._entries.items()
+                     if now - max(entry.get('mac_seen', 0), entry.get('name_seen', 0)) < self.ttl}
+        json_cache.save(self.path, CACHE_VERSION, 'hosts', hosts)
+        self._dirty = False
+
+    def refresh(self):
+        """Read the ARP table now"""
+        arp = read_arp_table()
+        now = time.time()
+        with self._lock:
+            self._arp = arp
+            self._read_at = time.monotonic()
+            for ip, mac in arp.items():
+                entry = self._entries.setdefault(ip, {})
+                entry['mac'], entry['mac_seen'] = mac, now
+            self._dirty = True
+
+    def _fresh(self, entry, field):
+        return field in entry and time.time() - entry.get(field + '_seen', 0) < self.ttl
+
+    def mac(self, ip):
+        ip = str(ip)
+        if self._read_at is None or (ip not in self._arp and
+                                     time.monotonic() - self._read_at > REREAD_INTERVAL):
+            self.refresh()
+        if ip in self._arp:
+            return self._arp[ip]
+        entry = self._entries.get(ip, {})
+        return entry['mac'] if self._fresh(entry, 'mac') else None
+
+    def _cached_name(self, ip):
+        entry = self._entries.get(ip, {})
+        return (entry['name'] or None) if self._fresh(entry, 'name') else None
+
+    def name(self, ip):
+        """Cached or freshly resolved hostname; None when unknown"""
+        ip = str(ip)
+        if self._fresh(self._entries.get(ip, {}), 'name'):
+            return self._cached_name(ip)
+        if not self.resolve_names:
+            return None
+        name = reverse_name(ip)
+        self._remember_name(ip, name)
+        return name or None
+
+    def _remember_name(self, ip, name):
+        with self._lock:
+            entry = self._entries.setdefault(ip, {})
+            entry['name'], entry['name_seen'] = name, time.time()  # '' remembers "no PTR record"
+            self._dirty = True
+
+    def lookup(self, ip):
+        """(mac, hostname) for one host, either None when unknown"""
+        return self.mac(ip), self.name(ip)
+
+    def lookup_many(self, ips, concurrency=RESOLVE_CONCURRENCY, timeout=RESOLVE_TIMEOUT):
+        """{ip: (mac, hostname)} for many hosts: one ARP read, uncached names resolved in parallel.
+
+        Names still unresolved after `timeout` come back as None and are
+        not cached, so a slow DNS server costs one timeout per batch.
+        """
+        ips = [str(ip) for ip in ips]
+        for ip in ips:
+            self.mac(ip)  # Reads the table at most once per REREAD_INTERVAL
+        pending = [ip for ip in ips if not self._fresh(self._entries.get(ip, {}), 'name')]
+        if self.resolve_names and pending:
+            pool = ThreadPoolExecutor(min(concurrency, len(pending)))
+            futures = {pool.submit(reverse_name, ip): ip for ip in pending}
+            done, _ = wait(futures, timeout)
+            for future in done:
+                self._remember_name(futures[future], future.result())
+            pool.shutdown(wait=False, cancel_futures=True)
+        return {ip: (self.mac(ip), self._cached_name(ip)) for ip in ips}
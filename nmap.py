@@ -1,80 +1,51 @@
 #!/usr/bin/env python3
-import ipaddress
-import netifaces
-import subprocess
-import time
-import os
-import socket
-from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import sys
+from discovery import discover, pick_receiver, DISCOVERY_GROUP, DISCOVERY_TIMEOUT
+from neighbors import NeighborTable
 
-receivers = []
-IP = "127.0.0.1"
-CLEAR_WHEN_DONE = True
-DISCOVERY_PORT = 5006
-DISCOVERY_MESSAGE = b"DISCOVER_AUDIO_RECEIVER"
-DISCOVERY_RESPONSE = b"AUDIO_RECEIVER_ACTIVE"
-DISCOVERY_TIMEOUT = 1.5  # Increased timeout for reliability
+def print_receivers(receivers, neighbors):
+    best = pick_receiver(receivers)
+    # The receivers' answers put them in the ARP table: one read covers every row
+    macs = neighbors.lookup_many(r['ip'] for r in receivers)
+    print(f"{'IP':<15} {'Port':<6} {'Name':<16} {'MAC':<17} {'Streams':<8} {'RTT':>7}  Formats")
+    print("-" * 90)
+    for r in sorted(receivers, key=lambda r: r['ip']):
+        mac = macs[r['ip']][0]
+        formats = ', '.join(f"{f['rate']}Hz/{f['channels']}ch {f['codec']}" for f in r.get('formats', []))
+        streams = f"{r.get('streams', 0)}/{r.get('max_streams', '?')}"
+        print(f"{r['ip']:<15} {r.get('port', '?')!s:<6} {r.get('name', '?')[:16]:<16} "
+              f"{mac or 'Unknown':<17} {streams:<8} {r['rtt_ms']:>5.0f}ms  "
+              f"{formats or '-'}{'  <- least loaded' if r is best and len(receivers) > 1 else ''}")
 
-def get_mac(ip):
-    """Gets the MAC address and hostname from the ARP cache"""
-    try:
-        # Ensure ARP cache is populated by pinging first
-        ping_cmd = ['ping', '-n', '1', ip] if os.name == 'nt' else ['ping', '-c', '1', ip]
-        subprocess.call(ping_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        p = os.popen('arp -e ' + str(ip))
-        lines = p.readlines()
-        if len(lines) < 2:
-            return None
-        li = [x for x in lines[1].split(' ') if x]
-        return li[2], ('Unknown' if li[0] == str(ip) else li[0])
-    except (IndexError, OSError):
-        return None
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find audio receivers on the LAN with one discovery query")
+    parser.add_argument('--timeout', type=float, default=DISCOVERY_TIMEOUT, metavar='SECONDS',
+                        help="how long to collect answers")
+    parser.add_argument('--host', action='append', default=[], metavar='IP',
+                        help="also query this address directly (repeatable; e.g. across a router)")
+    parser.add_argument('--group', default=DISCOVERY_GROUP, help="multicast group to query")
+    parser.add_argument('--no-multicast', dest='group', action='store_const', const=None)
+    parser.add_argument('--broadcast', action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument('--json', action='store_true', help="print the answers as JSON")
+    args = parser.parse_args(argv)
 
-def check_receiver(ip):
-    """Check if the device responds to a discovery packet on DISCOVERY_PORT"""
-    try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.settimeout(DISCOVERY_TIMEOUT)
-        sock.sendto(DISCOVERY_MESSAGE, (str(ip), DISCOVERY_PORT))
-        data, _ = sock.recvfrom(1024)
-        sock.close()
-        if data == DISCOVERY_RESPONSE:
-            print(f"{ip}: Receiver awake on port 5005 (UDP discovery)")
-            return True
-        print(f"{ip}: No receiver response (UDP)")
-        return False
-    except (socket.timeout, socket.error) as e:
-        sock.close()
-        print(f"{ip}: No receiver response (UDP, error: {e})")
-        return False
-
-def check_addr(ip):
-    """Check if address is reachable and running the receiver"""
-    if ipaddress.ip_address(ip).is_loopback:
-        print(f"{ip}: Skipped (loopback address)")
-        receivers.append((ip, False))
-        return
-    if ping(str(ip)):
-        is_receiver = check_receiver(ip)
-        receivers.append((ip, is_receiver))
-    else:
-        print(f"{ip}: Not reachable (ping failed)")
-        receivers.append((ip, False))
-
-def ping(ip):
-    """Pings an address"""
-    ping_cmd = ['ping', '-n', '1', ip] if os.name == 'nt' else ['ping', '-c', '1', ip]
-    return subprocess.call(ping_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0
-
-def choose_iface():
-    """Prompt user to choose a network interface"""
-    print("Available Interfaces:\n")
-    ifaces = netifaces.interfaces()
-    for n, x in enumerate(ifaces):
+    receivers = discover(args.timeout, group=args.group, broadcast=args.broadcast, hosts=args.host)
+    if args.json:
+        print(json.dumps(receivers, indent=1))
+    elif receivers:
+        # Receivers advertise their own name, so reverse DNS isn't needed
+        neighbors = NeighborTable(resolve_names=False)
+        print_receivers(receivers, neighbors)
         try:
-            addr = netifaces.ifaddresses(x).get(netifaces.AF_INET, [{}])[0].get('addr', 'No IP')
-            print(f'{n}: {x} ({addr})')
-        except:
-            print(f'{n}: {x性命
+            neighbors.save()
+        except OSError as e:
+            print(f"Neighbor cache not saved: {e}")
+        print(f"\n{len(receivers)} receiver(s) found.")
+    else:
+        print("No receivers answered.")
+    return 0 if receivers else 1
 
-System: * Today's date and time is 12:16 AM IST on Tuesday, July 15, 2025.
+if __name__ == '__main__':
+    sys.exit(main())
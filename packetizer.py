@@ -0,0 +1,66 @@
+import numpy as np
+from protocol import (pack_header_into, update_header_into, StreamFormat, HEADER_SIZE,
+                      SAMPLE_INT16, FLAG_PARITY)
+from codec import CODEC_PCM
+
+FULL_SCALE = np.float32(32767)  # float32 scalar keeps the multiply in float32
+MIN_SAMPLE = np.float32(-32768)
+
+
+class Packetizer:
+    """Turns float32 capture blocks into (header, payload) buffer pairs.
+
+    Conversion and header packing write into buffers allocated once, and
+    with the PCM codec the payload is a view of the int16 scratch array, so
+    a packet costs no sample-sized allocations. The header's format fields
+    are packed once per block size; each packet only rewrites its sequence
+    number and timestamp. The buffers are reused by the next call: send (or
+    copy) them before packetizing again.
+    """
+
+    def __init__(self, rate, channels, encoder, fec_encoder=None):
+        self.rate = rate
+        self.channels = channels
+        self.encoder = encoder
+        self.fec_encoder = fec_encoder
+        self.sequence_number = 0
+        self._header = bytearray(HEADER_SIZE)
+        self._parity_header = bytearray(HEADER_SIZE)
+        self._frames = None
+
+    def _allocate(self, frames):
+        self._frames = frames
+        self._scratch = np.empty((frames, self.channels), dtype=np.float32)
+        self._pcm = np.empty((frames, self.channels), dtype=np.int16)
+        self.format = StreamFormat(self.rate, self.channels, SAMPLE_INT16,
+                                   self.encoder.codec_id, frames)
+        pack_header_into(self._header, 0, 0.0, self.format)
+        # PCM needs no encoding: the payload is the int16 array itself
+        self._pcm_payload = memoryview(self._pcm).cast('B') if self.encoder.codec_id == CODEC_PCM else None
+
+    def packetize(self, block, timestamp):
+        """Returns a list of packets, each a list of buffers to send back to back"""
+        if len(block) != self._frames:
+            self._allocate(len(block))
+
+        # float32 [-1, 1] to int16, truncating like astype() did; clipped first,
+        # since anything past full scale would wrap to the opposite rail
+        np.multiply(block, FULL_SCALE, out=self._scratch)
+        np.minimum(self._scratch, FULL_SCALE, out=self._scratch)
+        np.maximum(self._scratch, MIN_SAMPLE, out=self._scratch)
+        np.copyto(self._pcm, self._scratch, casting='unsafe')
+
+        seq_num = self.sequence_number
+        self.sequence_number += 1
+        payload = self._pcm_payload or self.encoder.encode(self._pcm)
+        update_header_into(self._header, seq_num, timestamp)
+        packets = [[self._header, payload]]
+
+        # Parity packets reuse the first covered sequence number, flagged
+        if self.fec_encoder:
+            parity = self.fec_encoder.add(seq_num, timestamp, self._frames, payload)
+            if parity:
+                first_seq, parity_payload = parity
+                pack_header_into(self._parity_header, first_seq, timestamp, self.format, FLAG_PARITY)
+                packets.append([self._parity_header, parity_payload])
+        return packets
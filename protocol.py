@@ -0,0 +1,90 @@
+import struct
+from collections import namedtuple
+
+# Versioned in-band packet header. Every audio packet describes its own
+# format so the receiver can follow the sender without any configuration.
+#
+#   magic      2s  b'MS'
+#   version    B
+#   flags      B
+#   rate       I   sample rate in Hz
+#   channels   B
+#   format     B   decoded sample format code, see SAMPLE_FORMATS
+#   codec      B   payload codec id, see codec.py
+#   frames     H   frames per packet
+#   seq        Q   sequence number
+#   timestamp  d   sender time.perf_counter() at capture
+MAGIC = b'MS'
+VERSION = 2
+HEADER = struct.Struct('<2sBBIBBBHQd')
+HEADER_SIZE = HEADER.size
+SEQ_TIMESTAMP = struct.Struct('<Qd')  # The per-packet tail of the header
+SEQ_TIMESTAMP_OFFSET = HEADER_SIZE - SEQ_TIMESTAMP.size
+
+FLAG_PARITY = 0x01  # FEC parity packet; seq is the first data packet it covers
+
+SAMPLE_INT16 = 1
+SAMPLE_FORMATS = {
+    SAMPLE_INT16: 2,  # bytes per sample
+}
+
+StreamFormat = namedtuple('StreamFormat', ['rate', 'channels', 'sample_format', 'codec', 'frames'])
+Packet = namedtuple('Packet', ['seq_num', 'timestamp', 'format', 'flags', 'payload'])
+
+
+def pack_header(seq_num, timestamp, fmt, flags=0):
+    """Build the header for one audio packet"""
+    return HEADER.pack(MAGIC, VERSION, flags, fmt.rate, fmt.channels,
+                       fmt.sample_format, fmt.codec, fmt.frames, seq_num, timestamp)
+
+
+def pack_header_into(buffer, seq_num, timestamp, fmt, flags=0):
+    """Write the header into the start of a reusable buffer"""
+    HEADER.pack_into(buffer, 0, MAGIC, VERSION, flags, fmt.rate, fmt.channels,
+                     fmt.sample_format, fmt.codec, fmt.frames, seq_num, timestamp)
+
+
+def update_header_into(buffer, seq_num, timestamp):
+    """Rewrite only the sequence number and timestamp of a packed header"""
+    SEQ_TIMESTAMP.pack_into(buffer, SEQ_TIMESTAMP_OFFSET, seq_num, timestamp)
+
+
+def parse_packet(packet):
+    """Split a packet into header fields and payload; None if it is not ours.
+
+    Accepts bytes or a memoryview; with a memoryview the payload is a view
+    into the same memory, not a copy.
+    """
+    if len(packet) < HEADER_SIZE:
+        return None
+    magic, version, flags, rate, channels, sample_format, codec, frames, seq_num, timestamp = \
+        HEADER.unpack_from(packet)
+    if magic != MAGIC or version != VERSION:
+        return None
+    if sample_format not in SAMPLE_FORMATS or not rate or not channels:
+        return None
+    fmt = StreamFormat(rate, channels, sample_format, codec, frames)
+    return Packet(seq_num, timestamp, fmt, flags, packet[HEADER_SIZE:])
+
+
+def same_output(a, b):
+    """True if two formats can be played on the same output stream"""
+    return a is not None and b is not None and a[:3] == b[:3]
+
+
+def same_decoder(a, b):
+    """True if packets in both formats can go through the same decoder"""
+    return a is not None and b is not None and a[:4] == b[:4]
+
+
+def frame_bytes(fmt):
+    """Bytes of decoded PCM for one packet in this format"""
+    return fmt.frames * fmt.channels * SAMPLE_FORMATS[fmt.sample_format]
+
+
+# Control channel: receivers send these from their audio socket to the
+# sender's CONTROL_PORT, so the sender learns where to stream to.
+CONTROL_PORT = 5007
+JOIN_MESSAGE = b"JOIN_AUDIO_STREAM"
+LEAVE_MESSAGE = b"LEAVE_AUDIO_STREAM"
+KEEPALIVE_INTERVAL = 2.0  # Seconds between JOINs from a receiver
@@ -1,184 +1,209 @@
-import socket
-import pyaudio
-import struct
-import time
-import queue
-import threading
-import statistics
-from collections import deque
+import argparse
+import asyncio
+import os
+import sys
+import receiver_engine
+from receiver_engine import ReceiverEngine, PyAudioSink, NullSink, find_output_device
+from mixer import Mixer
+from telemetry import Registry, MetricsServer
+from recorder import Recorder, RecordingSink, unique_path
+from cli import add_common_options, parse_args
 
-# Configuration
+# Configuration defaults; each can be overridden by --config or the command line
 LISTEN_PORT = 5005
-CHUNK = 2048
-RATE = 48000
-CHANNELS = 2
-FORMAT = pyaudio.paInt16
+CHUNK = None           # Output buffer in frames; None = the sender's packet size
+MIN_BUFFER_DEPTH = 2   # Jitter buffer depth bounds, in packets
+MAX_BUFFER_DEPTH = 32
+SENDER_IP = None        # Sender to JOIN over the control channel; None = wait to be sent to
+MULTICAST_GROUP = None  # e.g. '239.255.42.1' to receive the sender's multicast stream
+PLAYOUT_DELAY = None    # Seconds after capture to play; same value on every room keeps them in sync
+BATCH_IO = False        # Receive with recvmmsg (Linux), many datagrams per syscall
+MAX_STREAMS = 8         # Concurrent senders, each on its own output or mixer input
+STREAM_TIMEOUT = 10.0   # Seconds of silence before a sender's stream is torn down
+OUTPUT = 'device'       # 'device' plays each stream, 'null' discards (headless testing)
+MIX = False             # Mix all streams into one output instead of one output per stream
+MIX_RATE = 48000
+MIX_CHANNELS = 2
+MIX_CHUNK = 512         # Frames per mixed block
+STREAM_GAINS = {}       # Per-sender mix gain by IP, e.g. {'192.168.1.20': 0.5}
+STATS_INTERVAL = 5.0    # Seconds between console summaries; 0 = metrics endpoint only
+METRICS_PORT = None     # e.g. 9105 to serve /metrics (Prometheus) and JSON on localhost
+METRICS_HOST = '127.0.0.1'
+RECORD = None           # e.g. 'session.flac'; per-stream files get '-IP_PORT' added unless mixing
+FEEDBACK_INTERVAL = 1.0  # Seconds between link reports to each sender's auto-tuner; 0 = off
 BUFFER_SIZE = 131072
-MAX_QUEUE_SIZE = 30
-INITIAL_BUFFER_SIZE = 8
+DISCOVERABLE = True     # Answer senders' discovery queries with this receiver's port, formats and load
+NAME = None             # Name advertised to discovery; None = hostname
 
-# Global variables
-audio_queue = queue.Queue()
-running = True
-stats = {
-    'packets_received': 0,
-    'packets_dropped': 0,
-    'latencies': deque(maxlen=100),
-    'sequence_numbers': deque(maxlen=100)
-}
-
-def audio_playback():
-    """Audio playback thread"""
-    p = pyaudio.PyAudio()
-    
+def list_output_devices():
+    """List the output devices PyAudio can play to"""
+    pa = receiver_engine.pyaudio.PyAudio()
     try:
-        stream = p.open(
-            format=FORMAT,
-            channels=CHANNELS,
-            rate=RATE,
-            output=True,
-            frames_per_buffer=CHUNK
-        )
-        
-        print("Playback thread started")
-        
-        # Wait for initial buffer
-        while audio_queue.qsize() < INITIAL_BUFFER_SIZE and running:
-            time.sleep(0.01)
-        
-        print("Starting playback...")
-        
-        while running:
-            try:
-                # Get audio data with timeout
-                data = audio_queue.get(timeout=1.0)
-                if data is None:
-                    break
-                
-                stream.write(data)
-                
-            except queue.Empty:
-                continue
-            except Exception as e:
-                print(f"Playback error: {e}")
-                
-    except Exception as e:
-        print(f"Audio initialization error: {e}")
+        for i in range(pa.get_device_count()):
+            device = pa.get_device_info_by_index(i)
+            if device['maxOutputChannels'] > 0:
+                print(f"{i:2d}: {device['name']} "
+                      f"({device['maxOutputChannels']} ch, {device['defaultSampleRate']:.0f} Hz)")
     finally:
-        if 'stream' in locals():
-            stream.stop_stream()
-            stream.close()
-        p.terminate()
-        print("Playback thread stopped")
+        pa.terminate()
+
+def record_path(path, key):
+    """Recording file for one stream: '{stream}' in the path, or '-IP_PORT' before the extension"""
+    name = f"{key[0]}_{key[1]}" if isinstance(key, tuple) else str(key)
+    if '{stream}' in path:
+        return path.replace('{stream}', name)
+    stem, ext = os.path.splitext(path)
+    return f"{stem}-{name}{ext}"
+
+def gain(text):
+    """'IP=GAIN' for --gain"""
+    ip, sep, value = text.partition('=')
+    try:
+        return ip, float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected IP=GAIN, got '{text}'")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Receive and play audio streams sent over UDP")
+    add_common_options(parser)
+    parser.add_argument('--port', type=int, metavar='PORT', help="UDP port to listen on")
+    parser.add_argument('--min-depth', type=int, metavar='PACKETS', help="minimum jitter buffer depth")
+    parser.add_argument('--max-depth', type=int, metavar='PACKETS', help="maximum jitter buffer depth")
+    parser.add_argument('--sender', metavar='IP', help="sender to JOIN over the control channel")
+    parser.add_argument('--playout-delay', type=float, metavar='SECONDS',
+                        help="play this long after capture (same value on every room keeps them in sync)")
+    parser.add_argument('--max-streams', type=int, metavar='N')
+    parser.add_argument('--stream-timeout', type=float, metavar='SECONDS')
+    parser.add_argument('--output', choices=['device', 'null'],
+                        help="play to the audio device, or discard (headless testing)")
+    parser.add_argument('--mix', action=argparse.BooleanOptionalAction,
+                        help="mix every stream into one output")
+    parser.add_argument('--mix-rate', type=int)
+    parser.add_argument('--mix-channels', type=int)
+    parser.add_argument('--mix-chunk', type=int, metavar='FRAMES')
+    parser.add_argument('--feedback-interval', type=float, metavar='SECONDS',
+                        help="how often to report loss and jitter to senders, 0 = never")
+    parser.add_argument('--record', metavar='FILE.wav|FILE.flac',
+                        help="record what is played: the mix, or one file per stream")
+    parser.add_argument('--gain', action='append', type=gain, metavar='IP=GAIN',
+                        help="mix gain for one sender (repeatable)")
+    parser.add_argument('--discoverable', action=argparse.BooleanOptionalAction,
+                        help="answer discovery queries from senders and nmap.py")
+    parser.add_argument('--name', help="name to advertise to discovery (default: hostname)")
+    parser.set_defaults(port=LISTEN_PORT, chunk=CHUNK, min_depth=MIN_BUFFER_DEPTH,
+                        max_depth=MAX_BUFFER_DEPTH, sender=SENDER_IP, multicast_group=MULTICAST_GROUP,
+                        playout_delay=PLAYOUT_DELAY, batch_io=BATCH_IO, max_streams=MAX_STREAMS,
+                        stream_timeout=STREAM_TIMEOUT, output=OUTPUT, mix=MIX, mix_rate=MIX_RATE,
+                        mix_channels=MIX_CHANNELS, mix_chunk=MIX_CHUNK, gain=[], buffer_size=BUFFER_SIZE,
+                        feedback_interval=FEEDBACK_INTERVAL, record=RECORD,
+                        discoverable=DISCOVERABLE, name=NAME,
+                        stats_interval=STATS_INTERVAL, metrics_port=METRICS_PORT,
+                        metrics_host=METRICS_HOST)
+    return parser
+
+def main(argv=None):
+    args = parse_args(build_parser(), argv)
+    if args.list_devices:
+        if receiver_engine.pyaudio is None:
+            print("❌ Listing devices needs the pyaudio package")
+            return 1
+        list_output_devices()
+        return 0
+
+    device = None
+    if args.device is not None and args.output == 'device':
+        try:
+            device = find_output_device(args.device)
+        except (ValueError, RuntimeError) as e:
+            print(f"❌ {e}")
+            return 1
+    # (IP, GAIN) pairs, config file's {"gain": {"IP": GAIN}} first, then the command line's
+    gains = dict(STREAM_GAINS)
+    gains.update(args.gain)
+    mixer = None
+
+    def make_output():
+        """The device (or null) output for a stream or the mix"""
+        if args.output == 'null':
+            return NullSink()
+        return PyAudioSink(frames_per_buffer=args.mix_chunk if args.mix else args.chunk, device=device)
+
+    def make_sink(key):
+        """Output for a newly seen sender"""
+        if mixer:
+            return mixer.add_input(key, gains.get(key[0], 1.0))
+        if args.record:
+            # A sender that reconnects from the same address must not truncate its last recording
+            return RecordingSink(make_output(), Recorder(unique_path(record_path(args.record, key))))
+        return make_output()
+
+    if args.record:
+        try:
+            Recorder(args.record)  # Check the file type before anything starts
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 1
+
+    print(f"Starting audio receiver on port {args.port}")
+    print("Audio format: taken from the sender's packet headers")
+    if args.playout_delay is not None:
+        print(f"Synchronized playout {args.playout_delay * 1000:.0f}ms after capture")
 
-def print_stats():
-    """Print periodic statistics"""
-    if stats['packets_received'] > 0:
-        avg_latency = statistics.mean(stats['latencies']) if stats['latencies'] else 0
-        loss_rate = (stats['packets_dropped'] / (stats['packets_received'] + stats['packets_dropped'])) * 100 if (stats['packets_received'] + stats['packets_dropped']) > 0 else 0
-        
-        print(f"\nStats - Received: {stats['packets_received']}, "
-              f"Dropped: {stats['packets_dropped']}, "
-              f"Loss: {loss_rate:.1f}%, "
-              f"Avg Latency: {avg_latency:.2f}ms, "
-              f"Queue: {audio_queue.qsize()}")
+    registry = Registry()
+    engine = ReceiverEngine(
+        args.port,
+        sink_factory=make_sink,
+        max_streams=args.max_streams,
+        stream_timeout=args.stream_timeout,
+        min_depth=args.min_depth,
+        max_depth=args.max_depth,
+        playout_delay=args.playout_delay,
+        sender_ip=args.sender,
+        multicast_group=args.multicast_group,
+        batch_io=args.batch_io,
+        stats_interval=args.stats_interval,
+        registry=registry,
+        buffer_size=args.buffer_size,
+        feedback_interval=args.feedback_interval,
+        discovery=args.discoverable,
+        name=args.name
+    )
+    if args.mix:
+        output = make_output()
+        if args.record:
+            output = RecordingSink(output, Recorder(args.record))
+            print(f"Recording the mix to {args.record}")
+        mixer = Mixer(output, args.mix_rate, args.mix_channels, args.mix_chunk,
+                      max_inputs=args.max_streams)
+        mixer.start()
+        registry.counter('mixer_limited_blocks', 'Mixed blocks the limiter turned down',
+                         fn=lambda: mixer.limiting)
+        print(f"Mixing up to {args.max_streams} streams into one {args.mix_rate}Hz, "
+              f"{args.mix_channels} channel output")
+    metrics_server = None
+    if args.metrics_port is not None:
+        metrics_server = MetricsServer(registry, args.metrics_port, args.metrics_host).start()
+        print(f"Metrics on http://{args.metrics_host}:{metrics_server.port}/metrics")
+    print("Waiting for audio packets... Press Ctrl+C to stop")
 
-def main():
-    global running
-    
-    print(f"Starting audio receiver on port {LISTEN_PORT}")
-    print(f"Audio format: {RATE}Hz, {CHANNELS} channels, {FORMAT}")
-    
-    # Create socket
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, BUFFER_SIZE)
-    
+    status = 0
     try:
-        sock.bind(('0.0.0.0', LISTEN_PORT))
-        print(f"Listening on 0.0.0.0:{LISTEN_PORT}")
-        
-        # Start playback thread
-        playback_thread = threading.Thread(target=audio_playback, daemon=True)
-        playback_thread.start()
-        
-        last_stats_time = time.time()
-        expected_seq = None  # Will be set from first packet
-        
-        print("Waiting for audio packets... Press Ctrl+C to stop")
-        
-        while running:
-            try:
-                # Receive packet
-                packet, addr = sock.recvfrom(4096)
-                recv_time = time.perf_counter()
-                
-                # Parse packet
-                if len(packet) < 16:  # 8 bytes seq + 8 bytes timestamp
-                    continue
-                
-                seq_num, sent_timestamp = struct.unpack('Qd', packet[:16])
-                audio_data = packet[16:]
-                
-                # Calculate latency
-                latency = (recv_time - sent_timestamp) * 1000
-                stats['latencies'].append(latency)
-                stats['sequence_numbers'].append(seq_num)
-                
-                # Check for dropped packets
-                if expected_seq is None:
-                    expected_seq = seq_num + 1  # Initialize from first packet
-                elif seq_num != expected_seq:
-                    dropped = seq_num - expected_seq
-                    if dropped > 0:  # Only count positive drops
-                        stats['packets_dropped'] += dropped
-                        print(f"Dropped {dropped} packets (expected {expected_seq}, got {seq_num})")
-                    expected_seq = seq_num + 1
-                else:
-                    expected_seq = seq_num + 1
-                stats['packets_received'] += 1
-                
-                # Manage queue size
-                if audio_queue.qsize() > MAX_QUEUE_SIZE:
-                    try:
-                        audio_queue.get_nowait()  # Drop oldest
-                        stats['packets_dropped'] += 1
-                    except queue.Empty:
-                        pass
-                
-                # Add to playback queue
-                audio_queue.put(audio_data)
-                
-                # Print stats every 5 seconds
-                if time.time() - last_stats_time > 5:
-                    print_stats()
-                    last_stats_time = time.time()
-                
-                # Print latency every 50 packets
-                if stats['packets_received'] % 50 == 0:
-                    print(f"Latency: {latency:.2f}ms, Queue: {audio_queue.qsize()}")
-                
-            except socket.timeout:
-                continue
-            except Exception as e:
-                print(f"Receive error: {e}")
-                
+        asyncio.run(engine.run())
     except KeyboardInterrupt:
         print("\nReceiver stopping...")
-    except Exception as e:
+    except OSError as e:
         print(f"Socket error: {e}")
+        status = 1
     finally:
-        running = False
-        
-        # Signal playback thread to stop
-        audio_queue.put(None)
-        
-        # Wait for playback thread
-        if 'playback_thread' in locals():
-            playback_thread.join(timeout=2)
-        
-        sock.close()
-        print_stats()
+        if metrics_server:
+            metrics_server.stop()
+        if mixer:
+            mixer.stop()
+            if mixer.limiting:
+                print(f"Mixer limited {mixer.limiting} blocks to avoid clipping")
+        engine.print_stats()
         print("Receiver stopped")
+    return status
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
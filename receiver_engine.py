@@ -0,0 +1,691 @@
+import asyncio
+import os
+import signal
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from jitter_buffer import JitterBuffer
+from concealment import Concealer
+from drift import DriftEstimator, Resampler
+from protocol import (parse_packet, same_output, same_decoder, Packet, SAMPLE_INT16, FLAG_PARITY,
+                      CONTROL_PORT, JOIN_MESSAGE, LEAVE_MESSAGE, KEEPALIVE_INTERVAL, frame_bytes,
+                      HEADER_SIZE)
+from codec import create_codec
+from fec import FecDecoder
+from udp_io import PacketSlab, BatchReceiver, SLAB_SLOTS, BATCH_SIZE
+from telemetry import Registry
+from clock_sync import ClockSync, is_pong, PING_INTERVAL, FAST_PINGS
+from autotune import pack_feedback, socket_buffer_size, FEEDBACK_INTERVAL
+from discovery import DiscoveryResponder, responder_socket, DISCOVERY_PORT
+
+try:
+    import pyaudio
+except ImportError:
+    pyaudio = None
+
+MIN_BUFFER_DEPTH = 2   # Jitter buffer depth bounds, in packets
+MAX_BUFFER_DEPTH = 32
+MAX_STREAMS = 8        # Senders served at once; more are ignored until one goes idle
+STREAM_TIMEOUT = 10.0  # Seconds without packets before a stream is torn down
+STATS_INTERVAL = 5.0
+BUFFER_SIZE = 131072
+ARRIVAL_SLOTS = 1024   # Arrival times remembered by sequence number, for jitter buffer delay
+
+
+class NullSink:
+    """Discards decoded audio at the stream's real-time rate.
+
+    write() blocks like a device with one buffer of headroom would, so the
+    jitter buffer and drift control behave as they do with real output.
+    """
+
+    def __init__(self):
+        self._bytes_per_second = None
+        self._busy_until = 0.0
+
+    def open(self, fmt):
+        self._bytes_per_second = fmt.rate * fmt.channels * 2
+        self._busy_until = 0.0
+
+    def write(self, data):
+        now = time.monotonic()
+        if self._busy_until > now:
+            time.sleep(self._busy_until - now)  # Wait for the previous buffer to "play"
+        self._busy_until = max(now, self._busy_until) + len(data) / self._bytes_per_second
+
+    def latency(self):
+        """Seconds until audio written now would be heard"""
+        return max(0.0, self._busy_until - time.monotonic())
+
+    def close(self):
+        pass
+
+
+def find_output_device(spec):
+    """PyAudio output device index from an index or a (case-insensitive, partial) name"""
+    if pyaudio is None:
+        raise RuntimeError("PyAudio output needs the pyaudio package")
+    pa = pyaudio.PyAudio()
+    try:
+        devices = [pa.get_device_info_by_index(i) for i in range(pa.get_device_count())]
+    finally:
+        pa.terminate()
+    if str(spec).isdigit():
+        idx = int(spec)
+        if idx >= len(devices) or devices[idx]['maxOutputChannels'] == 0:
+            raise ValueError(f"device {idx} is not an output device")
+        return idx
+    outputs = [i for i, d in enumerate(devices) if d['maxOutputChannels'] > 0]
+    exact = [i for i in outputs if devices[i]['name'].lower() == spec.lower()]
+    matches = exact or [i for i in outputs if spec.lower() in devices[i]['name'].lower()]
+    if not matches:
+        raise ValueError(f"no output device matches '{spec}'")
+    if len(matches) > 1:
+        names = ', '.join(f"{i}: {devices[i]['name']}" for i in matches)
+        raise ValueError(f"'{spec}' matches several output devices ({names})")
+    return matches[0]
+
+
+class PyAudioSink:
+    """Plays one stream on an output device (the default one unless given an index)"""
+
+    def __init__(self, frames_per_buffer=None, device=None):
+        if pyaudio is None:
+            raise RuntimeError("PyAudio output needs the pyaudio package")
+        self.frames_per_buffer = frames_per_buffer
+        self.device = device
+        self._pa = None
+        self._stream = None
+
+    def open(self, fmt):
+        """(Re)open the device for a new output format"""
+        self.close()
+        self._pa = pyaudio.PyAudio()
+        self._stream = self._pa.open(
+            format={SAMPLE_INT16: pyaudio.paInt16}[fmt.sample_format],
+            channels=fmt.channels,
+            rate=fmt.rate,
+            output=True,
+            output_device_index=self.device,
+            frames_per_buffer=self.frames_per_buffer or fmt.frames
+        )
+
+    def write(self, data):
+        self._stream.write(data)
+
+    def latency(self):
+        """Seconds until audio written now would be heard, as PortAudio reports it"""
+        return self._stream.get_output_latency() if self._stream is not None else 0.0
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+        if self._pa is not None:
+            self._pa.terminate()
+            self._pa = None
+
+
+class StreamPipeline:
+    """Everything between the socket and the sink for one sender.
+
+    handle() runs on the event loop and only parses, reorders and queues;
+    play() is the blocking playout loop and runs on a worker thread, so a
+    slow device write never holds up the network side.
+    """
+
+    def __init__(self, key, sink, min_depth=MIN_BUFFER_DEPTH, max_depth=MAX_BUFFER_DEPTH,
+                 playout_delay=None, registry=None, clock=None):
+        self.key = key
+        self.name = f"{key[0]}:{key[1]}" if isinstance(key, tuple) else str(key)
+        self.sink = sink
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.jitter_buffer = JitterBuffer(min_depth=min_depth, max_depth=max_depth,
+                                          playout_delay=playout_delay)
+        self.fec_decoder = FecDecoder()
+        self.drift = DriftEstimator()
+        self.format = None
+        self.decoder = None
+        self.concealer = None
+        self.resampler = None
+        self.expected_seq = None
+        self.clock = clock or ClockSync()  # Unsynced: assumes both ends share a clock
+        self._arrivals = [0.0] * ARRIVAL_SLOTS
+        self._reported = (0, 0, 0)  # received, lost, underruns at the last feedback
+        self.last_seen = time.monotonic()
+        self.running = True
+        self.task = None
+        self.registry = registry or Registry()
+        self._register(self.registry)
+
+    def _register(self, registry):
+        """Create this stream's metrics; hot-path ones are updated directly"""
+        label = {'stream': self.name}
+        jb = self.jitter_buffer.stats
+        self.received = registry.counter('packets_received', 'Data packets received', **label)
+        self.gaps = registry.counter('sequence_gaps', 'Packets missing when a later one arrived', **label)
+        self.network = registry.histogram('network_ms', 'Capture to arrival, sender clock mapped to ours (ms)',
+                                          **label)
+        self.buffered = registry.histogram('jitter_buffer_ms', 'Arrival to playout (ms)', **label)
+        self.output = registry.histogram('output_ms', 'Playout to audible, queued in the sink (ms)', **label)
+        self.end_to_end = registry.histogram('end_to_end_ms', 'Capture to audible (ms)', **label)
+        self.jitter = registry.histogram('jitter_ms', 'RFC 3550 interarrival jitter (ms)', **label)
+        for name in ('reordered', 'late', 'duplicates', 'overflow', 'lost', 'underruns'):
+            registry.counter(f'jitter_buffer_{name}', f'Jitter buffer {name} events',
+                             fn=lambda name=name: jb[name], **label)
+        registry.counter('concealed', 'Frames synthesized by loss concealment',
+                         fn=lambda: self.concealer.concealed if self.concealer else 0, **label)
+        registry.counter('fec_recovered', 'Packets rebuilt from parity',
+                         fn=lambda: self.fec_decoder.recovered, **label)
+        registry.gauge('buffer_depth', 'Packets queued in the jitter buffer',
+                       fn=lambda: len(self.jitter_buffer), **label)
+        registry.gauge('buffer_target', 'Jitter buffer target depth',
+                       fn=lambda: self.jitter_buffer.target_depth, **label)
+        registry.gauge('drift_ppm', 'Sender clock skew against ours (ppm)',
+                       fn=lambda: self.drift.skew * 1e6, **label)
+        registry.gauge('clock_offset_ms', 'Sender clock minus ours (ms)',
+                       fn=lambda: self.clock.offset * 1000, **label)
+        registry.gauge('clock_rtt_ms', 'Round trip of the best clock exchange (ms)',
+                       fn=lambda: (self.clock.rtt or 0.0) * 1000, **label)
+        registry.gauge('clock_synced', '1 once a clock exchange completed',
+                       fn=lambda: int(self.clock.synced), **label)
+
+    def set_format(self, fmt):
+        """Switch the pipeline over to a new sender format"""
+        if not same_decoder(fmt, self.format):
+            self.decoder = create_codec(fmt.codec, fmt.rate, fmt.channels)
+            print(f"[{self.name}] Stream format: {fmt.rate}Hz, {fmt.channels} channels, "
+                  f"{self.decoder.name}, {fmt.frames} frames/packet")
+            self.expected_seq = None  # New stream, sequence starts over
+            self.drift.reset()
+            self.fec_decoder.reset()
+            self.jitter_buffer.reset()
+        if not same_output(fmt, self.format):
+            self.concealer = Concealer(fmt.channels)
+            self.resampler = Resampler(fmt.channels)
+        self.format = fmt
+
+    def handle(self, packet, recv_time):
+        """Take one parsed packet from the network"""
+        self.last_seen = time.monotonic()
+        fmt = packet.format
+        if fmt != self.format:
+            try:
+                self.set_format(fmt)
+            except (ValueError, RuntimeError) as e:
+                print(f"[{self.name}] Unsupported stream: {e}")
+                return
+
+        seq_num, sent_timestamp = packet.seq_num, packet.timestamp
+        if packet.flags & FLAG_PARITY:
+            self._push_recovered(self.fec_decoder.add_parity(seq_num, packet.payload))
+            return
+
+        self._arrivals[seq_num % ARRIVAL_SLOTS] = recv_time
+        self.network.observe((recv_time - self.clock.to_local(sent_timestamp)) * 1000)
+
+        # Check for gaps; reordered packets may still fill them
+        if self.expected_seq is None:
+            self.expected_seq = seq_num + 1
+        elif seq_num >= self.expected_seq:
+            if seq_num > self.expected_seq:
+                self.gaps.inc(seq_num - self.expected_seq)
+            self.expected_seq = seq_num + 1
+        self.received.inc()
+
+        # The payload is a view into the receive slab, whose slots every datagram
+        # reuses in turn; anything queued for playout needs its own copy
+        packet = packet._replace(payload=bytes(packet.payload))
+        self.jitter_buffer.push(seq_num, sent_timestamp, packet, recv_time)
+        self.jitter.observe(self.jitter_buffer.jitter * 1000)
+        self.drift.observe(seq_num, recv_time, fmt.frames / fmt.rate)
+        if self.fec_decoder.span:  # Only keep copies for rebuilding once parity shows up
+            self._push_recovered(self.fec_decoder.add_data(seq_num, sent_timestamp, fmt.frames,
+                                                           packet.payload))
+
+    def _push_recovered(self, recovered):
+        """Queue packets rebuilt from FEC parity for playout"""
+        for seq_num, timestamp, frames, payload in recovered:
+            self._arrivals[seq_num % ARRIVAL_SLOTS] = time.perf_counter()
+            packet = Packet(seq_num, timestamp, self.format._replace(frames=frames), 0, payload)
+            self.jitter_buffer.push(seq_num, timestamp, packet, measure=False)
+
+        # Parity is only useful if the buffer holds a whole group
+        if self.fec_decoder.span:
+            self.jitter_buffer.min_depth = min(self.max_depth,
+                                               max(self.min_depth, self.fec_decoder.span + 1))
+
+    def play(self):
+        """Blocking playout loop: jitter buffer -> decode/conceal -> resample -> sink"""
+        output_format = None
+        try:
+            while self.running:
+                fmt = self.format
+                if fmt is None:
+                    time.sleep(0.01)  # Nothing received yet
+                    continue
+
+                # (Re)open the sink whenever the sender changes format
+                if not same_output(fmt, output_format):
+                    self.sink.open(fmt)
+                    output_format = fmt
+                    print(f"[{self.name}] Playing {fmt.rate}Hz, {fmt.channels} channels")
+
+                # Wait at most about one packet for a missing packet to show up
+                timeout = self.jitter_buffer.packet_interval or 0.05
+                frame = self.jitter_buffer.pop(timeout=timeout)
+                if not self.running:
+                    break
+
+                if frame is None or frame[2] is None:
+                    # Lost packet or underrun: synthesize a frame to keep the clock going
+                    data = self.concealer.conceal()
+                    if data is None:
+                        continue  # Nothing played yet, or gap too long to cover
+                else:
+                    self._observe_playout(frame[0], frame[1])
+                    try:
+                        packet = frame[2]
+                        data = self.concealer.good(self.decoder.decode(packet.payload,
+                                                                       packet.format.frames))
+                    except ValueError as e:
+                        print(f"[{self.name}] Decode error: {e}")
+                        data = self.concealer.conceal()
+                        if data is None:
+                            continue
+
+                # Absorb clock drift so the buffer holds its target depth
+                ratio = self.drift.ratio(len(self.jitter_buffer), self.jitter_buffer.target_depth)
+                self.sink.write(self.resampler.process(data, ratio))
+        except Exception as e:
+            print(f"[{self.name}] Playback error: {e}")
+        finally:
+            self.sink.close()
+
+    def _observe_playout(self, seq_num, sent_timestamp):
+        """Split capture-to-audible latency for a packet leaving the jitter buffer"""
+        now = time.perf_counter()
+        sink_latency = getattr(self.sink, 'latency', None)
+        output = sink_latency() if sink_latency else 0.0
+        self.buffered.observe((now - self._arrivals[seq_num % ARRIVAL_SLOTS]) * 1000)
+        self.output.observe(output * 1000)
+        self.end_to_end.observe((now - self.clock.to_local(sent_timestamp) + output) * 1000)
+
+    def feedback(self):
+        """FEEDBACK message on the link since the last call, for the sender's auto-tuner"""
+        jb = self.jitter_buffer.stats
+        current = (self.received.value, jb['lost'], jb['underruns'])
+        received, lost, underruns = (now - then for now, then in zip(current, self._reported))
+        self._reported = current
+        return pack_feedback(lost / (received + lost) if received + lost else 0.0,
+                             self.jitter_buffer.jitter, underruns, self.format.frames,
+                             self.key[1] if isinstance(self.key, tuple) else 0)
+
+    def close(self):
+        """Stop playout; play() returns within one pop timeout"""
+        self.running = False
+        self.jitter_buffer.close()
+
+    def metrics(self):
+        """Snapshot of this stream's counters and estimates"""
+        received = self.received.value
+        jb = self.jitter_buffer.stats
+        dropped = jb['lost'] + jb['overflow']
+        end_to_end = self.end_to_end.get()
+        return {
+            'packets_received': received,
+            'packets_dropped': dropped,
+            'loss_percent': dropped / (received + dropped) * 100 if received + dropped else 0.0,
+            'end_to_end_p50_ms': end_to_end['p50'],
+            'end_to_end_p99_ms': end_to_end['p99'],
+            'end_to_end_p999_ms': end_to_end['p999'],
+            'network_p50_ms': self.network.quantile(0.5),
+            'jitter_buffer_p50_ms': self.buffered.quantile(0.5),
+            'output_p50_ms': self.output.quantile(0.5),
+            'clock_synced': self.clock.synced,
+            'clock_offset_ms': self.clock.offset * 1000,
+            'clock_rtt_ms': (self.clock.rtt or 0.0) * 1000,
+            'jitter_ms': self.jitter_buffer.jitter * 1000,
+            'drift_ppm': self.drift.skew * 1e6,
+            'buffer_depth': len(self.jitter_buffer),
+            'target_depth': self.jitter_buffer.target_depth,
+            'reordered': jb['reordered'],
+            'late': jb['late'],
+            'underruns': jb['underruns'],
+            'concealed': self.concealer.concealed if self.concealer else 0,
+            'fec_recovered': self.fec_decoder.recovered,
+        }
+
+    def print_stats(self):
+        m = self.metrics()
+        if not m['packets_received']:
+            return
+        print(f"[{self.name}] Received: {m['packets_received']}, "
+              f"Dropped: {m['packets_dropped']}, "
+              f"Loss: {m['loss_percent']:.1f}%, "
+              f"Latency p50/p99/p99.9: {m['end_to_end_p50_ms']:.2f}/{m['end_to_end_p99_ms']:.2f}/"
+              f"{m['end_to_end_p999_ms']:.2f}ms "
+              f"(network {m['network_p50_ms']:.2f} + buffer {m['jitter_buffer_p50_ms']:.2f} + "
+              f"output {m['output_p50_ms']:.2f}ms"
+              f"{'' if m['clock_synced'] else ', clocks not synced'}), "
+              f"Jitter: {m['jitter_ms']:.2f}ms, "
+              f"Drift: {m['drift_ppm']:+.0f}ppm, "
+              f"Buffer: {m['buffer_depth']}/{m['target_depth']}, "
+              f"Reordered: {m['reordered']}, Late: {m['late']}, "
+              f"Underruns: {m['underruns']}, "
+              f"Concealed: {m['concealed']}, "
+              f"FEC Recovered: {m['fec_recovered']}")
+
+
+class ReceiverEngine:
+    """Serves any number of concurrent senders on one UDP port.
+
+    Packets are demultiplexed by sender address, each sender getting its
+    own StreamPipeline and sink from sink_factory(key). The socket is read
+    by the event loop straight into a pooled PacketSlab, one recvfrom_into()
+    per datagram or, with batch_io, one recvmmsg() per batch; each
+    pipeline's playout runs on a worker thread.
+    With discovery set, it also answers discovery queries on DISCOVERY_PORT
+    with describe().
+    """
+
+    def __init__(self, port, sink_factory=lambda key: NullSink(), max_streams=MAX_STREAMS,
+                 stream_timeout=STREAM_TIMEOUT, min_depth=MIN_BUFFER_DEPTH,
+                 max_depth=MAX_BUFFER_DEPTH, playout_delay=None, sender_ip=None,
+                 multicast_group=None, batch_io=False, bind_address='0.0.0.0',
+                 stats_interval=STATS_INTERVAL, registry=None, buffer_size=BUFFER_SIZE,
+                 feedback_interval=FEEDBACK_INTERVAL, discovery=False, name=None):
+        self.port = port
+        self.sink_factory = sink_factory
+        self.max_streams = max_streams
+        self.stream_timeout = stream_timeout
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.playout_delay = playout_delay
+        self.sender_ip = sender_ip
+        self.multicast_group = multicast_group
+        self.batch_io = batch_io
+        self.bind_address = bind_address
+        self.stats_interval = stats_interval
+        self.buffer_size = buffer_size
+        self.feedback_interval = feedback_interval
+        self.discovery = discovery
+        self.name = name or socket.gethostname()
+        self.instance = os.urandom(8).hex()  # Lets discovery merge answers arriving via several addresses
+        self._rcvbuf = buffer_size
+        self.streams = {}
+        self.clocks = {}  # Sender IP -> ClockSync, shared by that host's streams
+        self.counters = {'invalid': 0, 'rejected': 0, 'streams_opened': 0, 'streams_closed': 0}
+        self.registry = registry or Registry()
+        for name in self.counters:
+            self.registry.counter(name, fn=lambda name=name: self.counters[name])
+        self.registry.gauge('streams', 'Streams being played', fn=lambda: len(self.streams))
+        self.sock = None
+        self._playout = None
+        self._slab = None
+        self._responder = None
+        self._receiver = None
+        self._stopping = None
+        self._loop = None
+
+    def _open_socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.buffer_size)
+        sock.bind((self.bind_address, self.port))
+        if self.multicast_group:
+            mreq = socket.inet_aton(self.multicast_group) + socket.inet_aton('0.0.0.0')
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+            print(f"Joined multicast group {self.multicast_group}")
+        sock.setblocking(False)
+        return sock
+
+    async def start(self):
+        """Bind the socket and start receiving"""
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        # Each stream's playout blocks a thread for the stream's lifetime, so the
+        # pool is sized to the stream limit rather than sharing asyncio's default one
+        self._playout = ThreadPoolExecutor(max_workers=self.max_streams, thread_name_prefix='playout')
+        self.sock = self._open_socket()
+        self.port = self.sock.getsockname()[1]
+        # Slab views only live until dispatch() returns; pipelines copy what they keep
+        self._slab = PacketSlab(SLAB_SLOTS)
+        if self.batch_io:
+            self._receiver = BatchReceiver(self.sock, self._slab)
+            print(f"Batched I/O: {self._receiver.mode}")
+        self._loop.add_reader(self.sock.fileno(), self._on_readable)
+        print(f"Listening on {self.bind_address}:{self.port}")
+        if self.discovery:
+            await self._start_responder()
+
+    async def _start_responder(self):
+        try:
+            sock = responder_socket()
+        except OSError as e:
+            print(f"Discovery disabled, cannot bind port {DISCOVERY_PORT}: {e}")
+            return
+        self._responder, _ = await self._loop.create_datagram_endpoint(
+            lambda: DiscoveryResponder(self.describe), sock=sock)
+        print(f"Answering discovery on port {DISCOVERY_PORT}")
+
+    def describe(self):
+        """What discovery advertises: where to send, the formats being played and how busy this is"""
+        formats = [{'rate': p.format.rate, 'channels': p.format.channels, 'codec': p.decoder.name,
+                    'frames': p.format.frames}
+                   for p in list(self.streams.values()) if p.format is not None]
+        return {
+            'id': self.instance,
+            'name': self.name,
+            'port': self.port,
+            'multicast_group': self.multicast_group,
+            'streams': len(self.streams),
+            'max_streams': self.max_streams,
+            'load': len(self.streams) / self.max_streams,
+            'accepting': len(self.streams) < self.max_streams,
+            'formats': formats,
+        }
+
+    def _on_readable(self):
+        try:
+            batch = self._receiver.recv(0) if self._receiver is not None else self._drain()
+        except OSError as e:
+            print(f"Receive error: {e}")
+            return
+        recv_time = time.perf_counter()
+        for data, addr in batch:
+            self.dispatch(data, addr, recv_time)
+
+    def _drain(self):
+        """What is queued on the socket, up to BATCH_SIZE datagrams, as views into the slab"""
+        batch = []
+        while len(batch) < BATCH_SIZE:
+            try:
+                batch.append(self._slab.recvfrom(self.sock))
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                if not batch:
+                    raise
+                print(f"Receive error: {e}")
+                break
+        return batch
+
+    def dispatch(self, data, addr, recv_time):
+        """Route one datagram to its sender's pipeline, creating it on first contact"""
+        if data is None:  # Truncated: larger than a receive slot
+            self.counters['invalid'] += 1
+            return
+        if is_pong(data):
+            clock = self.clocks.get(addr[0])
+            if clock is not None:
+                clock.on_pong(data, recv_time)
+            return
+        packet = parse_packet(data)
+        if packet is None:
+            self.counters['invalid'] += 1
+            return
+        pipeline = self.streams.get(addr)
+        if pipeline is None:
+            if len(self.streams) >= self.max_streams or self._stopping.is_set():
+                self.counters['rejected'] += 1
+                return
+            pipeline = self.open_stream(addr)
+        pipeline.handle(packet, recv_time)
+
+    def open_stream(self, key):
+        clock = self.clocks.setdefault(key[0], ClockSync()) if isinstance(key, tuple) else None
+        pipeline = StreamPipeline(key, self.sink_factory(key), self.min_depth, self.max_depth,
+                                  self.playout_delay, self.registry, clock)
+        pipeline.task = self._loop.run_in_executor(self._playout, pipeline.play)
+        self.streams[key] = pipeline
+        self.counters['streams_opened'] += 1
+        print(f"[{pipeline.name}] New stream ({len(self.streams)}/{self.max_streams})")
+        return pipeline
+
+    async def close_stream(self, key):
+        pipeline = self.streams.get(key)
+        if pipeline is None:
+            return
+        # Unregister before the await below: a packet arriving meanwhile opens a new
+        # pipeline under the same name, which must get metrics of its own
+        self.registry.remove(stream=pipeline.name)
+        del self.streams[key]
+        pipeline.close()
+        try:
+            await asyncio.wait_for(pipeline.task, timeout=2)
+        except asyncio.TimeoutError:
+            print(f"[{pipeline.name}] Playout did not stop in time")
+        self.counters['streams_closed'] += 1
+        if isinstance(key, tuple) and not any(k[0] == key[0] for k in self.streams):
+            self.clocks.pop(key[0], None)
+        pipeline.print_stats()
+        print(f"[{pipeline.name}] Stream closed")
+
+    async def _housekeeping(self):
+        """Expire idle streams and print stats periodically"""
+        last_stats = time.monotonic()
+        while True:
+            await asyncio.sleep(1.0)
+            now = time.monotonic()
+            for key, pipeline in list(self.streams.items()):
+                if now - pipeline.last_seen > self.stream_timeout:
+                    print(f"[{pipeline.name}] No packets for {self.stream_timeout:.0f}s")
+                    await self.close_stream(key)
+            if self.stats_interval and now - last_stats > self.stats_interval:
+                self.print_stats()
+                last_stats = now
+            self._size_buffer()
+
+    def _size_buffer(self):
+        """Grow the receive buffer when senders move to larger packets (never below buffer_size)"""
+        packet_bytes = sum(frame_bytes(p.format) + HEADER_SIZE for p in self.streams.values() if p.format)
+        wanted = max(self.buffer_size, socket_buffer_size(packet_bytes))
+        if wanted != self._rcvbuf:
+            self._rcvbuf = wanted
+            try:
+                self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, wanted)
+            except OSError as e:
+                print(f"Cannot resize receive buffer: {e}")
+
+    async def _send_feedback(self):
+        """Report each stream's loss, jitter and underruns to its sender's auto-tuner"""
+        while True:
+            await asyncio.sleep(self.feedback_interval)
+            for key, pipeline in list(self.streams.items()):
+                if not isinstance(key, tuple) or pipeline.format is None:
+                    continue
+                try:
+                    self.sock.sendto(pipeline.feedback(), (key[0], CONTROL_PORT))
+                except OSError:
+                    pass  # Sender has no control channel
+
+    async def _sync_clocks(self):
+        """Ping every sender host's control port to track its clock offset"""
+        last_ping = {}
+        while True:
+            await asyncio.sleep(PING_INTERVAL / (2 * FAST_PINGS))
+            now = time.monotonic()
+            for ip, clock in list(self.clocks.items()):
+                if clock.ping_due(last_ping.get(ip, 0.0), now):
+                    try:
+                        self.sock.sendto(clock.make_ping(), (ip, CONTROL_PORT))
+                    except OSError:
+                        pass  # Sender has no control channel; latency stays unsynced
+                    last_ping[ip] = now
+
+    async def _keep_joined(self):
+        """Keep this receiver subscribed to sender_ip"""
+        while True:
+            try:
+                self.sock.sendto(JOIN_MESSAGE, (self.sender_ip, CONTROL_PORT))
+            except OSError as e:
+                print(f"Join error: {e}")
+            await asyncio.sleep(KEEPALIVE_INTERVAL)
+
+    def metrics(self):
+        """Engine counters plus a metrics() snapshot per stream"""
+        return dict(self.counters, streams={p.name: p.metrics() for p in self.streams.values()})
+
+    def print_stats(self):
+        for pipeline in list(self.streams.values()):
+            pipeline.print_stats()
+        if self.counters['invalid'] or self.counters['rejected']:
+            print(f"Invalid packets: {self.counters['invalid']}, "
+                  f"Rejected (stream limit): {self.counters['rejected']}")
+
+    def stop(self):
+        """Ask run() to shut down; safe to call from signal handlers"""
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def run(self):
+        """Serve until stop() is called or the task is cancelled"""
+        await self.start()
+        background = [asyncio.ensure_future(self._housekeeping()),
+                      asyncio.ensure_future(self._sync_clocks())]
+        if self.feedback_interval:
+            background.append(asyncio.ensure_future(self._send_feedback()))
+        if self.sender_ip:
+            background.append(asyncio.ensure_future(self._keep_joined()))
+            print(f"Joining sender {self.sender_ip}:{CONTROL_PORT}")
+        try:
+            self._loop.add_signal_handler(signal.SIGTERM, self.stop)
+        except (NotImplementedError, RuntimeError):
+            pass  # Not on this platform, or not the main thread
+        try:
+            await self._stopping.wait()
+        finally:
+            self._stopping.set()
+            for task in background:
+                task.cancel()
+            await asyncio.gather(*background, return_exceptions=True)
+            try:
+                self._loop.remove_signal_handler(signal.SIGTERM)
+            except (NotImplementedError, RuntimeError):
+                pass
+            await self.shutdown()
+
+    async def shutdown(self):
+        """Stop receiving, close every stream and release the socket"""
+        if self._slab is not None:
+            self._loop.remove_reader(self.sock.fileno())
+            self._receiver = None
+            self._slab = None
+        if self.sender_ip:
+            try:
+                self.sock.sendto(LEAVE_MESSAGE, (self.sender_ip, CONTROL_PORT))
+            except OSError:
+                pass
+        for key in list(self.streams):
+            await self.close_stream(key)
+        if self._responder is not None:
+            self._responder.close()
+            self._responder = None
+        if self.sock is not None:
+            self.sock.close()
+        self.sock = None
+        if self._playout is not None:
+            self._playout.shutdown(wait=False)
+            self._playout = None
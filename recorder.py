@@ -0,0 +1,238 @@
+import os
+import queue
+import struct
+import threading
+import time
+import numpy as np
+
+try:
+    import soundfile
+except Exception:  # ImportError, or libsndfile missing
+    soundfile = None
+
+FINALIZE_INTERVAL = 2.0  # Seconds between header rewrites; a crash loses at most this much
+QUEUE_BLOCKS = 256       # Blocks queued for the writer thread before new ones are dropped
+FULL_SCALE = np.float32(32767)
+
+# RIFF/WAVE header with a JUNK chunk reserved for the RF64 ds64 chunk, so a
+# recording that passes 4 GiB can be promoted in place (EBU Tech 3306).
+#
+#   RIFF size WAVE | JUNK 28 (ds64 placeholder) | fmt  16 PCM | data size
+RIFF = struct.Struct('<4sI4s')
+DS64 = struct.Struct('<4sIQQQI')  # id, size, riff size, data size, sample count, table length
+FMT = struct.Struct('<4sIHHIIHH')
+CHUNK_HEADER = struct.Struct('<4sI')
+DATA_OFFSET = RIFF.size + DS64.size + FMT.size + CHUNK_HEADER.size
+MAX_32BIT = 0xFFFFFFFF
+
+
+class WavWriter:
+    """16-bit PCM WAV written as it arrives.
+
+    The header's sizes are rewritten by finalize(), so the file on disk is
+    always a valid WAV of everything up to the last finalize. Past 4 GiB
+    the file becomes RF64 instead of breaking.
+    """
+
+    def __init__(self, path, rate, channels):
+        self.rate = rate
+        self.channels = channels
+        self.frames = 0
+        self._file = open(path, 'wb')
+        self._file.write(bytes(DATA_OFFSET))
+        self.finalize()
+
+    def write(self, pcm):
+        self._file.write(pcm)
+        self.frames += len(pcm) // (2 * self.channels)
+
+    def finalize(self):
+        """Rewrite the header for what has been written and flush it to disk"""
+        block_align = 2 * self.channels
+        data_size = self.frames * block_align
+        riff_size = DATA_OFFSET - 8 + data_size
+        f = self._file
+        f.seek(0)
+        if riff_size > MAX_32BIT:
+            f.write(RIFF.pack(b'RF64', MAX_32BIT, b'WAVE'))
+            f.write(DS64.pack(b'ds64', DS64.size - 8, riff_size, data_size, self.frames, 0))
+        else:
+            f.write(RIFF.pack(b'RIFF', riff_size, b'WAVE'))
+            f.write(DS64.pack(b'JUNK', DS64.size - 8, 0, 0, 0, 0))
+        f.write(FMT.pack(b'fmt ', 16, 1, self.channels, self.rate, self.rate * block_align,
+                         block_align, 16))
+        f.write(CHUNK_HEADER.pack(b'data', min(data_size, MAX_32BIT)))
+        f.seek(0, os.SEEK_END)
+        f.flush()
+        os.fsync(f.fileno())
+
+    def close(self):
+        self.finalize()
+        self._file.close()
+
+
+class FlacWriter:
+    """FLAC through libsndfile, which writes each frame as it is encoded.
+
+    A FLAC stream cut off mid-write still decodes up to its last complete
+    frame, so finalize() only has to flush.
+    """
+
+    def __init__(self, path, rate, channels):
+        if soundfile is None:
+            raise RuntimeError("FLAC recording needs the soundfile package and libsndfile")
+        self.channels = channels
+        self.frames = 0
+        self._file = soundfile.SoundFile(path, 'w', samplerate=rate, channels=channels,
+                                         format='FLAC', subtype='PCM_16')
+
+    def write(self, pcm):
+        samples = np.frombuffer(pcm, dtype=np.int16).reshape(-1, self.channels)
+        self._file.write(samples)
+        self.frames += len(samples)
+
+    def finalize(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+WRITERS = {
+    '.wav': WavWriter,
+    '.flac': FlacWriter,
+}
+
+
+def unique_path(path):
+    """path, or the first of name-2.ext, name-3.ext, ... that doesn't exist yet"""
+    stem, ext = os.path.splitext(path)
+    n = 1
+    while os.path.exists(path):
+        n += 1
+        path = f"{stem}-{n}{ext}"
+    return path
+
+
+class Recorder:
+    """Records a stream of audio blocks to disk without ever blocking the caller.
+
+    write() only queues a copy of the block; a writer thread converts and
+    writes it, and rewrites the header every FINALIZE_INTERVAL seconds.
+    Memory is bounded by QUEUE_BLOCKS: if the disk falls that far behind,
+    blocks are dropped (and counted) rather than stalling the audio. The
+    format comes from the file extension. If open() is called again with
+    a different rate or channel count, the recording continues in a new
+    numbered file (name-2.wav, ..., skipping names already on disk).
+    """
+
+    def __init__(self, path, queue_blocks=QUEUE_BLOCKS, finalize_interval=FINALIZE_INTERVAL):
+        self.path = path
+        self.finalize_interval = finalize_interval
+        self.writer_class = WRITERS.get(os.path.splitext(path)[1].lower())
+        if self.writer_class is None:
+            raise ValueError(f"Cannot record to '{path}': use one of {', '.join(WRITERS)}")
+        self.files = []
+        self.dropped = 0
+        self.format = None
+        self._queue = queue.Queue(queue_blocks)
+        self._thread = None
+        self._writer = None
+        self._done_frames = 0
+
+    @property
+    def frames(self):
+        """Frames written, over every file"""
+        return self._done_frames + (self._writer.frames if self._writer else 0)
+
+    def open(self, rate, channels):
+        """Start (or, for a new format, continue in a new file) recording"""
+        if (rate, channels) == self.format:
+            return
+        self.format = (rate, channels)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        self._queue.put(('format', rate, channels))
+
+    def write(self, data):
+        """Queue a block: float32 array in [-1, 1], or interleaved int16 (array or bytes)"""
+        if self.format is None:
+            return
+        block = data.copy() if isinstance(data, np.ndarray) else bytes(data)
+        try:
+            self._queue.put_nowait(block)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """Write out everything queued and finalize the file"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self.format = None
+
+    def _next_path(self):
+        return unique_path(self.path) if self.files else self.path
+
+    def _run(self):
+        last_finalize = time.monotonic()
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.finalize_interval)
+                except queue.Empty:
+                    item = ()
+                if item is None:
+                    break
+                if isinstance(item, tuple) and item and item[0] == 'format':
+                    self._close_writer()
+                    path = self._next_path()
+                    self._writer = self.writer_class(path, item[1], item[2])
+                    self.files.append(path)
+                elif len(item) and self._writer:
+                    if isinstance(item, np.ndarray):
+                        if item.dtype != np.int16:
+                            item = (np.clip(item, -1.0, 1.0) * FULL_SCALE).astype(np.int16)
+                        item = memoryview(np.ascontiguousarray(item)).cast('B')
+                    self._writer.write(item)
+                now = time.monotonic()
+                if self._writer and now - last_finalize >= self.finalize_interval:
+                    self._writer.finalize()
+                    last_finalize = now
+        except Exception as e:
+            print(f"Recording error: {e}")
+        finally:
+            self._close_writer()
+
+    def _close_writer(self):
+        if self._writer:
+            self._writer.close()
+            self._done_frames += self._writer.frames
+            self._writer = None
+
+
+class RecordingSink:
+    """Wraps a pipeline or mixer sink and records what is played through it"""
+
+    def __init__(self, sink, recorder):
+        self.sink = sink
+        self.recorder = recorder
+
+    def open(self, fmt):
+        self.sink.open(fmt)
+        self.recorder.open(fmt.rate, fmt.channels)
+
+    def write(self, data):
+        self.recorder.write(data)
+        self.sink.write(data)
+
+    def latency(self):
+        latency = getattr(self.sink, 'latency', None)
+        return latency() if latency else 0.0
+
+    def close(self):
+        self.sink.close()
+        self.recorder.close()
@@ -0,0 +1,69 @@
+import threading
+import time
+import numpy as np
+
+
+class RingBuffer:
+    """Preallocated single-producer/single-consumer ring of float32 frames.
+
+    Meant to sit between a real-time audio callback and a worker thread: the
+    callback only copies into the preallocated array and bumps a counter, so
+    it never allocates sample memory or blocks on I/O. Each side only ever
+    writes its own position counter, which keeps it safe without a lock
+    under the GIL. When the consumer falls behind, incoming frames are
+    dropped and counted in `overflows` rather than overwriting unread audio.
+    """
+
+    def __init__(self, capacity, channels, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self._buf = np.zeros((capacity, channels), dtype=np.float32)
+        self._written = 0   # Frames ever written (producer only)
+        self._read = 0      # Frames ever read (consumer only)
+        self._stamp = (0, 0.0)  # (frame index, perf_counter) at the end of the last write
+        self.overflows = 0  # Frames dropped because the ring was full
+        self._ready = threading.Event()
+
+    def available(self):
+        """Frames waiting to be read"""
+        return self._written - self._read
+
+    def write(self, frames, timestamp=None):
+        """Copy frames in (audio callback side); returns frames accepted"""
+        n = min(len(frames), self.capacity - (self._written - self._read))
+        if n < len(frames):
+            self.overflows += len(frames) - n
+        if n > 0:
+            start = self._written % self.capacity
+            first = min(n, self.capacity - start)
+            np.copyto(self._buf[start:start + first], frames[:first])
+            if first < n:
+                np.copyto(self._buf[:n - first], frames[first:n])
+            self._written += n
+        self._stamp = (self._written, time.perf_counter() if timestamp is None else timestamp)
+        self._ready.set()
+        return n
+
+    def read_into(self, out):
+        """Fill `out` with the next len(out) frames (worker side).
+
+        Returns the capture time of the first frame, or None if not enough
+        frames are buffered yet.
+        """
+        n = len(out)
+        if self._written - self._read < n:
+            return None
+        start = self._read % self.capacity
+        first = min(n, self.capacity - start)
+        np.copyto(out[:first], self._buf[start:start + first])
+        if first < n:
+            np.copyto(out[first:], self._buf[:n - first])
+        stamp_index, stamp_time = self._stamp
+        timestamp = stamp_time - (stamp_index - self._read) / self.rate
+        self._read += n
+        return timestamp
+
+    def wait(self, timeout):
+        """Block until the producer writes again, or the timeout passes"""
+        self._ready.wait(timeout)
+        self._ready.clear()
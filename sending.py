@@ -1,187 +1,563 @@
-import sounddevice as sd
+import argparse
+import signal
 import socket
-import struct
+import sys
+import threading
 import time
 import numpy as np
+from protocol import CONTROL_PORT, JOIN_MESSAGE, LEAVE_MESSAGE, HEADER_SIZE
+from codec import create_codec, available_codecs, CODECS
+from fec import FecEncoder
+from fanout import TargetSet
+from ring_buffer import RingBuffer
+from packetizer import Packetizer
+from udp_io import BatchSender
+from telemetry import Registry, MetricsServer
+from clock_sync import is_ping, pong_reply
+from autotune import AutoTuner, is_feedback, parse_feedback, socket_buffer_size
+from recorder import Recorder
+from cli import add_common_options, parse_args, host_port
+from device_cache import DeviceCache, CACHE_PATH
+from discovery import discover, pick_receiver, DISCOVERY_TIMEOUT
 
-# Configuration
-TARGET_IP = '192.168.1.16'  # Replace with your receiver IP
+try:
+    import sounddevice as sd
+except (ImportError, OSError):  # Not installed, or PortAudio missing
+    sd = None
+
+# Configuration defaults; each can be overridden by --config or the command line
 TARGET_PORT = 5005
 CHUNK = 512
+BLOCKSIZE = None  # Capture callback size in frames; None = smallest stable size from the device cache
+RING_SECONDS = 0.5  # Capture ring buffer between the audio callback and the sender thread
 BUFFER_SIZE = 131072
+MULTICAST_TTL = 1
+CODEC = 'pcm'  # One of codec.CODECS: 'pcm', 'lossless', 'opus'
+FEC_OVERHEAD = 0.0  # Parity bandwidth ratio, e.g. 0.25 = one parity per 4 packets; 0 = off
+FEC_INTERLEAVE = 1  # Spread parity groups to survive bursts of this many losses
+AUTO_TUNE = False  # Adjust the packet size from receiver feedback (starting at CHUNK)
+STATS_INTERVAL = 5.0  # Seconds between console summaries; 0 = metrics endpoint only
+METRICS_HOST = '127.0.0.1'
+DEVICE_CACHE = CACHE_PATH  # Probed device capabilities, reused across runs
+DISCOVER = False  # Find receivers with one LAN-wide query and send to the least loaded
 
-def list_audio_devices():
+def list_audio_devices(cache):
     """List all available audio devices"""
     print("\n" + "="*80)
     print("AVAILABLE AUDIO DEVICES")
     print("="*80)
-    
-    devices = sd.query_devices()
+
     input_devices = []
-    
-    for i, device in enumerate(devices):
+
+    for device in cache.devices():
         device_type = []
         if device['max_input_channels'] > 0:
             device_type.append("INPUT")
-            input_devices.append(i)
+            input_devices.append(device['index'])
         if device['max_output_channels'] > 0:
             device_type.append("OUTPUT")
-        
+
         type_str = "/".join(device_type) if device_type else "NONE"
-        
-        print(f"{i:2d}: {device['name']}")
+
+        print(f"{device['index']:2d}: {device['name']}")
         print(f"    Type: {type_str}")
         print(f"    Channels: IN={device['max_input_channels']}, OUT={device['max_output_channels']}")
         print(f"    Sample Rate: {device['default_samplerate']:.0f} Hz")
-        print(f"    Host API: {sd.query_hostapis(device['hostapi'])['name']}")
+        print(f"    Host API: {device['hostapi_name']}")
         print()
-    
+
     return input_devices
 
-def select_audio_device():
+def describe_capabilities(entry):
+    """Print what the cache knows about a device"""
+    print(f"   Sample Rates: {', '.join(str(r) for r in entry['rates']) or 'unknown'} Hz")
+    print(f"   Channels: {', '.join(str(c) for c in entry['channels']) or 'unknown'}")
+    if entry['blocksize']:
+        print(f"   Stable Blocksize: {entry['blocksize']} frames ({entry['latency'] * 1000:.1f}ms input latency)")
+
+def select_audio_device(cache):
     """Interactive device selection"""
-    input_devices = list_audio_devices()
-    
+    devices = cache.devices()
+    input_devices = list_audio_devices(cache)
+
     if not input_devices:
         print("❌ No input devices found!")
         return None
-    
+
     print("📍 INPUT DEVICES ONLY:")
     for idx in input_devices:
-        device = sd.query_devices(idx)
-        print(f"  {idx}: {device['name']}")
-    
+        print(f"  {idx}: {devices[idx]['name']}")
+
     while True:
         try:
-            choice = input(f"\nEnter device number (0-{len(sd.query_devices())-1}) or 'q' to quit: ").strip()
-            
+            choice = input(f"\nEnter device number (0-{len(devices)-1}) or 'q' to quit: ").strip()
+
             if choice.lower() == 'q':
                 return None
-            
+
             device_idx = int(choice)
-            
-            if device_idx < 0 or device_idx >= len(sd.query_devices()):
-                print(f"❌ Invalid device number. Must be 0-{len(sd.query_devices())-1}")
+
+            if device_idx < 0 or device_idx >= len(devices):
+                print(f"❌ Invalid device number. Must be 0-{len(devices)-1}")
                 continue
-            
-            device = sd.query_devices(device_idx)
-            
+
+            device = devices[device_idx]
+
             if device['max_input_channels'] == 0:
                 print(f"❌ Device {device_idx} has no input channels")
                 continue
-            
-            # Test device
+
+            # Test device (once; the result is cached for next time)
             print(f"\n🧪 Testing device {device_idx}: {device['name']}...")
-            try:
-                test_rate = int(device['default_samplerate'])
-                test_channels = min(device['max_input_channels'], 2)
-                
-                # Quick test recording
-                with sd.InputStream(device=device_idx, 
-                                  channels=test_channels, 
-                                  samplerate=test_rate, 
-                                  blocksize=1024):
-                    sd.sleep(100)  # Test for 100ms
-                
-                print(f"✅ Device test successful!")
-                print(f"   Sample Rate: {test_rate} Hz")
-                print(f"   Channels: {test_channels}")
-                
-                confirm = input(f"\nUse this device? (y/n): ").strip().lower()
-                if confirm in ['y', 'yes']:
-                    return device_idx
-                
-            except Exception as e:
-                print(f"❌ Device test failed: {e}")
+            entry = cache.capabilities(device_idx)
+            if entry['blocksize'] is None:
+                print(f"❌ Device test failed: could not capture from it")
                 continue
-                
+
+            print(f"✅ Device test successful!")
+            describe_capabilities(entry)
+
+            confirm = input(f"\nUse this device? (y/n): ").strip().lower()
+            if confirm in ['y', 'yes']:
+                return device_idx
+
         except ValueError:
             print("❌ Please enter a valid number")
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, EOFError):
             print("\n\nExiting...")
             return None
 
-# Initialize socket
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, BUFFER_SIZE)
-
-# Device selection
-print("🎵 AUDIO STREAMING SENDER")
-print("========================")
-DEVICE_INDEX = select_audio_device()
-
-if DEVICE_INDEX is None:
-    print("No device selected. Exiting.")
-    exit(1)
-
-# Query selected device info
-device_info = sd.query_devices(DEVICE_INDEX)
-RATE = int(device_info['default_samplerate'])
-CHANNELS = min(device_info['max_input_channels'], 2)
-
-print(f"📱 Selected Device: {device_info['name']}")
-print(f"📊 Sample Rate: {RATE} Hz")
-print(f"🔊 Channels: {CHANNELS}")
-print(f"📦 Chunk Size: {CHUNK}")
-print(f"🌐 Target: {TARGET_IP}:{TARGET_PORT}")
-print()
-
-# Global variables
-sequence_number = 0
-packets_sent = 0
-start_time = time.time()
-
-def callback(indata, frames, time_info, status):
-    global sequence_number, packets_sent
-    
-    if status:
-        print(f"Input status: {status}")
-    
+def find_input_device(spec, cache):
+    """Input device index from an index or a (case-insensitive, partial) name"""
+    devices = cache.devices()
+    if str(spec).isdigit():
+        idx = int(spec)
+        if idx >= len(devices) or devices[idx]['max_input_channels'] == 0:
+            raise ValueError(f"device {idx} is not an input device")
+        return idx
+    inputs = [d['index'] for d in cache.input_devices()]
+    exact = [i for i in inputs if devices[i]['name'].lower() == spec.lower()]
+    partial = [i for i in inputs if spec.lower() in devices[i]['name'].lower()]
+    matches = exact or partial
+    if not matches:
+        raise ValueError(f"no input device matches '{spec}'")
+    if len(matches) > 1:
+        names = ', '.join(f"{i}: {devices[i]['name']}" for i in matches)
+        raise ValueError(f"'{spec}' matches several input devices ({names})")
+    return matches[0]
+
+
+def discover_target(timeout=DISCOVERY_TIMEOUT):
+    """Query the LAN for receivers and return the least loaded one's (ip, port), or None"""
+    print(f"🔎 Discovering receivers ({timeout:.1f}s)...")
+    receivers = discover(timeout)
+    for r in sorted(receivers, key=lambda r: r['ip']):
+        formats = ', '.join(f"{f['rate']}Hz/{f['channels']}ch {f['codec']}" for f in r.get('formats', []))
+        print(f"   {r['ip']}:{r.get('port')} {r.get('name', '?')} - "
+              f"{r.get('streams', 0)}/{r.get('max_streams', '?')} streams"
+              f"{' (' + formats + ')' if formats else ''}")
+    chosen = pick_receiver(receivers)
+    return (chosen['ip'], chosen['port']) if chosen else None
+
+
+class Sender:
+    """Streams one capture to every receiver: ring -> packetize -> fan-out.
+
+    Creating a Sender opens its UDP socket but starts nothing; start() runs
+    the control listener and sender threads, and callback() is what the
+    audio input stream calls. Nothing here touches an audio device, so a
+    Sender can also be fed directly through callback() or send_block().
+    """
+
+    def __init__(self, rate, channels, targets=(), chunk=CHUNK, codec=CODEC,
+                 fec_overhead=FEC_OVERHEAD, fec_interleave=FEC_INTERLEAVE,
+                 multicast_group=None, target_port=TARGET_PORT, multicast_ttl=MULTICAST_TTL,
+                 buffer_size=BUFFER_SIZE, batch_io=False, ring_seconds=RING_SECONDS,
+                 control_port=CONTROL_PORT, auto_tune=False):
+        self.rate = rate
+        self.channels = channels
+        self.control_port = control_port
+        # Some codecs only accept certain packet sizes
+        self.encoder = create_codec(codec, rate, channels)
+        self.chunk = self.encoder.frame_size(chunk)
+        # Auto-tuning moves the packet size with what the receivers report
+        self.tuner = AutoTuner(rate, self.chunk, frame_size=self.encoder.frame_size) if auto_tune else None
+        if self.tuner:
+            self.chunk = self.tuner.chunk
+            buffer_size = max(buffer_size, self._buffer_size())
+        self.feedback_routes = {}  # Source port -> tuner, for streams sharing this control port
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, buffer_size)
+        if multicast_group:
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, multicast_ttl)
+
+        # Receivers: configured ones plus any that JOIN over the control channel
+        static_targets = list(targets)
+        if multicast_group:
+            static_targets.append((multicast_group, target_port))
+        self.targets = TargetSet(static_targets)
+        self.batch_sender = BatchSender(self.sock) if batch_io else None
+        self.fec_encoder = FecEncoder(fec_overhead, fec_interleave) if fec_overhead > 0 else None
+        self.packetizer = Packetizer(rate, channels, self.encoder, self.fec_encoder)
+        self.ring = RingBuffer(int(rate * ring_seconds), channels, rate)
+        self.running = False
+        self.start_time = time.time()
+        self._threads = []
+        self.taps = []  # Recorders (anything with write()) fed each captured block
+
+        self.capture_stats = {
+            'callbacks': 0,
+            'input_overflows': 0,   # Reported by PortAudio
+            'input_underflows': 0,
+        }
+        self.registry = Registry()
+        self.packets_sent = self.registry.counter('packets_sent', 'Audio packets sent (before fan-out)')
+        self.send_errors = self.registry.counter('send_errors', 'Failed sends')
+        self.send_latency = self.registry.histogram('capture_to_send_ms',
+                                                    'Capture timestamp to send done (ms)')
+        for name in self.capture_stats:
+            self.registry.counter(name, fn=lambda name=name: self.capture_stats[name])
+        self.registry.counter('ring_overflow_frames', 'Frames dropped because the sender fell behind',
+                              fn=lambda: self.ring.overflows)
+        self.registry.gauge('receivers', 'Current receivers', fn=lambda: len(self.targets))
+        self.registry.gauge('chunk_frames', 'Frames per packet', fn=lambda: self.chunk)
+
+    def send_packet(self, buffers):
+        """Send one already-encoded packet to every current receiver.
+
+        The packet is a list of buffers (header, payload) sent with scatter/gather
+        I/O, so they are never concatenated into a new bytes object. In batch
+        mode it is queued instead and goes out with the next flush.
+        """
+        if self.batch_sender:
+            self.batch_sender.queue(buffers, self.targets.snapshot())
+            return
+        for addr in self.targets.snapshot():
+            try:
+                if hasattr(self.sock, 'sendmsg'):
+                    self.sock.sendmsg(buffers, (), 0, addr)
+                else:  # Windows has no sendmsg
+                    self.sock.sendto(b''.join(buffers), addr)
+            except OSError as e:
+                self.send_errors.inc()
+                print(f"Send to {addr[0]}:{addr[1]} failed: {e}")
+
+    def control_listener(self):
+        """Control channel thread: receivers join and leave at runtime"""
+        ctrl = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        ctrl.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        ctrl.settimeout(1.0)
+        try:
+            ctrl.bind(('0.0.0.0', self.control_port))
+        except OSError as e:
+            print(f"Control channel unavailable: {e}")
+            return
+
+        while self.running:
+            try:
+                message, addr = ctrl.recvfrom(1024)
+                if is_ping(message):
+                    # Stamped on arrival; pong_reply stamps the reply time just before sending
+                    ctrl.sendto(pong_reply(message, time.perf_counter()), addr)
+                elif message == JOIN_MESSAGE:
+                    if self.targets.join(addr):
+                        print(f"Receiver joined: {addr[0]}:{addr[1]}")
+                elif message == LEAVE_MESSAGE:
+                    if self.targets.leave(addr):
+                        print(f"Receiver left: {addr[0]}:{addr[1]}")
+                elif is_feedback(message):
+                    self.take_feedback(addr, parse_feedback(message))
+            except socket.timeout:
+                pass
+            except OSError as e:
+                print(f"Control error: {e}")
+            for addr in self.targets.expire():
+                print(f"Receiver timed out: {addr[0]}:{addr[1]}")
+        ctrl.close()
+
+    def route_feedback(self, port, tuner):
+        """Hand reports on the stream receivers see coming from `port` to tuner.
+
+        Only one Sender on a host can own the control port; others (or a relay
+        in between) register their streams with it here.
+        """
+        self.feedback_routes[port] = tuner
+
+    def take_feedback(self, addr, feedback):
+        """Pass a receiver's report to the tuner of the stream it is about"""
+        tuner = self.feedback_routes.get(feedback.port)
+        if tuner is None and feedback.port == self.sock.getsockname()[1]:
+            tuner = self.tuner
+        if tuner is not None:
+            tuner.report(addr, feedback)
+
+    def callback(self, indata, frames, time_info, status):
+        """Real-time audio callback: only copies into the ring, no I/O or printing"""
+        self.capture_stats['callbacks'] += 1
+        if status:
+            if status.input_overflow:
+                self.capture_stats['input_overflows'] += 1
+            if status.input_underflow:
+                self.capture_stats['input_underflows'] += 1
+        self.ring.write(indata)
+
+    def send_block(self, block, timestamp):
+        """Packetize one CHUNK of captured audio and send it"""
+        for tap in self.taps:
+            tap.write(block)
+        try:
+            # Encoded once whatever the number of receivers; includes any parity packet
+            for packet in self.packetizer.packetize(block, timestamp):
+                self.send_packet(packet)
+            self.packets_sent.inc()
+            self.send_latency.observe((time.perf_counter() - timestamp) * 1000)
+        except Exception as e:
+            self.send_errors.inc()
+            print(f"Send error: {e}")
+
+    def sender_loop(self):
+        """Sender thread: drain the capture ring one CHUNK at a time"""
+        block = np.empty((self.chunk, self.channels), dtype=np.float32)
+        while self.running:
+            timestamp = self.ring.read_into(block)
+            if timestamp is None:
+                # Ring drained: whatever was queued in batch mode goes out now
+                if self.batch_sender and self.batch_sender.pending():
+                    try:
+                        self.batch_sender.flush()
+                    except OSError as e:
+                        print(f"Batch send failed: {e}")
+                self.ring.wait(0.1)
+                continue
+            self.send_block(block, timestamp)
+            if self.tuner:
+                chunk = self.tuner.update()
+                if chunk:
+                    block = self.resize(chunk)
+
+    def _buffer_size(self):
+        """Send buffer for the current packet size"""
+        return socket_buffer_size(self.chunk * self.channels * 2 + HEADER_SIZE)
+
+    def resize(self, chunk):
+        """Switch to a new packet size; returns a capture block of that size.
+
+        Receivers follow from the packet headers. The send buffer is
+        resized so it holds as many packets as before.
+        """
+        old = self.chunk
+        self.chunk = chunk
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self._buffer_size())
+        except OSError as e:
+            print(f"Cannot resize send buffer: {e}")
+        print(f"Auto-tune: {old} -> {chunk} frames/packet ({chunk / self.rate * 1000:.1f}ms)")
+        return np.empty((chunk, self.channels), dtype=np.float32)
+
+    def print_stats(self):
+        """Console summary, printed from the main thread rather than the send path"""
+        sent = self.packets_sent.value
+        elapsed = time.time() - self.start_time
+        latency = self.send_latency.get()
+        print(f"Sent {sent} packets in {elapsed:.1f}s ({sent / elapsed:.1f} pps), "
+              f"capture to send p50/p99: {latency['p50']:.2f}/{latency['p99']:.2f}ms, "
+              f"ring overflows: {self.ring.overflows} frames, "
+              f"input overflows: {self.capture_stats['input_overflows']}, "
+              f"send errors: {self.send_errors.value}")
+
+    def start(self, control=True):
+        """Start the sender thread and, unless disabled, the control listener"""
+        self.running = True
+        self.start_time = time.time()
+        workers = [self.sender_loop] + ([self.control_listener] if control else [])
+        self._threads = [threading.Thread(target=w, daemon=True) for w in workers]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Stop the threads (each notices within a second) and close the socket"""
+        self.running = False
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self._threads = []
+        self.sock.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Capture audio and stream it to receivers over UDP")
+    add_common_options(parser)
+    parser.add_argument('--target', action='append', type=host_port, metavar='IP[:PORT]',
+                        help=f"receiver to send to (repeatable; port defaults to {TARGET_PORT})")
+    parser.add_argument('--port', type=int, dest='target_port', metavar='PORT',
+                        help="default receiver port")
+    parser.add_argument('--rate', type=int, help="sample rate (default: the device's)")
+    parser.add_argument('--channels', type=int, help="capture channels (default: up to 2)")
+    parser.add_argument('--blocksize', type=int, metavar='FRAMES',
+                        help="capture callback size (default: the smallest the device sustains)")
+    parser.add_argument('--ring-seconds', type=float, metavar='SECONDS')
+    parser.add_argument('--multicast-ttl', type=int)
+    parser.add_argument('--codec', choices=sorted(CODECS))
+    parser.add_argument('--fec-overhead', type=float, metavar='RATIO')
+    parser.add_argument('--fec-interleave', type=int, metavar='N')
+    parser.add_argument('--record', metavar='FILE.wav|FILE.flac',
+                        help="also record the capture to this file")
+    parser.add_argument('--auto-tune', action=argparse.BooleanOptionalAction,
+                        help="adjust the packet size to what the receivers report")
+    parser.add_argument('--probe', action=argparse.BooleanOptionalAction,
+                        help="re-probe the device even if its capabilities are cached")
+    parser.add_argument('--device-cache', metavar='FILE', help="where probed capabilities are kept")
+    parser.add_argument('--discover', action=argparse.BooleanOptionalAction,
+                        help="find receivers on the LAN and send to the least loaded one")
+    parser.add_argument('--discover-timeout', type=float, metavar='SECONDS')
+    parser.add_argument('--interactive', action='store_true',
+                        help="pick the device from a menu (the default without --device on a terminal)")
+    parser.set_defaults(target=[], target_port=TARGET_PORT, chunk=CHUNK, blocksize=BLOCKSIZE,
+                        ring_seconds=RING_SECONDS, buffer_size=BUFFER_SIZE,
+                        multicast_ttl=MULTICAST_TTL, codec=CODEC, fec_overhead=FEC_OVERHEAD,
+                        fec_interleave=FEC_INTERLEAVE, batch_io=False, probe=False, auto_tune=AUTO_TUNE,
+                        device_cache=DEVICE_CACHE, discover=DISCOVER, discover_timeout=DISCOVERY_TIMEOUT,
+                        stats_interval=STATS_INTERVAL, metrics_host=METRICS_HOST)
+    return parser
+
+def resolve_device(args, cache):
+    """Input device index: --device, the interactive menu, or the system default"""
+    if args.device is not None:
+        return find_input_device(args.device, cache)
+    if args.interactive or sys.stdin.isatty():
+        print("🎵 AUDIO STREAMING SENDER")
+        print("========================")
+        return select_audio_device(cache)
+    return sd.default.device[0]
+
+def main(argv=None):
+    parser = build_parser()
+    args = parse_args(parser, argv)
+    if sd is None:
+        print("❌ The sender needs the sounddevice package (and PortAudio)")
+        return 1
+    cache = DeviceCache(args.device_cache)
+    if args.list_devices:
+        list_audio_devices(cache)
+        return 0
+
     try:
-        # Convert float32 to int16 for compatibility
-        audio_int16 = (indata * 32767).astype(np.int16)
-        
-        # Create packet with sequence number and timestamp
-        timestamp = time.perf_counter()
-        packet = struct.pack('Qd', sequence_number, timestamp) + audio_int16.tobytes()
-        
-        # Send packet
-        sock.sendto(packet, (TARGET_IP, TARGET_PORT))
-        
-        sequence_number += 1
-        packets_sent += 1
-        
-        # Print stats every 100 packets
-        if packets_sent % 100 == 0:
-            elapsed = time.time() - start_time
-            print(f"Sent {packets_sent} packets in {elapsed:.1f}s ({packets_sent/elapsed:.1f} pps)")
-            
-    except Exception as e:
-        print(f"Callback error: {e}")
+        device_index = resolve_device(args, cache)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    if device_index is None or device_index < 0:
+        print("No device selected. Exiting.")
+        return 1
+    device_info = cache.devices()[device_index]
+
+    # Rates, channels and the smallest stable blocksize are probed on first use only.
+    # Measuring the blocksize means seconds of capture: skip it when --blocksize
+    # decides anyway, or when the result could not be kept for the next restart.
+    measure = not args.blocksize and cache.writable()
+    if not args.blocksize and not measure:
+        print(f"Device cache {cache.path} is not writable: not measuring the blocksize "
+              f"(the host API picks it; --blocksize sets it)")
+    entry = cache.capabilities(device_index, measure=measure, reprobe=args.probe)
+    try:
+        cache.save()
+    except OSError as e:
+        print(f"Device cache not saved: {e}")
+    if measure and entry['blocksize'] is None:
+        print(f"❌ Could not capture from {device_info['name']}")
+        return 1
+    rate, channels, blocksize, latency = cache.best_config(device_index, args.channels, measure=False)
+    rate = args.rate or rate
+    targets = [(host, port or args.target_port) for host, port in args.target]
+    if args.discover:
+        target = discover_target(args.discover_timeout)
+        if target is None:
+            print("❌ No receiver accepting streams answered discovery")
+            return 1
+        print(f"🎯 Sending to {target[0]}:{target[1]}")
+        targets.append(target)
+    try:
+        sender = Sender(rate, channels, targets, chunk=args.chunk, codec=args.codec,
+                        fec_overhead=args.fec_overhead, fec_interleave=args.fec_interleave,
+                        multicast_group=args.multicast_group, target_port=args.target_port,
+                        multicast_ttl=args.multicast_ttl, buffer_size=args.buffer_size,
+                        batch_io=args.batch_io, ring_seconds=args.ring_seconds,
+                        auto_tune=args.auto_tune)
+    except (ValueError, RuntimeError) as e:
+        print(f"❌ Codec '{args.codec}' unavailable: {e} (available: {', '.join(available_codecs())})")
+        return 1
+
+    print(f"📱 Selected Device: {device_info['name']}")
+    print(f"📊 Sample Rate: {rate} Hz")
+    print(f"🔊 Channels: {channels}")
+    if not args.blocksize and latency is not None:
+        print(f"⏱️  Blocksize: {blocksize} frames ({latency * 1000:.1f}ms input latency)")
+    print(f"📦 Chunk Size: {sender.chunk}{' (auto-tuned)' if sender.tuner else ''}")
+    print(f"🗜️  Codec: {sender.encoder.name}")
+    if sender.fec_encoder:
+        print(f"🛡️  FEC: 1 parity per {sender.fec_encoder.count} packets, "
+              f"interleave {sender.fec_encoder.stride}")
+    print(f"🌐 Targets: {', '.join(f'{ip}:{port}' for ip, port in sender.targets.snapshot()) or 'none yet'}")
+    print(f"🎛️  Control port: {CONTROL_PORT} (receivers JOIN here)")
+    if sender.batch_sender:
+        print(f"📨 Batched I/O: {sender.batch_sender.mode}")
+    print()
+
+    recorder = None
+    if args.record:
+        try:
+            recorder = Recorder(args.record)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 1
+        recorder.open(rate, channels)
+        sender.taps.append(recorder)
+        print(f"🎙️  Recording to {args.record}")
 
-def main():
-    print(f"Starting audio stream to {TARGET_IP}:{TARGET_PORT}")
+    print(f"Starting audio stream to {len(sender.targets)} receiver(s)")
+    metrics_server = None
+    if args.metrics_port is not None:
+        metrics_server = MetricsServer(sender.registry, args.metrics_port, args.metrics_host).start()
+        print(f"Metrics on http://{args.metrics_host}:{metrics_server.port}/metrics")
     print("Press Ctrl+C to stop...")
-    
+
+    # A supervisor's SIGTERM stops the stream the same way Ctrl+C does
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    sender.start()
+    status = 0
+
     try:
         with sd.InputStream(
-            device=DEVICE_INDEX,
-            channels=CHANNELS,
-            samplerate=RATE,
-            blocksize=CHUNK,
+            device=device_index,
+            channels=channels,
+            samplerate=rate,
+            blocksize=args.blocksize or blocksize or 0,
             latency='low',
-            callback=callback,
+            callback=sender.callback,
             dtype=np.float32
         ):
-            while True:
-                sd.sleep(1000)
-                
+            last_stats = time.time()
+            while not stopping.wait(1.0):
+                if args.stats_interval and time.time() - last_stats >= args.stats_interval:
+                    sender.print_stats()
+                    last_stats = time.time()
+        print(f"\nSender stopped. Sent {sender.packets_sent.value} packets total.")
+
     except KeyboardInterrupt:
-        print(f"\nSender stopped. Sent {packets_sent} packets total.")
+        print(f"\nSender stopped. Sent {sender.packets_sent.value} packets total.")
     except Exception as e:
         print(f"Stream error: {e}")
+        status = 1
     finally:
-        sock.close()
+        sender.stop()
+        if recorder:
+            recorder.close()
+            print(f"Recorded {recorder.frames / rate:.1f}s to {', '.join(recorder.files)}"
+                  f"{f' ({recorder.dropped} blocks dropped)' if recorder.dropped else ''}")
+        if metrics_server:
+            metrics_server.stop()
+    return status
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
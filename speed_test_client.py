@@ -1,37 +1,307 @@
+import argparse
+import json
+import os
 import socket
+import sys
+import threading
 import time
+import numpy as np
+from protocol import HEADER_SIZE
+from linktest import PROBE, PROBE_MAGIC, pack_end, parse_report, percentiles, recommended_depth
 
 HOST = '192.168.1.17'  # Replace with Termux device IP or use '127.0.0.1' if on same device
 PORT = 50007
 DATA_SIZE = 65526
 NUM_ITERATIONS = 10  # Number of send/receive cycles
-data_to_send = b'a' * DATA_SIZE
 
-total_bytes = 0
-total_time = 0
+# UDP link test: by default the sender's stream, 512 frames of 48kHz stereo PCM per packet
+RATE = 48000
+CHUNK = 512
+CHANNELS = 2
+DURATION = 30.0    # Seconds of sustained sending
+DEPTH = 4          # Jitter buffer depth (packets) the link is qualified for
+DRAIN = 0.5        # Seconds to let the last probes arrive before asking for the report
+REPORT_TRIES = 5   # ENDs sent (one per second) before giving up on a report
+STREAMS = 1        # Parallel connections (TCP) or runs (UDP), e.g. one per room
 
-with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-    s.connect((HOST, PORT))
-    
-    for i in range(NUM_ITERATIONS):
-        start = time.perf_counter()
-        s.sendall(data_to_send)
-        received = s.recv(DATA_SIZE)
-        end = time.perf_counter()
-
-        if not received:
+def recv_exact(s, size):
+    """Read exactly size bytes; fewer only if the server closed the connection"""
+    buf = bytearray(size)
+    view = memoryview(buf)
+    got = 0
+    while got < size:
+        n = s.recv_into(view[got:])
+        if not n:
             break
+        got += n
+    return buf[:got]
+
+def tcp_stream(host, port, size, iterations, duration, start, verbose):
+    """One connection's echo round trips; returns (bytes echoed, seconds)"""
+    data_to_send = b'a' * size
+    total_bytes = 0
+    total_time = 0
+
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.connect((host, port))
+        start.wait()  # Every stream starts together
+
+        i = 0
+        began = time.perf_counter()
+        while (i < iterations if duration is None else time.perf_counter() - began < duration):
+            t0 = time.perf_counter()
+            s.sendall(data_to_send)
+            received = recv_exact(s, size)  # recv() may return any part of the echo
+            elapsed = time.perf_counter() - t0
+
+            if len(received) < size:
+                print("Server closed the connection")
+                break
+
+            total_time += elapsed
+            total_bytes += len(received)
+            i += 1
+            if verbose:
+                print(f"Iteration {i}: {len(received)} bytes in {elapsed:.6f} seconds")
+    return total_bytes, total_time
+
+def tcp_test(host, port, size=DATA_SIZE, iterations=NUM_ITERATIONS, streams=1, duration=None):
+    """Round trips of size-byte blocks through the echo server, on `streams` connections at once"""
+    results = [None] * streams
+    errors = []
+    start = threading.Barrier(streams + 1)
+
+    def run(index):
+        try:
+            results[index] = tcp_stream(host, port, size, iterations, duration, start, streams == 1)
+        except OSError as e:
+            errors.append(f"stream {index + 1}: {e}")
+            start.abort()
+        except threading.BrokenBarrierError:
+            pass  # Another stream could not connect
+
+    threads = [threading.Thread(target=run, args=(n,)) for n in range(streams)]
+    for thread in threads:
+        thread.start()
+    try:
+        start.wait()
+    except threading.BrokenBarrierError:
+        pass
+    wall = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - wall
+    for error in errors:
+        print(error)
+    if errors:
+        return 1
+
+    # Each block crosses the link twice
+    if streams > 1:
+        print(f"{'Stream':>6} {'Bytes':>12} {'Seconds':>9} {'Mbps':>9}")
+        for n, (total_bytes, total_time) in enumerate(results):
+            mbps = 2 * total_bytes * 8 / total_time / 1e6 if total_time else 0.0
+            print(f"{n + 1:>6} {total_bytes:>12} {total_time:>9.3f} {mbps:>9.2f}")
+        total_bytes = sum(r[0] for r in results)
+        total_time = wall
+    else:
+        total_bytes, total_time = results[0]
+    if not total_time:
+        return 1
+    speed_mbps = (2 * total_bytes * 8) / (total_time * 1_000_000)  # bits per second -> megabits/sec
+    speed_MBps = 2 * total_bytes / (total_time * 1024 * 1024)      # bytes per second -> megabytes/sec
+
+    print(f"\nTotal: {total_bytes} bytes echoed in {total_time:.6f} seconds"
+          f"{f' over {streams} streams' if streams > 1 else ''}")
+    print(f"Transfer speed: {speed_mbps:.2f} Mbps ({speed_MBps:.2f} MB/s)")
+    return 0
+
+def send_probes(s, addr, session, packet_size, interval, duration):
+    """Send paced probes; returns (count, send slips in seconds behind schedule)"""
+    count = int(duration / interval)
+    packet = bytearray(packet_size)
+    slips = np.zeros(count)
+    start = time.monotonic() + 0.05
+    for seq in range(count):
+        due = start + seq * interval
+        now = time.monotonic()
+        if due > now:
+            time.sleep(due - now)
+            now = time.monotonic()
+        slips[seq] = now - due
+        PROBE.pack_into(packet, 0, PROBE_MAGIC, session, seq, now)
+        try:
+            s.sendto(packet, addr)
+        except OSError:
+            pass  # Counted as loss by the server
+    return count, slips
+
+def fetch_report(s, addr, session, count, budget):
+    s.settimeout(1.0)
+    for _ in range(REPORT_TRIES):
+        s.sendto(pack_end(session, count, budget), addr)
+        deadline = time.monotonic() + 1.0
+        while time.monotonic() < deadline:
+            try:
+                data, _ = s.recvfrom(65536)
+            except socket.timeout:
+                break
+            report = parse_report(data)
+            if report is not None:
+                return report
+    return None
+
+def print_report(report, profile):
+    print(f"\nUDP link test: {profile['packet_size']} byte datagrams at {profile['packets_per_second']:.1f}/s "
+          f"({profile['interval_ms']:.2f} ms apart) for {profile['duration_s']:.0f}s")
+    print(f"  Loss:       {report['lost']}/{report['sent']} ({report['loss_percent']:.3f}%)")
+    print(f"  Reordered:  {report['reordered']} ({report['reorder_percent']:.3f}%), "
+          f"max distance {report['max_reorder_distance']}; duplicates {report['duplicates']}")
+    if 'pdv_ms' not in report:
+        return
+    print(f"  Jitter:     {report['jitter_ms']:.3f} ms (RFC 3550)")
+    for name, key in (('IPDV', 'ipdv_ms'), ('Delay var.', 'pdv_ms')):
+        p = report[key]
+        if p:
+            print(f"  {name + ':':<11} p50 {p['p50']:.3f}  p95 {p['p95']:.3f}  p99 {p['p99']:.3f}  "
+                  f"p99.9 {p['p99.9']:.3f}  max {p['max']:.3f} ms")
+    if profile['send_slip_ms']:
+        print(f"  Send slip:  p99 {profile['send_slip_ms']['p99']:.3f} ms (this host's pacing)")
+    print(f"  Throughput: {report['throughput_mbps']:.2f} Mbps")
+    if 'late_percent' in report:
+        print(f"  Late for a {profile['depth']} packet buffer ({report['budget_ms']:.1f} ms): "
+              f"{report['late']} ({report['late_percent']:.3f}%)")
+    if profile['recommended_depth'] is not None:
+        print(f"  Buffer covering p99.9: {profile['recommended_depth']} packets "
+              f"({profile['recommended_depth'] * profile['interval_ms']:.1f} ms)")
+
+def udp_stream(args, packet_size, interval, start):
+    """One paced UDP run with its own session; returns the server's report, or None"""
+    addr = (args.host, args.port)
+    session = int.from_bytes(os.urandom(4), 'little')
+    budget = args.depth * interval
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        start.wait()  # Every stream starts together
+        count, slips = send_probes(s, addr, session, packet_size, interval, args.duration)
+        time.sleep(DRAIN)
+        report = fetch_report(s, addr, session, count, budget)
+    if report is None:
+        return None
+    report['profile'] = {
+        'packet_size': packet_size,
+        'packets_per_second': 1 / interval,
+        'interval_ms': interval * 1000,
+        'duration_s': args.duration,
+        'depth': args.depth,
+        'send_slip_ms': percentiles(slips),
+        'recommended_depth': recommended_depth(report, interval),
+    }
+    return report
+
+def udp_test(args):
+    """args.streams paced UDP runs at once with the audio stream's packet profile; returns their reports"""
+    packet_size = args.packet_size or HEADER_SIZE + args.chunk * args.channels * 2
+    if packet_size < PROBE.size:
+        raise ValueError(f"packets must be at least {PROBE.size} bytes")
+    interval = 1 / args.pps if args.pps else args.chunk / args.rate
+    reports = [None] * args.streams
+    start = threading.Barrier(args.streams)
+
+    def run(index):
+        reports[index] = udp_stream(args, packet_size, interval, start)
+
+    threads = [threading.Thread(target=run, args=(n,)) for n in range(args.streams)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return reports
 
-        elapsed = end - start
-        total_time += elapsed
-        total_bytes += len(received)
+def udp_total(reports):
+    """Every stream's packets taken together"""
+    sent = sum(r['sent'] for r in reports)
+    lost = sum(r['lost'] for r in reports)
+    return {
+        'streams': len(reports),
+        'sent': sent,
+        'lost': lost,
+        'loss_percent': lost / sent * 100 if sent else 0.0,
+        'throughput_mbps': sum(r.get('throughput_mbps', 0.0) for r in reports),
+        'worst_late_percent': max(r.get('late_percent', 0.0) for r in reports),
+        'worst_pdv_p99_ms': max((r.get('pdv_ms') or {}).get('p99', 0.0) for r in reports),
+    }
 
-        print(f"Iteration {i+1}: {len(received)} bytes in {elapsed:.6f} seconds")
+def check(report, max_loss=None, max_late=None):
+    """Threshold failures in a report, as messages"""
+    failures = []
+    if max_loss is not None and report['loss_percent'] > max_loss:
+        failures.append(f"loss {report['loss_percent']:.3f}% > {max_loss}%")
+    if max_late is not None and report.get('late_percent', 0.0) > max_late:
+        failures.append(f"late {report['late_percent']:.3f}% > {max_late}%")
+    return failures
 
-# Calculate speed
-speed_mbps = (total_bytes * 8) / (total_time * 1_000_000)  # bits per second -> megabits/sec
-speed_MBps = total_bytes / (total_time * 1024 * 1024)      # bytes per second -> megabytes/sec
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure a link: TCP echo throughput or a paced UDP run")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--mode', choices=['tcp', 'udp'], default='tcp')
+    parser.add_argument('--streams', type=int, default=STREAMS, metavar='N',
+                        help="parallel connections or UDP runs, e.g. one per room")
+    parser.add_argument('--size', type=int, default=DATA_SIZE, help="TCP block size")
+    parser.add_argument('--iterations', type=int, default=NUM_ITERATIONS, help="TCP round trips")
+    parser.add_argument('--rate', type=int, default=RATE, help="UDP: stream sample rate")
+    parser.add_argument('--chunk', type=int, default=CHUNK, help="UDP: frames per packet")
+    parser.add_argument('--channels', type=int, default=CHANNELS, help="UDP: stream channels")
+    parser.add_argument('--packet-size', type=int, metavar='BYTES',
+                        help="UDP: datagram size (default: a PCM packet of --chunk frames)")
+    parser.add_argument('--pps', type=float, help="UDP: packets per second (default: rate / chunk)")
+    parser.add_argument('--duration', type=float, metavar='SECONDS',
+                        help=f"how long to run (default: --iterations for TCP, {DURATION:.0f}s for UDP)")
+    parser.add_argument('--depth', type=int, default=DEPTH, metavar='PACKETS',
+                        help="UDP: jitter buffer depth to count late packets against")
+    parser.add_argument('--max-loss', type=float, metavar='PERCENT', help="UDP: fail above this loss")
+    parser.add_argument('--max-late', type=float, metavar='PERCENT',
+                        help="UDP: fail above this share of packets late for --depth")
+    parser.add_argument('--json', action='store_true', help="UDP: print the report as JSON")
+    args = parser.parse_args(argv)
 
-print(f"\nTotal: {total_bytes} bytes in {total_time:.6f} seconds")
-print(f"Transfer speed: {speed_mbps:.2f} Mbps ({speed_MBps:.2f} MB/s)")
+    if args.streams < 1:
+        print("Need at least one stream")
+        return 1
+    if args.mode == 'tcp':
+        return tcp_test(args.host, args.port, args.size, args.iterations, args.streams, args.duration)
+    if args.duration is None:
+        args.duration = DURATION
+    try:
+        reports = udp_test(args)
+    except ValueError as e:
+        print(e)
+        return 1
+    if None in reports:
+        print(f"No report from {args.host}:{args.port} for {reports.count(None)} stream(s) "
+              f"(is speed_test_server.py running?)")
+        return 1
+    if args.json:
+        output = reports[0] if len(reports) == 1 else {'streams': reports, 'total': udp_total(reports)}
+        print(json.dumps(output, indent=1))
+    else:
+        for n, report in enumerate(reports):
+            if len(reports) > 1:
+                print(f"\n=== Stream {n + 1} ===")
+            print_report(report, report['profile'])
+        if len(reports) > 1:
+            total = udp_total(reports)
+            print(f"\nTotal: {total['streams']} streams, {total['lost']}/{total['sent']} lost "
+                  f"({total['loss_percent']:.3f}%), {total['throughput_mbps']:.2f} Mbps, "
+                  f"worst late {total['worst_late_percent']:.3f}%")
+    failures = []
+    for n, report in enumerate(reports):
+        prefix = f"stream {n + 1}: " if len(reports) > 1 else ''
+        failures += [prefix + failure for failure in check(report, args.max_loss, args.max_late)]
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
 
+if __name__ == '__main__':
+    sys.exit(main())
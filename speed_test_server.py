@@ -1,50 +1,113 @@
+import argparse
+import asyncio
 import socket
 import sys
+import time
+from linktest import LinkTestServer
 
 HOST = None  # All available interfaces
-PORT = 50007
-s = None
+PORT = 50007  # TCP echo and UDP link test both use this port
+BLOCK_SIZE = 65536
+BACKLOG = 128  # Pending connections; many rooms may connect at once
+UDP_BUFFER = 4 * 1024 * 1024  # Receive buffer for the UDP test; bursts must not overflow it
+EXPIRE_INTERVAL = 5.0  # Seconds between sweeps of idle UDP sessions
 
-for res in socket.getaddrinfo(HOST, PORT, socket.AF_UNSPEC,
-                              socket.SOCK_STREAM, 0, socket.AI_PASSIVE):
-    af, socktype, proto, canonname, sa = res
-    try:
-        s = socket.socket(af, socktype, proto)
-    except OSError:
-        s = None
-        continue
+class EchoServer:
+    """Echoes every TCP client's bytes back to it, any number of clients at once"""
+
+    def __init__(self):
+        self.clients = 0
+        self.total = 0
+
+    async def handle(self, reader, writer):
+        addr = writer.get_extra_info('peername')
+        self.clients += 1
+        self.total += 1
+        echoed = 0
+        start = time.monotonic()
+        print(f"Connected by {addr[0]}:{addr[1]} ({self.clients} client(s))")
+        try:
+            while True:
+                data = await reader.read(BLOCK_SIZE)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()  # Everything is sent, and a slow reader holds back only its own echo
+                echoed += len(data)
+        except OSError as e:
+            print(f"{addr[0]}:{addr[1]}: {e}")
+        finally:
+            self.clients -= 1
+            writer.close()
+            elapsed = time.monotonic() - start
+            print(f"Client {addr[0]}:{addr[1]} disconnected: {echoed} bytes echoed in {elapsed:.1f}s "
+                  f"({self.clients} client(s))")
+
+class _LinkTestProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        reply = self.server.handle(data, addr, time.monotonic())
+        if reply is not None:
+            self.transport.sendto(reply, addr)
+
+    def error_received(self, exc):
+        pass
+
+def open_udp(host, port):
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     try:
-        s.bind(sa)
-        s.listen(1)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_BUFFER)
     except OSError:
-        s.close()
-        s = None
-        continue
-    break
+        pass
+    s.bind((host or '0.0.0.0', port))
+    return s
+
+async def expire_sessions(link_test):
+    while True:
+        await asyncio.sleep(EXPIRE_INTERVAL)
+        link_test.expire()
 
-if s is None:
-    print('Could not open socket')
-    sys.exit(1)
+async def serve(host, port):
+    echo = EchoServer()
+    tcp = await asyncio.start_server(echo.handle, host, port, backlog=BACKLOG, reuse_address=True)
+    loop = asyncio.get_running_loop()
+    link_test = LinkTestServer()
+    transport = None
+    try:
+        transport, _ = await loop.create_datagram_endpoint(lambda: _LinkTestProtocol(link_test),
+                                                           sock=open_udp(host, port))
+    except OSError as e:
+        print(f"UDP link test unavailable: {e}")
+    expiry = asyncio.ensure_future(expire_sessions(link_test))
+    print(f"Server is listening on port {port} (TCP echo, UDP link test)...")
+    try:
+        async with tcp:
+            await tcp.serve_forever()
+    finally:
+        expiry.cancel()
+        if transport is not None:
+            transport.close()
 
-print(f"Server is listening on port {PORT}...")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="TCP echo and UDP link test server")
+    parser.add_argument('--host', default=HOST, help="address to listen on (default: all)")
+    parser.add_argument('--port', type=int, default=PORT)
+    args = parser.parse_args(argv)
 
-while True:
     try:
-        conn, addr = s.accept()
-        with conn:
-            print('Connected by', addr)
-            while True:
-                data = conn.recv(65526)
-                if not data:
-                    print('Client disconnected')
-                    break
-                conn.send(data)
+        asyncio.run(serve(args.host, args.port))
+    except OSError as e:
+        print(f"Could not open socket: {e}")
+        return 1
     except KeyboardInterrupt:
         print('\nServer stopped by user')
-        break
-    except Exception as e:
-        print(f"Error: {e}")
-        continue
-
-s.close()
+    return 0
 
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,243 @@
+import json
+import math
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Default latency histogram range: 10 us to 10 s, 20 buckets per decade (~12% wide)
+HISTOGRAM_LOW = 0.01
+HISTOGRAM_HIGH = 10000.0
+BUCKETS_PER_DECADE = 20
+QUANTILES = {'p50': 0.5, 'p99': 0.99, 'p999': 0.999}
+
+
+class Counter:
+    """Monotonic count; fn, if given, is read at export time instead"""
+    kind = 'counter'
+
+    def __init__(self, fn=None):
+        self.value = 0
+        self.fn = fn
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def get(self):
+        return self.fn() if self.fn else self.value
+
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+    kind = 'gauge'
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    """Fixed log-spaced buckets; observe() is O(1) and allocates no containers.
+
+    Values at or below `low` land in the first bucket and values above
+    `high` in the last, so quantiles are exact to within one bucket width
+    inside the range and clamped outside it.
+    """
+    kind = 'histogram'
+
+    def __init__(self, low=HISTOGRAM_LOW, high=HISTOGRAM_HIGH, per_decade=BUCKETS_PER_DECADE):
+        self.low = low
+        self._scale = per_decade / math.log(10)
+        self._log_low = math.log(low)
+        size = int(math.ceil(math.log10(high / low) * per_decade)) + 2
+        # bounds[i] is bucket i's upper edge; the last bucket is unbounded
+        self.bounds = [low * 10 ** (i / per_decade) for i in range(size - 1)] + [math.inf]
+        self.counts = [0] * size
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+        if value <= self.low:
+            self.counts[0] += 1
+            return
+        i = int(math.ceil((math.log(value) - self._log_low) * self._scale))
+        self.counts[i if i < len(self.counts) else -1] += 1
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def quantile(self, q, counts=None):
+        """The q-th quantile, interpolated linearly inside the bucket holding it (capped at the max seen)"""
+        counts = counts or self.counts
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        lower = 0.0
+        for bound, n in zip(self.bounds, counts):
+            if n and seen + n >= rank:
+                upper = min(bound, self.max)
+                lower = min(lower, upper)
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+            lower = bound
+        return self.max
+
+    def get(self):
+        counts = list(self.counts)  # Consistent view while the owner keeps observing
+        result = {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'max': self.max,
+        }
+        for label, q in QUANTILES.items():
+            result[label] = self.quantile(q, counts)
+        result['buckets'] = counts
+        return result
+
+
+class Registry:
+    """Named, labelled metrics, exportable as JSON or Prometheus text.
+
+    Metrics are created once (by whoever owns the stream or subsystem) and
+    then updated directly through the returned object; the registry is
+    only walked at export time.
+    """
+
+    def __init__(self, prefix='musync'):
+        self.prefix = prefix
+        self._metrics = {}  # (name, labels) -> metric
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def _add(self, name, help, metric, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            existing = self._metrics.get(key)
+            if existing is not None:
+                return existing
+            self._metrics[key] = metric
+            if help:
+                self._help[name] = help
+        return metric
+
+    def counter(self, name, help='', fn=None, **labels):
+        return self._add(name, help, Counter(fn), labels)
+
+    def gauge(self, name, help='', fn=None, **labels):
+        return self._add(name, help, Gauge(fn), labels)
+
+    def histogram(self, name, help='', low=HISTOGRAM_LOW, high=HISTOGRAM_HIGH,
+                  per_decade=BUCKETS_PER_DECADE, **labels):
+        return self._add(name, help, Histogram(low, high, per_decade), labels)
+
+    def remove(self, **labels):
+        """Drop every metric carrying all of these labels, e.g. a closed stream's"""
+        wanted = set(labels.items())
+        with self._lock:
+            for key in [k for k in self._metrics if wanted <= set(k[1])]:
+                del self._metrics[key]
+
+    def _items(self):
+        with self._lock:
+            return sorted(self._metrics.items(), key=lambda item: item[0])
+
+    def snapshot(self):
+        """{name: [{'labels': {...}, 'value': ...}, ...]}"""
+        result = {}
+        for (name, labels), metric in self._items():
+            result.setdefault(name, []).append({'labels': dict(labels), 'value': metric.get()})
+        return result
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=1)
+
+    def to_prometheus(self):
+        lines = []
+        last_name = None
+        for (name, labels), metric in self._items():
+            full = f"{self.prefix}_{name}"
+            if name != last_name:
+                if name in self._help:
+                    lines.append(f"# HELP {full} {self._help[name]}")
+                lines.append(f"# TYPE {full} {metric.kind}")
+                last_name = name
+            if metric.kind != 'histogram':
+                lines.append(f"{full}{_labels(labels)} {_number(metric.get())}")
+                continue
+            counts = list(metric.counts)
+            cumulative = 0
+            # Every bucket, empty ones included, so each series has the same le set
+            for bound, n in zip(metric.bounds, counts):
+                cumulative += n
+                le = '+Inf' if bound == math.inf else f"{bound:.6g}"
+                lines.append(f"{full}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{full}_sum{_labels(labels)} {_number(metric.sum)}")
+            lines.append(f"{full}_count{_labels(labels)} {metric.count}")
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+def _number(value):
+    return f"{value:.6g}" if isinstance(value, float) else str(value)
+
+
+class MetricsServer:
+    """Serves a registry over HTTP from a background thread.
+
+    GET /metrics is Prometheus text, anything else JSON. Binds to
+    localhost by default; nothing is printed per request, so scraping
+    never touches the console.
+    """
+
+    def __init__(self, registry, port, host='127.0.0.1'):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith('/metrics') and not self.path.startswith('/metrics.json'):
+                    body = registry.to_prometheus().encode()
+                    content_type = 'text/plain; version=0.0.4'
+                else:
+                    body = registry.to_json().encode()
+                    content_type = 'application/json'
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,429 @@
+import ctypes
+import errno
+import select
+import socket
+import struct
+import sys
+
+SLAB_SLOTS = 128
+SLOT_SIZE = 16384  # Largest datagram we accept: 2048 stereo int16 frames plus headers
+BATCH_SIZE = 32    # Datagrams per batched syscall
+MAX_MESSAGES = 1024  # Kernel limit (UIO_MAXIOV) on messages per sendmmsg/recvmmsg
+GSO_MAX_SEGMENTS = 64
+GSO_MAX_BYTES = 65000
+
+# Linux socket options for UDP segmentation offload
+UDP_SEGMENT = 103
+MSG_WAITFORONE = 0x10000
+MSG_TRUNC = getattr(socket, 'MSG_TRUNC', 0x20)
+
+
+class _iovec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+
+class _msghdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_name', ctypes.c_void_p),
+        ('msg_namelen', ctypes.c_uint32),
+        ('msg_iov', ctypes.c_void_p),
+        ('msg_iovlen', ctypes.c_size_t),
+        ('msg_control', ctypes.c_void_p),
+        ('msg_controllen', ctypes.c_size_t),
+        ('msg_flags', ctypes.c_int),
+    ]
+
+
+class _mmsghdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _msghdr), ('msg_len', ctypes.c_uint)]
+
+
+class _sockaddr_in(ctypes.Structure):
+    _fields_ = [
+        ('sin_family', ctypes.c_ushort),
+        ('sin_port', ctypes.c_uint16),   # Network byte order
+        ('sin_addr', ctypes.c_uint8 * 4),
+        ('sin_zero', ctypes.c_uint8 * 8),
+    ]
+
+
+def _load_libc():
+    """libc with sendmmsg/recvmmsg, or None where batching is unavailable"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+        libc.recvmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int,
+                                  ctypes.c_void_p]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+_libc = _load_libc()
+
+
+def gso_supported(sock):
+    """True if the kernel accepts UDP_SEGMENT on this socket"""
+    if not sys.platform.startswith('linux') or not hasattr(sock, 'sendmsg'):
+        return False
+    try:
+        sock.getsockopt(socket.SOL_UDP, UDP_SEGMENT)
+        return True
+    except OSError:
+        return False
+
+
+def recv_into(sock, slot, flags=0):
+    """recvfrom_into() that also reports truncation: (bytes, addr, truncated).
+
+    A datagram longer than the slot is cut to fit; recvmsg_into() says so in
+    its flags where recvfrom_into() cannot.
+    """
+    if hasattr(sock, 'recvmsg_into'):
+        n, _, msg_flags, addr = sock.recvmsg_into([slot], 0, flags)
+        return n, addr, bool(msg_flags & MSG_TRUNC)
+    n, addr = sock.recvfrom_into(slot, 0, flags)
+    return n, addr, False
+
+
+def _buffer_address(buffer):
+    """Writable ctypes view over a bytearray (keep it alive as long as the address is used)"""
+    return (ctypes.c_char * len(buffer)).from_buffer(buffer)
+
+
+class PacketSlab:
+    """Round-robin receive buffers carved out of one preallocated bytearray.
+
+    recvfrom_into() writes straight into a slot, and everything downstream
+    works on memoryview slices of it, so receiving a packet allocates no
+    packet-sized memory. There is no explicit release: a slot is reused
+    `slots` packets later, so anything that keeps a payload longer than
+    that (a jitter buffer, an FEC group) must copy it.
+    """
+
+    def __init__(self, slots=SLAB_SLOTS, slot_size=SLOT_SIZE):
+        self.slots = slots
+        self.slot_size = slot_size
+        self._buffer = bytearray(slots * slot_size)
+        self._memory = memoryview(self._buffer)
+        self._views = [self._memory[i * slot_size:(i + 1) * slot_size] for i in range(slots)]
+        self._next = 0
+        self._ctypes_view = None
+
+    def address(self):
+        """Base address of the slab memory, for handing slots to the kernel directly"""
+        if self._ctypes_view is None:
+            self._ctypes_view = _buffer_address(self._buffer)
+        return ctypes.addressof(self._ctypes_view)
+
+    @property
+    def position(self):
+        """Index of the next free slot, without claiming it"""
+        return self._next
+
+    def advance(self, count):
+        """Claim `count` slots starting at position"""
+        self._next = (self._next + count) % self.slots
+
+    def next_slot(self):
+        """The next free slot as a writable memoryview"""
+        i = self._next
+        self._next = i + 1 if i + 1 < self.slots else 0
+        return self._views[i]
+
+    def view(self, index):
+        return self._views[index]
+
+    def recvfrom(self, sock):
+        """Receive one datagram into the next slot; returns (memoryview, addr).
+
+        The memoryview is None if the datagram was larger than a slot.
+        """
+        slot = self.next_slot()
+        n, addr, truncated = recv_into(sock, slot)
+        return (None if truncated else slot[:n]), addr
+
+
+class BatchSender:
+    """Queues outgoing datagrams and sends them in as few syscalls as possible.
+
+    queue() copies each packet once into a preallocated slab (so callers may
+    reuse their buffers right away) and records its destinations; flush()
+    sends everything queued. On Linux each destination's batch goes out as
+    one UDP GSO super-datagram, so a fan-out costs one syscall per receiver;
+    without GSO all destinations share one sendmmsg(), and elsewhere it falls
+    back to one sendto() per datagram. A packet too large for a slot skips
+    the slab and goes out at once with sendto(), after whatever is queued.
+    """
+
+    def __init__(self, sock, batch_size=BATCH_SIZE, slot_size=SLOT_SIZE, gso=True):
+        self.sock = sock
+        self.batch_size = batch_size
+        self.slot_size = slot_size
+        self.gso = gso and gso_supported(sock)
+        self.mmsg = _libc is not None
+        self.syscalls = 0
+        self.datagrams = 0
+
+        self._slab = bytearray(batch_size * slot_size)
+        self._slab_view = memoryview(self._slab)
+        self._slab_ctypes = _buffer_address(self._slab)  # Keeps the address valid
+        self._slab_base = ctypes.addressof(self._slab_ctypes)
+        self._lengths = []
+        self._dests = []  # (packet index, addr)
+        self._iov = (_iovec * batch_size)()
+        self._names = (_sockaddr_in * MAX_MESSAGES)()
+        self._msgs = (_mmsghdr * MAX_MESSAGES)()
+        self._sockaddrs = {}
+
+    @property
+    def mode(self):
+        if self.gso and self.mmsg:
+            return 'gso+sendmmsg'
+        return 'gso' if self.gso else 'sendmmsg' if self.mmsg else 'sendto'
+
+    def pending(self):
+        return len(self._lengths)
+
+    def queue(self, buffers, addrs):
+        """Copy one packet (a list of buffers) in and queue it for each address"""
+        sizes = [buf.nbytes if isinstance(buf, memoryview) else len(buf) for buf in buffers]
+        if sum(sizes) > self.slot_size:
+            self._send_now(buffers, addrs)
+            return
+        if len(self._lengths) == self.batch_size or len(self._dests) + len(addrs) > MAX_MESSAGES:
+            self.flush()
+        index = len(self._lengths)
+        offset = index * self.slot_size
+        for buf, n in zip(buffers, sizes):
+            self._slab_view[offset:offset + n] = buf
+            offset += n
+        self._lengths.append(offset - index * self.slot_size)
+        for addr in addrs:
+            self._dests.append((index, addr))
+
+    def _send_now(self, buffers, addrs):
+        """Send an oversized packet unbatched, keeping it in order with the queue"""
+        self.flush()
+        packet = b''.join(buffers)
+        for addr in addrs:
+            self.sock.sendto(packet, addr)
+            self.syscalls += 1
+        self.datagrams += len(addrs)
+
+    def flush(self):
+        """Send everything queued; returns the number of datagrams sent"""
+        if not self._dests:
+            self._lengths.clear()
+            return 0
+        try:
+            if self.gso:
+                sent = set()
+                self._flush_gso(sent)
+            elif self.mmsg:
+                self._flush_mmsg()
+            else:
+                self._flush_loop()
+        except OSError as e:
+            if self.gso and e.errno in (errno.EIO, errno.EINVAL, errno.ENOPROTOOPT):
+                self.gso = False  # Device or kernel refused offload; stop trying
+                # Runs that went out before the failure must not go out again
+                self.datagrams += len(sent)
+                self._dests = [d for k, d in enumerate(self._dests) if k not in sent]
+                return len(sent) + self.flush()
+            raise
+        sent = len(self._dests)
+        self.datagrams += sent
+        self._lengths.clear()
+        self._dests.clear()
+        return sent
+
+    def _packet(self, index):
+        offset = index * self.slot_size
+        return self._slab_view[offset:offset + self._lengths[index]]
+
+    def _flush_loop(self):
+        for index, addr in self._dests:
+            self.sock.sendto(self._packet(index), addr)
+            self.syscalls += 1
+
+    def _flush_gso(self, sent):
+        """GSO send; adds the positions in _dests that went out to `sent`"""
+        destinations = {}
+        for k, (i, addr) in enumerate(self._dests):
+            destinations.setdefault(addr, []).append((k, i))
+        # Runs of equal-sized packets per destination; only the last may be shorter
+        for addr, entries in destinations.items():
+            run = []
+            run_bytes = 0
+            for k, i in entries:
+                size = self._lengths[i]
+                if run:
+                    segment = self._lengths[run[0][1]]
+                    if (size > segment or self._lengths[run[-1][1]] < segment
+                            or len(run) == GSO_MAX_SEGMENTS or run_bytes + size > GSO_MAX_BYTES):
+                        self._send_run(run, addr, sent)
+                        run = []
+                        run_bytes = 0
+                run.append((k, i))
+                run_bytes += size
+            if run:
+                self._send_run(run, addr, sent)
+
+    def _send_run(self, run, addr, sent):
+        buffers = [self._packet(i) for _, i in run]
+        if len(run) == 1:
+            self.sock.sendto(buffers[0], addr)
+        else:
+            segment = struct.pack('H', self._lengths[run[0][1]])
+            self.sock.sendmsg(buffers, [(socket.SOL_UDP, UDP_SEGMENT, segment)], 0, addr)
+        self.syscalls += 1
+        sent.update(k for k, _ in run)
+
+    def _sockaddr(self, addr):
+        raw = self._sockaddrs.get(addr)
+        if raw is None:
+            ip = socket.gethostbyname(addr[0])
+            raw = _sockaddr_in(socket.AF_INET, socket.htons(addr[1]),
+                               (ctypes.c_uint8 * 4)(*socket.inet_aton(ip)))
+            self._sockaddrs[addr] = raw
+        return raw
+
+    def _flush_mmsg(self):
+        for index, length in enumerate(self._lengths):
+            self._iov[index].iov_base = self._slab_base + index * self.slot_size
+            self._iov[index].iov_len = length
+        iov_base = ctypes.addressof(self._iov)
+        iov_size = ctypes.sizeof(_iovec)
+        names_base = ctypes.addressof(self._names)
+        name_size = ctypes.sizeof(_sockaddr_in)
+        for k, (index, addr) in enumerate(self._dests):
+            self._names[k] = self._sockaddr(addr)
+            hdr = self._msgs[k].msg_hdr
+            hdr.msg_name = names_base + k * name_size
+            hdr.msg_namelen = name_size
+            hdr.msg_iov = iov_base + index * iov_size
+            hdr.msg_iovlen = 1
+
+        total = len(self._dests)
+        done = 0
+        fd = self.sock.fileno()
+        msgs = ctypes.addressof(self._msgs)
+        msg_size = ctypes.sizeof(_mmsghdr)
+        while done < total:
+            n = _libc.sendmmsg(fd, msgs + done * msg_size, total - done, 0)
+            self.syscalls += 1
+            if n < 0:
+                err = ctypes.get_errno()
+                if err == errno.EINTR:
+                    continue
+                raise OSError(err, f"sendmmsg: {errno.errorcode.get(err, err)}")
+            done += n
+
+
+class BatchReceiver:
+    """Receives up to a batch of datagrams per syscall into a PacketSlab.
+
+    Uses recvmmsg() on Linux and a non-blocking recvfrom_into() drain loop
+    elsewhere. Either way the call blocks only until the first datagram.
+    A datagram larger than a slot comes back with None for its payload.
+    """
+
+    def __init__(self, sock, slab, batch_size=BATCH_SIZE):
+        if batch_size >= slab.slots:
+            raise ValueError("Batch must be smaller than the slab, or it would overwrite itself")
+        self.sock = sock
+        self.slab = slab
+        self.batch_size = batch_size
+        self.mmsg = _libc is not None
+        self.syscalls = 0
+        self.datagrams = 0
+        self._addrs = {}
+        # One message header per slot, plus a batch's worth wrapping back to
+        # the start, so any run of slots is a contiguous header array and a
+        # receive needs no per-message setup
+        count = slab.slots + batch_size
+        self._iov = (_iovec * count)()
+        self._names = (_sockaddr_in * count)()
+        self._msgs = (_mmsghdr * count)()
+        self._msgs_base = ctypes.addressof(self._msgs)
+        self._msg_stride = ctypes.sizeof(_mmsghdr)
+        # Flat views for reading results without building ctypes objects
+        self._lengths = memoryview(self._msgs).cast('B').cast('I')
+        self._length_index = _mmsghdr.msg_len.offset // 4
+        self._flags_index = (_mmsghdr.msg_hdr.offset + _msghdr.msg_flags.offset) // 4
+        self._name_keys = memoryview(self._names).cast('B').cast('Q')
+        slab_base = slab.address()
+        iov_base = ctypes.addressof(self._iov)
+        names_base = ctypes.addressof(self._names)
+        for k in range(count):
+            hdr = self._msgs[k].msg_hdr
+            hdr.msg_name = names_base + k * ctypes.sizeof(_sockaddr_in)
+            hdr.msg_namelen = ctypes.sizeof(_sockaddr_in)
+            hdr.msg_iov = iov_base + k * ctypes.sizeof(_iovec)
+            hdr.msg_iovlen = 1
+            self._iov[k].iov_base = slab_base + (k % slab.slots) * slab.slot_size
+            self._iov[k].iov_len = slab.slot_size
+
+    @property
+    def mode(self):
+        return 'recvmmsg' if self.mmsg else 'recvfrom_into'
+
+    def _addr(self, index):
+        # Family, port and address share the first 8 bytes of the sockaddr_in
+        key = self._name_keys[index * 2]
+        addr = self._addrs.get(key)
+        if addr is None:
+            name = self._names[index]
+            addr = (socket.inet_ntoa(bytes(name.sin_addr)), socket.ntohs(name.sin_port))
+            self._addrs[key] = addr
+        return addr
+
+    def recv(self, timeout=None):
+        """Wait up to timeout for traffic; returns a list of (memoryview, addr)"""
+        readable, _, _ = select.select([self.sock], [], [], timeout)
+        if not readable:
+            return []
+        if self.mmsg:
+            return self._recv_mmsg()
+        return self._recv_loop()
+
+    def _recv_loop(self):
+        packets = []
+        flags = getattr(socket, 'MSG_DONTWAIT', 0)
+        while len(packets) < self.batch_size:
+            slot = self.slab.next_slot()
+            try:
+                n, addr, truncated = recv_into(self.sock, slot, flags)
+            except (BlockingIOError, socket.timeout):
+                break
+            self.syscalls += 1
+            packets.append((None if truncated else slot[:n], addr))
+        self.datagrams += len(packets)
+        return packets
+
+    def _recv_mmsg(self):
+        start = self.slab.position
+        n = _libc.recvmmsg(self.sock.fileno(), self._msgs_base + start * self._msg_stride,
+                           self.batch_size, socket.MSG_DONTWAIT | MSG_WAITFORONE, None)
+        self.syscalls += 1
+        if n < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EINTR):
+                n = 0
+            else:
+                raise OSError(err, f"recvmmsg: {errno.errorcode.get(err, err)}")
+        self.slab.advance(n)  # Only claim the slots that were filled
+        stride = self._msg_stride // 4
+        lengths, length_index, slots = self._lengths, self._length_index, self.slab.slots
+        packets = [(self.slab.view((start + k) % slots)[:lengths[(start + k) * stride + length_index]],
+                    self._addr(start + k))
+                   for k in range(n)]
+        flags_index = self._flags_index
+        for k in range(n):
+            if lengths[(start + k) * stride + flags_index] & MSG_TRUNC:
+                packets[k] = (None, packets[k][1])
+        self.datagrams += n
+        return packets